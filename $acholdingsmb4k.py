@@ -1,5 +1,8 @@
+import os
 import pygame
 import sys
+import time
+from collections import OrderedDict, deque
 
 # ============================================================================
 # SUPER MARIO BROS. (NES) - FULL 1-1 → 8-4 • SINGLE FILE • PC ENGINE STYLE GRAPHICS
@@ -9,6 +12,15 @@ import sys
 SCREEN_WIDTH = 800
 SCREEN_HEIGHT = 480
 FPS = 60
+RENDER_FPS = 60      # draw rate cap; the simulation always steps at FPS
+FRAME_TIME = 1 / FPS
+MAX_FRAME_SKIP = 5   # simulation steps per drawn frame before the game slows down
+IDLE_FPS = 20        # loop rate on the still TITLE/GAMEOVER/WIN screens
+# Frame profiler: F3 toggles the overlay, F4 the per-frame CSV log
+PROFILE_SECTIONS = ("input", "sim", "mario", "enemies", "camera", "scenery", "tiles", "entities",
+                    "hud", "profiler", "flip", "wait")
+PROFILE_WINDOW = 120  # frames behind the overlay's averages, p99 and graph
+PROFILE_LOG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "frame_profile.csv")
 TILE_SIZE = 32
 GRAVITY = 0.8
 JUMP_POWER = -15
@@ -106,6 +118,109 @@ class Koopa(pygame.sprite.Sprite):
     def update(self, tiles):
         self.rect.x += int(self.vel_x)
 
+class FrameProfiler:
+    """Wall-clock milliseconds spent in each section of a frame.
+
+    lap(section) charges the time since the previous lap to that section and
+    end_frame() closes the frame. The last PROFILE_WINDOW frames feed the F3
+    overlay; while the F4 log is open every frame is also written as a CSV row.
+    """
+    def __init__(self):
+        self.overlay = False
+        self.log = None
+        self.log_error = None  # OSError from the last failed attempt to open the log
+        self.frame = 0
+        self.history = deque(maxlen=PROFILE_WINDOW)
+        self.current = dict.fromkeys(PROFILE_SECTIONS, 0.0)
+        self.mark = time.perf_counter()
+        self.font = None
+        self.panel = None
+        self.rows = []
+
+    def lap(self, section):
+        now = time.perf_counter()
+        self.current[section] += (now - self.mark) * 1000
+        self.mark = now
+
+    def end_frame(self):
+        if self.overlay or self.log:
+            times = [self.current[section] for section in PROFILE_SECTIONS]
+            self.history.append(times)
+            if self.log:
+                self.log.write(f"{self.frame}," + ",".join(f"{ms:.3f}" for ms in times) + f",{sum(times):.3f}\n")
+        self.frame += 1
+        self.current = dict.fromkeys(PROFILE_SECTIONS, 0.0)
+
+    def toggle_log(self, path=PROFILE_LOG_PATH):
+        """Start or stop the per-frame CSV log; returns whether it is now open.
+
+        A log that can't be opened leaves its OSError in log_error for the
+        caller and the overlay instead of raising out of the event loop.
+        """
+        self.log_error = None
+        if self.log:
+            self.log.close()
+            self.log = None
+        else:
+            try:
+                self.log = open(path, "w")
+            except OSError as error:
+                self.log_error = error
+                return False
+            self.log.write("frame," + ",".join(PROFILE_SECTIONS) + ",total\n")
+        return self.log is not None
+
+    def draw(self, screen):
+        """Rolling average and p99 per section, plus a graph of recent frame times."""
+        if not self.overlay or not self.history: return
+        if self.panel is None:
+            self.font = pygame.font.SysFont("monospace", 13)
+            self.panel = pygame.Surface((250, 16 * (len(PROFILE_SECTIONS) + 3) + 70))
+            self.panel.set_alpha(200)
+        panel = self.panel
+        panel.fill((0, 0, 0))
+        if self.frame % 10 == 0 or not self.rows:
+            # The statistics are re-rendered a few times a second, not every frame
+            count = len(self.history)
+            totals = sorted(map(sum, self.history))
+            rows = [f"{'ms':<10}{'avg':>7}{'p99':>7}"]
+            for section, times in zip(PROFILE_SECTIONS, zip(*self.history)):
+                ordered = sorted(times)
+                rows.append(f"{section:<10}{sum(ordered) / count:7.2f}{ordered[int(0.99 * (count - 1))]:7.2f}")
+            rows.append(f"{'frame':<10}{sum(totals) / count:7.2f}{totals[int(0.99 * (count - 1))]:7.2f}")
+            if self.log: rows.append("logging to " + os.path.basename(self.log.name))
+            elif self.log_error: rows.append("log failed: " + (self.log_error.strerror or str(self.log_error)))
+            self.rows = [self.font.render(row, True, (255, 255, 255)) for row in rows]
+        for i, row in enumerate(self.rows):
+            panel.blit(row, (6, 4 + 16 * i))
+        # One bar per frame; the yellow line is the 1/FPS budget at a third of the height
+        budget = 1000 / FPS
+        base = panel.get_height() - 6
+        for i, times in enumerate(self.history):
+            total = sum(times)
+            height = min(60, round(total * 20 / budget))
+            color = (0, 200, 0) if total <= budget * 1.05 else (220, 40, 40)
+            pygame.draw.line(panel, color, (6 + 2 * i, base), (6 + 2 * i, base - height))
+        pygame.draw.line(panel, (255, 255, 0), (6, base - 20), (6 + 2 * PROFILE_WINDOW, base - 20))
+        screen.blit(panel, (SCREEN_WIDTH - panel.get_width() - 10, 80))
+
+class TextCache:
+    """LRU cache of rendered text Surfaces keyed by (font, text, color)."""
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self.surfaces = OrderedDict()
+
+    def render(self, font, text, color):
+        key = (font, text, color)
+        surface = self.surfaces.get(key)
+        if surface is None:
+            surface = self.surfaces[key] = font.render(text, True, color)
+            if len(self.surfaces) > self.maxsize:
+                self.surfaces.popitem(last=False)
+        else:
+            self.surfaces.move_to_end(key)
+        return surface
+
 class Game:
     def __init__(self):
         pygame.init()
@@ -113,6 +228,8 @@ class Game:
         pygame.display.set_caption("Cat's AC! Smb 1.0 – PC Engine Style")
         self.clock = pygame.time.Clock()
         self.font = pygame.font.Font(None, 36)
+        self.text = TextCache()
+        self.profiler = FrameProfiler()
         self.world = 1
         self.level = 1
         self.lives = 3
@@ -120,6 +237,7 @@ class Game:
         self.coins = 0
         self.time = 400
         self.state = "TITLE"
+        self.shown = None  # the still screen currently on display, if any
         self.reset_level()
 
     def load_level(self, world, level):
@@ -262,42 +380,112 @@ class Game:
         pygame.draw.rect(self.screen, (40, 100, 40), (kx + 6, ky + 24, 6, 6))
         pygame.draw.rect(self.screen, (40, 100, 40), (kx + 14, ky + 24, 6, 6))
 
+    def step(self, keys):
+        """Advance the PLAY simulation one frame with the given key state."""
+        profiler = self.profiler
+        profiler.lap("sim")
+        self.mario.update(self.tiles, keys)
+        profiler.lap("mario")
+        self.camera.update(self.mario)
+        profiler.lap("camera")
+        for e in list(self.enemies):
+            e.update(self.tiles)
+            if pygame.sprite.collide_rect(self.mario, e):
+                self.lives -= 1
+                if self.lives <= 0: self.state = "GAMEOVER"
+                else: self.reset_level()
+        profiler.lap("enemies")
+        self.time = max(0, self.time - FRAME_TIME)
+        if self.time <= 0: self.state = "GAMEOVER"
+        if self.mario.rect.right > 198 * TILE_SIZE:
+            self.level += 1
+            if self.level > 4:
+                self.level = 1
+                self.world += 1
+            if self.world > 8:
+                self.state = "WIN"
+            else:
+                self.reset_level()
+                self.time = 400
+
+    def motion_snapshot(self):
+        """Where everything that moves is, taken before each step for draw_interpolated()."""
+        rects = [self.mario.rect] + [e.rect for e in self.enemies]
+        return self.camera, self.camera.offset_x, [(rect, rect.x, rect.y) for rect in rects]
+
+    def draw_interpolated(self, previous, alpha):
+        """draw() with movers placed alpha of the way from their previous to their current spot."""
+        camera, offset_x, moved = previous
+        current = [(rect, rect.x, rect.y) for rect, _, _ in moved]
+        for rect, x, y in moved:
+            rect.topleft = (round(x + (rect.x - x) * alpha), round(y + (rect.y - y) * alpha))
+        offset_now = camera.offset_x
+        camera.offset_x = round(offset_x + (offset_now - offset_x) * alpha)
+        try:
+            self.draw()
+        finally:
+            for rect, x, y in current:
+                rect.topleft = (x, y)
+            camera.offset_x = offset_now
+
     def run(self):
+        # Fixed FPS simulation: each drawn frame runs however many steps real time
+        # calls for (at most MAX_FRAME_SKIP), then draws between the last two.
+        lag = 0.0
+        previous = self.motion_snapshot()
+        fps = RENDER_FPS
+        profiler = self.profiler
         while True:
+            lag += min(self.clock.tick(fps) / 1000, FRAME_TIME * MAX_FRAME_SKIP)
+            profiler.lap("wait")
+            profiler.end_frame()
             keys = pygame.key.get_pressed()
             for event in pygame.event.get():
-                if event.type == pygame.QUIT: sys.exit()
+                if event.type == pygame.QUIT:
+                    if profiler.log: profiler.toggle_log()
+                    sys.exit()
+                if event.type == pygame.WINDOWEXPOSED: self.shown = None
+                if event.type == pygame.KEYDOWN and event.key == pygame.K_F3:
+                    profiler.overlay = not profiler.overlay
+                if event.type == pygame.KEYDOWN and event.key == pygame.K_F4:
+                    if profiler.toggle_log():
+                        print(f"Frame log writing to {PROFILE_LOG_PATH}")
+                    else:
+                        print(f"Frame log {'not opened: ' + str(profiler.log_error) if profiler.log_error else 'closed'}")
             if self.state == "TITLE":
                 if keys[pygame.K_RETURN]: self.state = "PLAY"
-            elif self.state == "PLAY":
-                self.mario.update(self.tiles, keys)
-                self.camera.update(self.mario)
-                for e in list(self.enemies):
-                    e.update(self.tiles)
-                    if pygame.sprite.collide_rect(self.mario, e):
-                        self.lives -= 1
-                        if self.lives <= 0: self.state = "GAMEOVER"
-                        else: self.reset_level()
-                self.time = max(0, self.time - 1 / 60)
-                if self.time <= 0: self.state = "GAMEOVER"
-                if self.mario.rect.right > 198 * TILE_SIZE:
-                    self.level += 1
-                    if self.level > 4:
-                        self.level = 1
-                        self.world += 1
-                    if self.world > 8:
-                        self.state = "WIN"
-                    else:
-                        self.reset_level()
-                        self.time = 400
-            self.draw()
-            pygame.display.flip()
-            self.clock.tick(FPS)
+            profiler.lap("input")
+            steps = 0
+            while self.state == "PLAY" and lag >= FRAME_TIME and steps < MAX_FRAME_SKIP:
+                previous = self.motion_snapshot()
+                self.step(pygame.key.get_pressed())
+                lag -= FRAME_TIME
+                steps += 1
+            profiler.lap("sim")
+            if self.state == "PLAY":
+                self.shown = None
+                self.draw_interpolated(previous, lag / FRAME_TIME)
+                profiler.draw(self.screen)
+                profiler.lap("profiler")
+                pygame.display.flip()
+                fps = RENDER_FPS
+            else:
+                # Nothing moves outside PLAY: draw the screen once, then idle
+                lag = 0.0
+                if self.shown != self.state:
+                    self.shown = self.state
+                    self.draw()
+                    pygame.display.flip()
+                fps = IDLE_FPS
+            profiler.lap("flip")
 
     def draw(self):
+        profiler = self.profiler
         self.screen.fill(SKY_BLUE)
+        profiler.lap("scenery")
         for t in self.tiles:
             self.draw_tile(t)
+        profiler.lap("tiles")
         # Mario
         mx = self.mario.rect.x - self.camera.offset_x
         my = self.mario.rect.y
@@ -310,20 +498,22 @@ class Game:
                 self.draw_goomba(ex, ey)
             else:
                 self.draw_koopa(ex, ey)
+        profiler.lap("entities")
         # HUD
-        hud = self.font.render(f"SCORE {self.score:06d}  COINS {self.coins}  TIME {int(self.time)}  WORLD {self.world}-{self.level}", True, WHITE)
+        hud = self.text.render(self.font, f"SCORE {self.score:06d}  COINS {self.coins}  TIME {int(self.time)}  WORLD {self.world}-{self.level}", WHITE)
         self.screen.blit(hud, (20, 10))
         if self.state == "TITLE":
-            title = self.font.render("CAT'S AC! SMB 1.0", True, WHITE)
+            title = self.text.render(self.font, "CAT'S AC! SMB 1.0", WHITE)
             self.screen.blit(title, (SCREEN_WIDTH//2 - 140, 180))
-            start = self.font.render("PRESS ENTER TO START – PC ENGINE GRAPHICS", True, WHITE)
+            start = self.text.render(self.font, "PRESS ENTER TO START – PC ENGINE GRAPHICS", WHITE)
             self.screen.blit(start, (SCREEN_WIDTH//2 - 220, 260))
         elif self.state == "GAMEOVER":
-            go = self.font.render("GAME OVER", True, (232, 72, 72))
+            go = self.text.render(self.font, "GAME OVER", (232, 72, 72))
             self.screen.blit(go, (SCREEN_WIDTH//2 - 80, 200))
         elif self.state == "WIN":
-            win = self.font.render("THANK YOU MARIO! BUT OUR PRINCESS IS IN ANOTHER CASTLE!", True, WHITE)
+            win = self.text.render(self.font, "THANK YOU MARIO! BUT OUR PRINCESS IS IN ANOTHER CASTLE!", WHITE)
             self.screen.blit(win, (20, 200))
+        profiler.lap("hud")
 
 if __name__ == "__main__":
     Game().run()
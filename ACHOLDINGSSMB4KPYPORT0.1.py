@@ -1,6 +1,10 @@
+import os
 import pygame
 import sys
+import time
 import random
+from array import array
+from collections import OrderedDict, deque
 
 # ============================================================================
 # SUPER MARIO BROS. (NES) - FULL 1-1 → 8-4 • SINGLE FILE • NO EXTERNAL FILES
@@ -10,6 +14,15 @@ import random
 SCREEN_WIDTH = 800
 SCREEN_HEIGHT = 480
 FPS = 60
+RENDER_FPS = 60      # draw rate cap; the simulation always steps at FPS
+FRAME_TIME = 1 / FPS
+MAX_FRAME_SKIP = 5   # simulation steps per drawn frame before the game slows down
+IDLE_FPS = 20        # loop rate on the still TITLE/GAMEOVER/WIN screens
+# Frame profiler: F3 toggles the overlay, F4 the per-frame CSV log
+PROFILE_SECTIONS = ("input", "sim", "mario", "enemies", "camera", "scenery", "tiles", "entities",
+                    "hud", "profiler", "flip", "wait")
+PROFILE_WINDOW = 120  # frames behind the overlay's averages, p99 and graph
+PROFILE_LOG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "frame_profile.csv")
 TILE_SIZE = 32
 GRAVITY = 0.8
 JUMP_POWER = -15
@@ -48,27 +61,47 @@ class Camera:
         target = mario.rect.centerx - SCREEN_WIDTH // 2
         self.offset_x = max(0, min(target, self.level_width - SCREEN_WIDTH))
 
-class Tile(pygame.sprite.Sprite):
-    def __init__(self, x, y, ttype):
-        super().__init__()
-        self.image = pygame.Surface((TILE_SIZE, TILE_SIZE))
-        colors = {TILE_GROUND: GROUND_BROWN, TILE_BRICK: BRICK_BROWN, TILE_BLOCK: BLOCK_GOLD,
-                  TILE_PIPE_TL: PIPE_GREEN, TILE_PIPE_TR: PIPE_GREEN,
-                  TILE_PIPE_BL: PIPE_GREEN, TILE_PIPE_BR: PIPE_GREEN,
-                  TILE_CASTLE: (140, 80, 40), TILE_FLAGPOLE: (220, 220, 220),
-                  TILE_FLAG_TOP: (255, 215, 0)}
-        self.image.fill(colors.get(ttype, BLACK))
-        self.rect = self.image.get_rect(topleft=(x, y))
-        self.type = ttype
+TILE_COLORS = {TILE_GROUND: GROUND_BROWN, TILE_BRICK: BRICK_BROWN, TILE_BLOCK: BLOCK_GOLD,
+               TILE_PIPE_TL: PIPE_GREEN, TILE_PIPE_TR: PIPE_GREEN,
+               TILE_PIPE_BL: PIPE_GREEN, TILE_PIPE_BR: PIPE_GREEN,
+               TILE_CASTLE: (140, 80, 40), TILE_FLAGPOLE: (220, 220, 220),
+               TILE_FLAG_TOP: (255, 215, 0)}
+
+class TileMap:
+    """Level tiles as one flat byte grid; the authoritative level representation."""
+    def __init__(self, rows):
+        self.height = len(rows)
+        self.width = len(rows[0])
+        self.cells = array('B')
+        for row in rows:
+            self.cells.extend(row)
+    def get(self, tx, ty):
+        if 0 <= tx < self.width and 0 <= ty < self.height:
+            return self.cells[ty * self.width + tx]
+        return TILE_EMPTY
+    def hits(self, rect):
+        # Row-major like the old sprite group, so collision order is unchanged
+        x0 = max(0, rect.left // TILE_SIZE)
+        x1 = min(self.width - 1, (rect.right - 1) // TILE_SIZE)
+        y0 = max(0, rect.top // TILE_SIZE)
+        y1 = min(self.height - 1, (rect.bottom - 1) // TILE_SIZE)
+        found = []
+        for ty in range(y0, y1 + 1):
+            base = ty * self.width
+            for tx in range(x0, x1 + 1):
+                if self.cells[base + tx] != TILE_EMPTY:
+                    found.append(pygame.Rect(tx * TILE_SIZE, ty * TILE_SIZE, TILE_SIZE, TILE_SIZE))
+        return found
 
 class Mario(pygame.sprite.Sprite):
     def __init__(self, x, y):
         super().__init__()
         self.rect = pygame.Rect(x, y, 26, 36)
         self.vel_x = self.vel_y = 0
+        self.sub_x = self.sub_y = 0.0  # sub-pixel motion not yet applied to rect
         self.on_ground = False
         self.facing_right = True
-    def update(self, tiles, keys):
+    def update(self, tilemap, keys):
         if keys[pygame.K_RIGHT]:
             self.vel_x = min(self.vel_x + ACCEL, RUN_SPEED if keys[pygame.K_LSHIFT] else MOVE_SPEED)
             self.facing_right = True
@@ -81,17 +114,24 @@ class Mario(pygame.sprite.Sprite):
             self.vel_y = JUMP_POWER
             self.on_ground = False
         self.vel_y += GRAVITY
-        self.rect.x += int(self.vel_x)
-        self.collide(self.vel_x, 0, tiles)
-        self.rect.y += int(self.vel_y)
-        self.on_ground = self.collide(0, self.vel_y, tiles)
-    def collide(self, vx, vy, tiles):
-        hits = pygame.sprite.spritecollide(self, tiles, False)
-        for t in hits:
-            if vx > 0: self.rect.right = t.rect.left
-            elif vx < 0: self.rect.left = t.rect.right
-            if vy > 0: self.rect.bottom = t.rect.top; self.vel_y = 0; return True
-            if vy < 0: self.rect.top = t.rect.bottom; self.vel_y = 0
+        self.collide(self.vel_x, 0, tilemap)
+        self.on_ground = self.collide(0, self.vel_y, tilemap)
+    def collide(self, vx, vy, tilemap):
+        # Move one axis, keeping the fraction int() used to drop, then stop at
+        # the nearest tile anywhere on the swept path so nothing is tunnelled
+        start = self.rect.copy()
+        self.sub_x += vx
+        self.sub_y += vy
+        dx, dy = int(self.sub_x), int(self.sub_y)
+        self.sub_x -= dx
+        self.sub_y -= dy
+        self.rect.move_ip(dx, dy)
+        hits = tilemap.hits(start.union(self.rect))
+        if not hits: return False
+        if vx > 0: self.rect.right = min(t.left for t in hits); self.sub_x = 0.0
+        elif vx < 0: self.rect.left = max(t.right for t in hits); self.sub_x = 0.0
+        if vy > 0: self.rect.bottom = min(t.top for t in hits); self.vel_y = 0; self.sub_y = 0.0; return True
+        if vy < 0: self.rect.top = max(t.bottom for t in hits); self.vel_y = 0; self.sub_y = 0.0
         return False
 
 class Goomba(pygame.sprite.Sprite):
@@ -99,7 +139,7 @@ class Goomba(pygame.sprite.Sprite):
         super().__init__()
         self.rect = pygame.Rect(x, y, 26, 26)
         self.vel_x = -1.2
-    def update(self, tiles):
+    def update(self, tilemap):
         self.rect.x += int(self.vel_x)
 
 class Koopa(pygame.sprite.Sprite):
@@ -107,9 +147,112 @@ class Koopa(pygame.sprite.Sprite):
         super().__init__()
         self.rect = pygame.Rect(x, y, 26, 30)
         self.vel_x = -1.0
-    def update(self, tiles):
+    def update(self, tilemap):
         self.rect.x += int(self.vel_x)
 
+class FrameProfiler:
+    """Wall-clock milliseconds spent in each section of a frame.
+
+    lap(section) charges the time since the previous lap to that section and
+    end_frame() closes the frame. The last PROFILE_WINDOW frames feed the F3
+    overlay; while the F4 log is open every frame is also written as a CSV row.
+    """
+    def __init__(self):
+        self.overlay = False
+        self.log = None
+        self.log_error = None  # OSError from the last failed attempt to open the log
+        self.frame = 0
+        self.history = deque(maxlen=PROFILE_WINDOW)
+        self.current = dict.fromkeys(PROFILE_SECTIONS, 0.0)
+        self.mark = time.perf_counter()
+        self.font = None
+        self.panel = None
+        self.rows = []
+
+    def lap(self, section):
+        now = time.perf_counter()
+        self.current[section] += (now - self.mark) * 1000
+        self.mark = now
+
+    def end_frame(self):
+        if self.overlay or self.log:
+            times = [self.current[section] for section in PROFILE_SECTIONS]
+            self.history.append(times)
+            if self.log:
+                self.log.write(f"{self.frame}," + ",".join(f"{ms:.3f}" for ms in times) + f",{sum(times):.3f}\n")
+        self.frame += 1
+        self.current = dict.fromkeys(PROFILE_SECTIONS, 0.0)
+
+    def toggle_log(self, path=PROFILE_LOG_PATH):
+        """Start or stop the per-frame CSV log; returns whether it is now open.
+
+        A log that can't be opened leaves its OSError in log_error for the
+        caller and the overlay instead of raising out of the event loop.
+        """
+        self.log_error = None
+        if self.log:
+            self.log.close()
+            self.log = None
+        else:
+            try:
+                self.log = open(path, "w")
+            except OSError as error:
+                self.log_error = error
+                return False
+            self.log.write("frame," + ",".join(PROFILE_SECTIONS) + ",total\n")
+        return self.log is not None
+
+    def draw(self, screen):
+        """Rolling average and p99 per section, plus a graph of recent frame times."""
+        if not self.overlay or not self.history: return
+        if self.panel is None:
+            self.font = pygame.font.SysFont("monospace", 13)
+            self.panel = pygame.Surface((250, 16 * (len(PROFILE_SECTIONS) + 3) + 70))
+            self.panel.set_alpha(200)
+        panel = self.panel
+        panel.fill((0, 0, 0))
+        if self.frame % 10 == 0 or not self.rows:
+            # The statistics are re-rendered a few times a second, not every frame
+            count = len(self.history)
+            totals = sorted(map(sum, self.history))
+            rows = [f"{'ms':<10}{'avg':>7}{'p99':>7}"]
+            for section, times in zip(PROFILE_SECTIONS, zip(*self.history)):
+                ordered = sorted(times)
+                rows.append(f"{section:<10}{sum(ordered) / count:7.2f}{ordered[int(0.99 * (count - 1))]:7.2f}")
+            rows.append(f"{'frame':<10}{sum(totals) / count:7.2f}{totals[int(0.99 * (count - 1))]:7.2f}")
+            if self.log: rows.append("logging to " + os.path.basename(self.log.name))
+            elif self.log_error: rows.append("log failed: " + (self.log_error.strerror or str(self.log_error)))
+            self.rows = [self.font.render(row, True, (255, 255, 255)) for row in rows]
+        for i, row in enumerate(self.rows):
+            panel.blit(row, (6, 4 + 16 * i))
+        # One bar per frame; the yellow line is the 1/FPS budget at a third of the height
+        budget = 1000 / FPS
+        base = panel.get_height() - 6
+        for i, times in enumerate(self.history):
+            total = sum(times)
+            height = min(60, round(total * 20 / budget))
+            color = (0, 200, 0) if total <= budget * 1.05 else (220, 40, 40)
+            pygame.draw.line(panel, color, (6 + 2 * i, base), (6 + 2 * i, base - height))
+        pygame.draw.line(panel, (255, 255, 0), (6, base - 20), (6 + 2 * PROFILE_WINDOW, base - 20))
+        screen.blit(panel, (SCREEN_WIDTH - panel.get_width() - 10, 80))
+
+class TextCache:
+    """LRU cache of rendered text Surfaces keyed by (font, text, color)."""
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self.surfaces = OrderedDict()
+
+    def render(self, font, text, color):
+        key = (font, text, color)
+        surface = self.surfaces.get(key)
+        if surface is None:
+            surface = self.surfaces[key] = font.render(text, True, color)
+            if len(self.surfaces) > self.maxsize:
+                self.surfaces.popitem(last=False)
+        else:
+            self.surfaces.move_to_end(key)
+        return surface
+
 class Game:
     def __init__(self):
         pygame.init()
@@ -117,6 +260,8 @@ class Game:
         pygame.display.set_caption("Cat's AC! Smb 1.0")
         self.clock = pygame.time.Clock()
         self.font = pygame.font.Font(None, 36)
+        self.text = TextCache()
+        self.profiler = FrameProfiler()
         self.world = 1
         self.level = 1
         self.lives = 3
@@ -124,6 +269,12 @@ class Game:
         self.coins = 0
         self.time = 400
         self.state = "TITLE"
+        self.shown = None  # the still screen currently on display, if any
+        self.tile_images = {}
+        for ttype in range(TILE_GROUND, TILE_CASTLE_DOOR + 1):
+            image = pygame.Surface((TILE_SIZE, TILE_SIZE))
+            image.fill(TILE_COLORS.get(ttype, BLACK))
+            self.tile_images[ttype] = image
         self.reset_level()
 
     def load_level(self, world, level):
@@ -192,56 +343,128 @@ class Game:
         return tiles, enemies
 
     def reset_level(self):
-        self.tiles = pygame.sprite.Group()
         self.enemies = pygame.sprite.Group()
         tile_data, enemy_data = self.load_level(self.world, self.level)
-        level_width = len(tile_data[0]) * TILE_SIZE
-        self.camera = Camera(level_width)
-        for y, row in enumerate(tile_data):
-            for x, ttype in enumerate(row):
-                if ttype != TILE_EMPTY:
-                    self.tiles.add(Tile(x * TILE_SIZE, y * TILE_SIZE, ttype))
+        self.tilemap = TileMap(tile_data)
+        self.camera = Camera(self.tilemap.width * TILE_SIZE)
         self.mario = Mario(80, 13 * TILE_SIZE - 40)
         for etype, ex, ey in enemy_data:
             if etype == 'goomba': self.enemies.add(Goomba(ex, ey))
             elif etype == 'koopa': self.enemies.add(Koopa(ex, ey))
 
+    def step(self, keys):
+        """Advance the PLAY simulation one frame with the given key state."""
+        profiler = self.profiler
+        profiler.lap("sim")
+        self.mario.update(self.tilemap, keys)
+        profiler.lap("mario")
+        self.camera.update(self.mario)
+        profiler.lap("camera")
+        for e in list(self.enemies):
+            e.update(self.tilemap)
+            if pygame.sprite.collide_rect(self.mario, e):
+                self.lives -= 1
+                if self.lives <= 0: self.state = "GAMEOVER"
+                else: self.reset_level()
+        profiler.lap("enemies")
+        self.time = max(0, self.time - FRAME_TIME)
+        if self.time <= 0: self.state = "GAMEOVER"
+        if self.mario.rect.right > 198 * TILE_SIZE:
+            self.level += 1
+            if self.level > 4:
+                self.level = 1
+                self.world += 1
+            if self.world > 8:
+                self.state = "WIN"
+            else:
+                self.reset_level()
+                self.time = 400
+
+    def motion_snapshot(self):
+        """Where everything that moves is, taken before each step for draw_interpolated()."""
+        rects = [self.mario.rect] + [e.rect for e in self.enemies]
+        return self.camera, self.camera.offset_x, [(rect, rect.x, rect.y) for rect in rects]
+
+    def draw_interpolated(self, previous, alpha):
+        """draw() with movers placed alpha of the way from their previous to their current spot."""
+        camera, offset_x, moved = previous
+        current = [(rect, rect.x, rect.y) for rect, _, _ in moved]
+        for rect, x, y in moved:
+            rect.topleft = (round(x + (rect.x - x) * alpha), round(y + (rect.y - y) * alpha))
+        offset_now = camera.offset_x
+        camera.offset_x = round(offset_x + (offset_now - offset_x) * alpha)
+        try:
+            self.draw()
+        finally:
+            for rect, x, y in current:
+                rect.topleft = (x, y)
+            camera.offset_x = offset_now
+
     def run(self):
+        # Fixed FPS simulation: each drawn frame runs however many steps real time
+        # calls for (at most MAX_FRAME_SKIP), then draws between the last two.
+        lag = 0.0
+        previous = self.motion_snapshot()
+        fps = RENDER_FPS
+        profiler = self.profiler
         while True:
+            lag += min(self.clock.tick(fps) / 1000, FRAME_TIME * MAX_FRAME_SKIP)
+            profiler.lap("wait")
+            profiler.end_frame()
             keys = pygame.key.get_pressed()
             for event in pygame.event.get():
-                if event.type == pygame.QUIT: sys.exit()
+                if event.type == pygame.QUIT:
+                    if profiler.log: profiler.toggle_log()
+                    sys.exit()
+                if event.type == pygame.WINDOWEXPOSED: self.shown = None
+                if event.type == pygame.KEYDOWN and event.key == pygame.K_F3:
+                    profiler.overlay = not profiler.overlay
+                if event.type == pygame.KEYDOWN and event.key == pygame.K_F4:
+                    if profiler.toggle_log():
+                        print(f"Frame log writing to {PROFILE_LOG_PATH}")
+                    else:
+                        print(f"Frame log {'not opened: ' + str(profiler.log_error) if profiler.log_error else 'closed'}")
             if self.state == "TITLE":
                 if keys[pygame.K_RETURN]: self.state = "PLAY"
-            elif self.state == "PLAY":
-                self.mario.update(self.tiles, keys)
-                self.camera.update(self.mario)
-                for e in list(self.enemies):
-                    e.update(self.tiles)
-                    if pygame.sprite.collide_rect(self.mario, e):
-                        self.lives -= 1
-                        if self.lives <= 0: self.state = "GAMEOVER"
-                        else: self.reset_level()
-                self.time = max(0, self.time - 1 / 60)
-                if self.time <= 0: self.state = "GAMEOVER"
-                if self.mario.rect.right > 198 * TILE_SIZE:
-                    self.level += 1
-                    if self.level > 4:
-                        self.level = 1
-                        self.world += 1
-                    if self.world > 8:
-                        self.state = "WIN"
-                    else:
-                        self.reset_level()
-                        self.time = 400
-            self.draw()
-            pygame.display.flip()
-            self.clock.tick(FPS)
+            profiler.lap("input")
+            steps = 0
+            while self.state == "PLAY" and lag >= FRAME_TIME and steps < MAX_FRAME_SKIP:
+                previous = self.motion_snapshot()
+                self.step(pygame.key.get_pressed())
+                lag -= FRAME_TIME
+                steps += 1
+            profiler.lap("sim")
+            if self.state == "PLAY":
+                self.shown = None
+                self.draw_interpolated(previous, lag / FRAME_TIME)
+                profiler.draw(self.screen)
+                profiler.lap("profiler")
+                pygame.display.flip()
+                fps = RENDER_FPS
+            else:
+                # Nothing moves outside PLAY: draw the screen once, then idle
+                lag = 0.0
+                if self.shown != self.state:
+                    self.shown = self.state
+                    self.draw()
+                    pygame.display.flip()
+                fps = IDLE_FPS
+            profiler.lap("flip")
 
     def draw(self):
+        profiler = self.profiler
         self.screen.fill(SKY_BLUE)
-        for t in self.tiles:
-            self.screen.blit(t.image, (t.rect.x - self.camera.offset_x, t.rect.y))
+        profiler.lap("scenery")
+        tilemap = self.tilemap
+        first = max(0, self.camera.offset_x // TILE_SIZE)
+        last = min(tilemap.width, (self.camera.offset_x + SCREEN_WIDTH) // TILE_SIZE + 1)
+        for ty in range(tilemap.height):
+            base = ty * tilemap.width
+            for tx in range(first, last):
+                ttype = tilemap.cells[base + tx]
+                if ttype != TILE_EMPTY:
+                    self.screen.blit(self.tile_images[ttype], (tx * TILE_SIZE - self.camera.offset_x, ty * TILE_SIZE))
+        profiler.lap("tiles")
         # Mario
         m_surf = pygame.Surface((26, 36))
         m_surf.fill(RED)
@@ -250,20 +473,22 @@ class Game:
         for e in self.enemies:
             col = (168, 80, 48) if isinstance(e, Goomba) else (72, 160, 72)
             pygame.draw.rect(self.screen, col, (e.rect.x - self.camera.offset_x, e.rect.y, e.rect.width, e.rect.height))
+        profiler.lap("entities")
         # HUD
-        hud = self.font.render(f"SCORE {self.score:06d}  COINS {self.coins}  TIME {int(self.time)}  WORLD {self.world}-{self.level}", True, WHITE)
+        hud = self.text.render(self.font, f"SCORE {self.score:06d}  COINS {self.coins}  TIME {int(self.time)}  WORLD {self.world}-{self.level}", WHITE)
         self.screen.blit(hud, (20, 10))
         if self.state == "TITLE":
-            title = self.font.render("CAT'S AC! SMB 1.0", True, WHITE)
+            title = self.text.render(self.font, "CAT'S AC! SMB 1.0", WHITE)
             self.screen.blit(title, (SCREEN_WIDTH//2 - 120, 200))
-            start = self.font.render("PRESS ENTER TO START", True, WHITE)
+            start = self.text.render(self.font, "PRESS ENTER TO START", WHITE)
             self.screen.blit(start, (SCREEN_WIDTH//2 - 140, 280))
         elif self.state == "GAMEOVER":
-            go = self.font.render("GAME OVER", True, RED)
+            go = self.text.render(self.font, "GAME OVER", RED)
             self.screen.blit(go, (SCREEN_WIDTH//2 - 80, 200))
         elif self.state == "WIN":
-            win = self.font.render("THANK YOU MARIO! BUT OUR PRINCESS IS IN ANOTHER CASTLE!", True, WHITE)
+            win = self.text.render(self.font, "THANK YOU MARIO! BUT OUR PRINCESS IS IN ANOTHER CASTLE!", WHITE)
             self.screen.blit(win, (50, 200))
+        profiler.lap("hud")
 
 if __name__ == "__main__":
     Game().run()
@@ -0,0 +1,313 @@
+import argparse
+import importlib.util
+import json
+import os
+import platform
+import time
+
+# ============================================================================
+#  Frame benchmark for all five game variants (headless, scripted input)
+#  python benchmark.py --frames 1200 --output bench.json [--compare old.json]
+# ============================================================================
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+import pygame
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+STRESS_COLUMNS = 10000
+
+class InputState(dict):
+    def __missing__(self, key):
+        return False
+
+def scripted_inputs(frame):
+    # Run right and hop, the same workload for every variant
+    return InputState({pygame.K_RIGHT: True, pygame.K_SPACE: frame % 50 < 20})
+
+def load_variant(filename):
+    name = "bench_" + "".join(c if c.isalnum() else "_" for c in filename[:-3])
+    spec = importlib.util.spec_from_file_location(name, os.path.join(HERE, filename))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def stress_layout(columns):
+    """(column, row from bottom, kind) cells and goomba columns for a long generated level."""
+    cells = []
+    goombas = []
+    for x in range(columns):
+        if x % 150 in (70, 71):
+            continue
+        cells.append((x, 0, "ground"))
+        cells.append((x, 1, "ground"))
+    for x in range(30, columns, 53):
+        cells.append((x, 2, "pipe"))
+        cells.append((x, 3, "pipe_top"))
+    for x in range(16, columns - 4, 31):
+        for i in range(4):
+            cells.append((x + i, 6, "block" if i == 1 else "brick"))
+    for x in range(120, columns - 8, 211):
+        for i in range(4):
+            for h in range(i + 1):
+                cells.append((x + i, 2 + h, "block"))
+    for x in range(24, columns, 20):
+        goombas.append(x)
+    return cells, goombas
+
+def percentiles(samples):
+    ordered = sorted(samples)
+    if not ordered:
+        return {}
+    def pick(q):
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+    return {
+        "mean": sum(ordered) / len(ordered),
+        "p50": pick(0.50),
+        "p90": pick(0.90),
+        "p99": pick(0.99),
+        "max": ordered[-1],
+    }
+
+# --- VARIANT ADAPTERS ---
+
+class SpriteVariant:
+    """smb4k.py / smb4k1.x.py / groksmb4k.py: Tile objects placed from the bottom of the screen."""
+    levels = ("1-1", "stress")
+    playing = "PLAYING"
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.module = load_variant(filename)
+
+    def new_game(self):
+        game = self.module.Game()
+        if hasattr(game, "state"):
+            game.state = self.playing
+        return game
+
+    def load(self, game, level):
+        game.reset()
+        if level == "stress":
+            self.build_stress(game)
+
+    def finished(self, game, level):
+        return game.game_over
+
+    def place(self, game, cells, goombas):
+        m = self.module
+        tiles = [m.Tile(x * m.TILE_SIZE, m.SCREEN_HEIGHT - (1 + row) * m.TILE_SIZE, kind) for x, row, kind in cells]
+        if isinstance(game.tiles, list):
+            game.tiles[:] = tiles
+        else:
+            game.tiles.empty()
+            game.tiles.add(tiles)
+        game.enemies.empty()
+        for x in goombas:
+            game.enemies.add(m.Goomba(x * m.TILE_SIZE, m.SCREEN_HEIGHT - m.TILE_SIZE * 5))
+
+    def add_scenery(self, game, columns):
+        m = self.module
+        scenery = []
+        for x in range(0, columns, 16):
+            scenery.append(m.Decoration(x * m.TILE_SIZE, 0, "hill", size=2))
+            scenery.append(m.Decoration((x + 11) * m.TILE_SIZE, 0, "bush", size=2))
+            scenery.append(m.Decoration((x + 8) * m.TILE_SIZE, 80, "cloud", size=2))
+        if hasattr(m, "SceneryLayer"):
+            game.scenery = m.SceneryLayer(scenery)
+        elif isinstance(game.scenery, list):
+            game.scenery = scenery
+        else:
+            game.scenery.empty()
+            game.scenery.add(scenery)
+
+class Smb4k(SpriteVariant):
+    def build_stress(self, game):
+        cells, goombas = stress_layout(STRESS_COLUMNS)
+        self.place(game, cells, goombas)
+        game.collision = self.module.CollisionMap(game.tiles)
+
+class Smb4k1x(SpriteVariant):
+    def build_stress(self, game):
+        cells, goombas = stress_layout(STRESS_COLUMNS)
+        self.place(game, cells, goombas)
+        game.dormant_enemies = sorted(game.enemies, key=lambda enemy: enemy.rect.x, reverse=True)
+        game.enemies.empty()
+        self.add_scenery(game, STRESS_COLUMNS)
+        game.tile_grid = self.module.TileGrid(game.tiles)
+        game.build_chunks()
+
+class Grok(SpriteVariant):
+    levels = ("1-1", "8-4", "stress")
+
+    def new_game(self):
+        game = self.module.Game(headless=True)
+        game.state = self.playing
+        return game
+
+    def load(self, game, level):
+        game.world, game.level = (8, 4) if level == "8-4" else (1, 1)
+        game.reset()
+        if level == "stress":
+            cells, goombas = stress_layout(STRESS_COLUMNS)
+            self.place(game, cells, goombas)
+            self.add_scenery(game, STRESS_COLUMNS)
+            game.tile_grid = self.module.TileGrid(game.tiles)
+            game.pack_enemies()
+
+class GridVariant:
+    """ACHOLDINGSSMB4KPYPORT0.1.py / $acholdingsmb4k.py: 14-row integer level grid."""
+    levels = ("1-1", "8-4", "stress")
+    kinds = {"ground": "TILE_GROUND", "brick": "TILE_BRICK", "block": "TILE_BLOCK",
+             "pipe": "TILE_PIPE_BL", "pipe_top": "TILE_PIPE_TL"}
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.module = load_variant(filename)
+
+    def new_game(self):
+        game = self.module.Game()
+        game.state = "PLAY"
+        return game
+
+    def load(self, game, level):
+        game.state = "PLAY"
+        game.lives = 3
+        game.time = 400
+        game.world, game.level = (8, 4) if level == "8-4" else (1, 1)
+        if level != "stress":
+            game.reset_level()
+            return
+        m = self.module
+        cells, goombas = stress_layout(STRESS_COLUMNS)
+        rows = [[m.TILE_EMPTY] * STRESS_COLUMNS for _ in range(14)]
+        for x, row, kind in cells:
+            rows[13 - row][x] = getattr(m, self.kinds[kind])
+        original = game.load_level
+        game.load_level = lambda world, level: (rows, [("goomba", x * m.TILE_SIZE, 384) for x in goombas])
+        try:
+            game.reset_level()
+        finally:
+            game.load_level = original
+
+    def finished(self, game, level):
+        if game.state != "PLAY":
+            return True
+        expected = (8, 4) if level == "8-4" else (1, 1)
+        return (game.world, game.level) != expected
+
+VARIANTS = {
+    "smb4k.py": Smb4k,
+    "smb4k1.x.py": Smb4k1x,
+    "groksmb4k.py": Grok,
+    "ACHOLDINGSSMB4KPYPORT0.1.py": GridVariant,
+    "$acholdingsmb4k.py": GridVariant,
+}
+
+def run_case(variant, level, frames):
+    game = variant.new_game()
+    load_ms, update_ms, render_ms = [], [], []
+    def load():
+        start = time.perf_counter()
+        variant.load(game, level)
+        load_ms.append((time.perf_counter() - start) * 1000)
+    load()
+    for frame in range(frames):
+        keys = scripted_inputs(frame)
+        t0 = time.perf_counter()
+        game.step(keys)
+        t1 = time.perf_counter()
+        game.draw()
+        t2 = time.perf_counter()
+        update_ms.append((t1 - t0) * 1000)
+        render_ms.append((t2 - t1) * 1000)
+        if variant.finished(game, level):
+            load()
+    return {
+        "variant": variant.filename,
+        "level": level,
+        "frames": frames,
+        "loads": len(load_ms),
+        "load_ms": percentiles(load_ms),
+        "update_ms": percentiles(update_ms),
+        "render_ms": percentiles(render_ms),
+    }
+
+def run_vector_env(num_envs, steps, workers):
+    """Environment steps per second of smb4k.py's VectorEnv under the scripted workload."""
+    env = load_variant("smb4k.py").VectorEnv(num_envs, workers=workers)
+    try:
+        env.reset()
+        start = time.perf_counter()
+        for frame in range(steps):
+            env.step([2 if frame % 50 < 20 else 1] * num_envs)
+        seconds = time.perf_counter() - start
+    finally:
+        env.close()
+    return {"num_envs": num_envs, "workers": workers, "steps": steps,
+            "seconds": seconds, "steps_per_second": num_envs * steps / seconds}
+
+def compare(results, baseline_path):
+    with open(baseline_path) as f:
+        baseline = {(r["variant"], r["level"]): r for r in json.load(f)["results"]}
+    print(f"\nvs {baseline_path}")
+    for r in results:
+        old = baseline.get((r["variant"], r["level"]))
+        if old is None:
+            continue
+        parts = []
+        for phase in ("update_ms", "render_ms", "load_ms"):
+            for stat in ("p50", "p99"):
+                before, after = old[phase].get(stat), r[phase].get(stat)
+                if before:
+                    parts.append(f"{phase[:-3]} {stat} {100 * (after - before) / before:+.0f}%")
+        print(f"{r['variant']:>28} {r['level']:>6}  " + "  ".join(parts))
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless frame benchmark for the game variants")
+    parser.add_argument("--frames", type=int, default=1200, help="frames per variant and level")
+    parser.add_argument("--variants", nargs="*", default=list(VARIANTS), help="files to benchmark")
+    parser.add_argument("--levels", nargs="*", default=["1-1", "8-4", "stress"])
+    parser.add_argument("--output", default="benchmark.json", help="where to write the JSON results")
+    parser.add_argument("--compare", help="previous JSON results to diff against")
+    parser.add_argument("--vector-envs", type=int, default=0, help="also time smb4k.py's VectorEnv with this many games")
+    parser.add_argument("--vector-workers", type=int, default=1, help="processes to shard the VectorEnv games across")
+    args = parser.parse_args()
+
+    results = []
+    for filename in args.variants:
+        variant = VARIANTS[filename](filename)
+        for level in variant.levels:
+            if level not in args.levels:
+                continue
+            result = run_case(variant, level, args.frames)
+            results.append(result)
+            u, r, l = result["update_ms"], result["render_ms"], result["load_ms"]
+            print(f"{filename:>28} {level:>6}  update p50 {u['p50']:.3f} p99 {u['p99']:.3f} ms"
+                  f"  render p50 {r['p50']:.3f} p99 {r['p99']:.3f} ms  load p50 {l['p50']:.1f} ms")
+    vector_env = None
+    if args.vector_envs:
+        vector_env = run_vector_env(args.vector_envs, args.frames, args.vector_workers)
+        print(f"{'VectorEnv':>28} {args.vector_envs:>3}x{args.vector_workers}"
+              f"  {vector_env['steps_per_second']:.0f} env steps/s")
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "pygame": pygame.version.ver,
+            "platform": platform.platform(),
+            "frames": args.frames,
+            "stress_columns": STRESS_COLUMNS,
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "results": results,
+        "vector_env": vector_env,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"wrote {args.output}")
+    if args.compare:
+        compare(results, args.compare)
+    pygame.quit()
+
+if __name__ == "__main__":
+    main()
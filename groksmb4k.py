@@ -1,5 +1,23 @@
-import pygame
+import argparse
+import bisect
+import json
+import mmap
+import multiprocessing
+import os
+import random
+import struct
 import sys
+import tempfile
+import threading
+import time
+import zlib
+from collections import OrderedDict, deque
+import pygame
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 # ============================================================================
 #  ULTRA Mario World v3 - SMW 60FPS + Debug Menu + Mario Maker Editor + HOTKEYS
@@ -9,6 +27,15 @@ import sys
 SCREEN_WIDTH = 800
 SCREEN_HEIGHT = 480
 FPS = 60
+RENDER_FPS = 60      # draw rate cap; the simulation always steps at FPS
+FRAME_TIME = 1 / FPS
+MAX_FRAME_SKIP = 5   # simulation steps per drawn frame before the game slows down
+IDLE_FPS = 20        # loop rate on menus, which only redraw what changed
+# Frame profiler: F3 toggles the overlay, F4 the per-frame CSV log
+PROFILE_SECTIONS = ("input", "sim", "mario", "enemies", "camera", "scenery", "tiles", "entities",
+                    "hud", "profiler", "flip", "wait")
+PROFILE_WINDOW = 120  # frames behind the overlay's averages, p99 and graph
+PROFILE_LOG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "frame_profile.csv")
 TILE_SIZE = 32
 
 # Physics
@@ -39,8 +66,213 @@ BLACK = (0, 0, 0)
 WHITE = (255, 255, 255)
 CREAM = (255, 204, 197)
 YELLOW = (255, 255, 0)
+COLORKEY = (255, 0, 255)
+DECORATION_REACH = 300  # decorations anchored this far left of the screen may still show
+SPRITE_PAD = 4
+MARIO_PALETTE = (MARIO_RED, MARIO_SKIN, MARIO_BROWN, MARIO_BLUE)
+GOOMBA_PALETTE = (GOOMBA_BODY, WHITE, BLACK)
+# Collision classes: SOLID blocks everything, PASSTHROUGH is scenery, touching
+# a TRIGGER starts the flag slide and a VICTORY tile ends the level
+SOLID, PASSTHROUGH, TRIGGER, VICTORY = range(4)
+TILE_COLLISION = {"ground": SOLID, "brick": SOLID, "block": SOLID, "pipe": SOLID, "pipe_top": SOLID,
+                  "flagpole": TRIGGER, "flag_top": PASSTHROUGH, "castle": PASSTHROUGH, "castle_door": VICTORY}
+
+# Level files: header, one tile-kind byte per grid cell (row-major), then
+# goomba pixel positions. FLAG_ZLIB compresses everything after the header.
+LEVEL_MAGIC = b"SMBL"
+LEVEL_VERSION = 1
+LEVEL_HEADER = struct.Struct("<4sBBhhHHH")  # magic, version, flags, x0, y0, width, height, enemies
+LEVEL_ENEMY = struct.Struct("<ii")
+LEVEL_FLAG_ZLIB = 1
+LEVEL_TILE_KINDS = (None, "ground", "brick", "block", "pipe", "pipe_top", "flagpole", "flag_top", "castle", "castle_door")
+EDITOR_LEVEL_PATH = "editor_level.smbl"
+# Compiled stages, one file per world when the disk cache is on (--level-cache):
+# header, then tile, decoration and spawn records. An entry is only used if its
+# version, the CRC of this file and the CRC of its records all match.
+LEVEL_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".level_cache")
+LEVEL_CACHE_MAGIC = b"SMBC"
+LEVEL_CACHE_VERSION = 2
+LEVEL_CACHE_HEADER = struct.Struct("<4sBIIIII")  # magic, version, source CRC, records CRC, tiles, decorations, spawns
+LEVEL_CACHE_TILE = struct.Struct("<iiB")  # x, y, index into LEVEL_TILE_KINDS
+LEVEL_CACHE_DECORATION = struct.Struct("<iiBB")  # x, y, index into LEVEL_SCENERY_KINDS, size
+LEVEL_SCENERY_KINDS = ("hill", "bush", "cloud")
+# Replay files: header, (frames, input mask) runs, then a state hash every hash_every frames
+REPLAY_MAGIC = b"SMBR"
+REPLAY_VERSION = 1
+REPLAY_HEADER = struct.Struct("<4sBBBHIII")  # magic, version, world, level, hash_every, frames, runs, hashes
+REPLAY_RUN = struct.Struct("<HB")
+REPLAY_HASH = struct.Struct("<I")
+REPLAY_HASH_EVERY = 60
+# Snapshots: header, Mario, then one record per goomba. Only what step()
+# changes is stored; the stage's tiles are not, so a snapshot only restores
+# into the stage it was taken on.
+SNAPSHOT_VERSION = 1
+SNAPSHOT_HEADER = struct.Struct("<BBBBiIHhHI")  # version, world, level, flags, camera x, score, coins, time, time_ticker, goombas
+SNAPSHOT_MARIO = struct.Struct("<iiddBBBH")  # x, y, vel_x, vel_y, state, flags, walk_frame, frame_timer
+SNAPSHOT_GOOMBA = struct.Struct("<iiidBBHH")  # x, y, vel_x, vel_y, alive, frame, frame_timer, dead_timer
+SNAPSHOT_FLAG_TRIGGERED, SNAPSHOT_GAME_OVER, SNAPSHOT_SWARM = 1, 2, 4
+# SNAPSHOT_GOOMBA as a NumPy record, so a GoombaSwarm packs in one go
+SNAPSHOT_GOOMBA_DTYPE = None if np is None else np.dtype([("x", "<i4"), ("y", "<i4"), ("vel_x", "<i4"), ("vel_y", "<f8"),
+                                                          ("alive", "u1"), ("frame", "u1"), ("frame_timer", "<u2"), ("dead_timer", "<u2")])
+MARIO_STATES = ("IDLE", "SLIDE", "AUTO_WALK", "DEAD", "VICTORY")
+# Rewind (hold BACKSPACE): one snapshot per frame for this long, within this many bytes
+REWIND_SECONDS = 30
+REWIND_MAX_BYTES = 2 * 1024 * 1024
+REWIND_KEYFRAME_EVERY = 30  # frames stored as deltas between full snapshots
+# Rollouts stop after the level timer could have run out
+ROLLOUT_MAX_FRAMES = 400 * FPS + 10 * FPS
+ROLLOUT_STALL_FRAMES = 10 * FPS  # ...once Mario has made no headway for this long, or left the level
+ROLLOUT_AGENTS = 8   # seeded random agents per stage in --verify-levels
+# Goomba groups at least this big are simulated as one NumPy GoombaSwarm
+SWARM_MIN_ENEMIES = 48
 TOOL_COLORS = {"ground": GROUND_BROWN, "brick": BRICK_BROWN, "block": BLOCK_GOLD, "pipe": PIPE_GREEN, "goomba": GOOMBA_BODY}
 
+class InputState(dict):
+    """Held keys, indexed like pygame.key.get_pressed(); unlisted keys read False."""
+    def __missing__(self, key):
+        return False
+
+def render_frame(paint):
+    """Paint one entity frame onto a padded, colorkeyed, display-format Surface."""
+    frame = pygame.Surface((TILE_SIZE + SPRITE_PAD * 2, TILE_SIZE + SPRITE_PAD * 2))
+    frame.fill(COLORKEY)
+    paint(frame, SPRITE_PAD, SPRITE_PAD)
+    frame.set_colorkey(COLORKEY)
+    return frame.convert()
+
+def scripted_inputs(frame):
+    # Headless driver: run right and hop every 50 frames
+    return InputState({pygame.K_RIGHT: True, pygame.K_SPACE: frame % 50 < 20})
+
+INPUT_KEYS = (pygame.K_LEFT, pygame.K_RIGHT, pygame.K_SPACE)
+
+def input_mask(keys):
+    """Pack the keys Mario reads into one bit each."""
+    mask = 0
+    for bit, key in enumerate(INPUT_KEYS):
+        if keys[key]: mask |= 1 << bit
+    return mask
+
+def mask_inputs(mask):
+    return InputState({key: True for bit, key in enumerate(INPUT_KEYS) if mask & (1 << bit)})
+
+class InputRecorder:
+    """Run-length encodes the per-frame input mask of one PLAYING session."""
+    def __init__(self, world, level, hash_every=REPLAY_HASH_EVERY):
+        self.world = world
+        self.level = level
+        self.hash_every = hash_every
+        self.frames = 0
+        self.runs = []  # [mask, frames]
+        self.hashes = []
+
+    def record(self, keys, game):
+        # Call after game.step(keys) so the hash covers the state those keys produced
+        mask = input_mask(keys)
+        if self.runs and self.runs[-1][0] == mask and self.runs[-1][1] < 0xFFFF:
+            self.runs[-1][1] += 1
+        else:
+            self.runs.append([mask, 1])
+        self.frames += 1
+        if self.frames % self.hash_every == 0:
+            self.hashes.append(game.state_hash())
+
+    def save(self, path):
+        with open(path, "wb") as f:
+            f.write(REPLAY_HEADER.pack(REPLAY_MAGIC, REPLAY_VERSION, self.world, self.level,
+                                       self.hash_every, self.frames, len(self.runs), len(self.hashes)))
+            f.write(b"".join(REPLAY_RUN.pack(count, mask) for mask, count in self.runs))
+            f.write(b"".join(REPLAY_HASH.pack(h) for h in self.hashes))
+
+class InputReplay:
+    """A recorded session: per-frame keys plus the state hashes to check them against."""
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            data = f.read()
+        magic, version, self.world, self.level, self.hash_every, self.frames, runs, hashes = REPLAY_HEADER.unpack_from(data)
+        if magic != REPLAY_MAGIC or version != REPLAY_VERSION:
+            raise ValueError(f"{path}: not a version {REPLAY_VERSION} replay file")
+        offset = REPLAY_HEADER.size
+        masks = bytearray()
+        for count, mask in REPLAY_RUN.iter_unpack(data[offset:offset + runs * REPLAY_RUN.size]):
+            masks += bytes((mask,)) * count
+        if len(masks) != self.frames:
+            raise ValueError(f"{path}: input runs cover {len(masks)} of {self.frames} frames")
+        self.masks = bytes(masks)
+        offset += runs * REPLAY_RUN.size
+        self.hashes = [h for h, in REPLAY_HASH.iter_unpack(data[offset:offset + hashes * REPLAY_HASH.size])]
+        self.desync = None
+
+    def keys(self, frame):
+        return mask_inputs(self.masks[frame])
+
+    def check(self, frame, game):
+        """After stepping frame, compare against the recorded hash if one is due; False on desync."""
+        done = frame + 1
+        if done % self.hash_every or done // self.hash_every > len(self.hashes):
+            return True
+        if game.state_hash() == self.hashes[done // self.hash_every - 1]:
+            return True
+        if self.desync is None:
+            self.desync = frame
+        return False
+
+class RewindBuffer:
+    """The last REWIND_SECONDS of snapshot()s, taken before each step, for playing backward.
+
+    A full keyframe is kept every REWIND_KEYFRAME_EVERY frames, and whenever
+    the snapshot changes size; the frames in between are zlib-packed XOR
+    deltas against their keyframe. The oldest frames are dropped once there
+    are more than max_frames or they take more than max_bytes (plus the one
+    keyframe the oldest deltas may still hold on to).
+    """
+    def __init__(self, max_frames=REWIND_SECONDS * FPS, max_bytes=REWIND_MAX_BYTES):
+        self.max_frames = max_frames
+        self.max_bytes = max_bytes
+        self.frames = deque()  # (keyframe, delta or None for the keyframe itself)
+        self.bytes = 0
+        self.key = None
+        self.since_key = 0
+
+    def __len__(self):
+        return len(self.frames)
+
+    def clear(self):
+        self.frames.clear()
+        self.bytes = 0
+        self.key = None
+
+    def record(self, game):
+        state = game.snapshot()
+        key = self.key
+        if key is None or len(state) != len(key) or self.since_key >= REWIND_KEYFRAME_EVERY:
+            self.key = key = state
+            self.since_key = 0
+            self.frames.append((state, None))
+            self.bytes += len(state)
+        else:
+            delta = zlib.compress((int.from_bytes(state, "little") ^ int.from_bytes(key, "little")).to_bytes(len(state), "little"), 1)
+            self.frames.append((key, delta))
+            self.bytes += len(delta)
+        self.since_key += 1
+        while len(self.frames) > self.max_frames or self.bytes > self.max_bytes:
+            key, delta = self.frames.popleft()
+            self.bytes -= len(key) if delta is None else len(delta)
+
+    def step_back(self, game):
+        """Restore the newest recorded frame and drop it; False once there is nothing left."""
+        if not self.frames:
+            return False
+        key, delta = self.frames.pop()
+        self.bytes -= len(key) if delta is None else len(delta)
+        # The next frame recorded starts a fresh keyframe
+        self.key = None
+        if delta is None:
+            game.restore(key)
+        else:
+            game.restore((int.from_bytes(key, "little") ^ int.from_bytes(zlib.decompress(delta), "little")).to_bytes(len(key), "little"))
+        return True
+
 class Camera:
     def __init__(self, width, height):
         self.camera = pygame.Rect(0, 0, width, height)
@@ -71,6 +303,8 @@ class Entity(pygame.sprite.Sprite):
         self.vel_y = 0
 
 class Decoration(pygame.sprite.Sprite):
+    frames = {}
+
     def __init__(self, x, y, type_, size=1):
         super().__init__()
         self.type = type_
@@ -78,35 +312,78 @@ class Decoration(pygame.sprite.Sprite):
         self.rect = pygame.Rect(x, y, 0, 0)
 
     def draw(self, screen, camera):
-        dest = camera.apply_rect(pygame.Rect(self.rect.x, self.rect.y, 1, 1))
-        if dest.x < -300 or dest.x > SCREEN_WIDTH: return
+        # Clouds hang at their own height, hills and bushes stand on the ground
+        frame, dx, dy = self.frame()
+        x = self.rect.x + camera.camera.x
+        y = self.rect.y + camera.camera.y if self.type == "cloud" else SCREEN_HEIGHT - TILE_SIZE * 2
+        screen.blit(frame, (x + dx, y + dy))
+
+    def frame(self):
+        """This shape and size painted once: (colorkeyed Surface, x and y offset from the anchor)."""
+        key = (self.type, self.size)
+        cached = Decoration.frames.get(key)
+        if cached is None:
+            x, y = TILE_SIZE, TILE_SIZE * (self.size + 2)
+            canvas = pygame.Surface((x + TILE_SIZE * (self.size + 4), y + TILE_SIZE))
+            canvas.fill(COLORKEY)
+            canvas.set_colorkey(COLORKEY)
+            self.paint(canvas, x, y)
+            bounds = canvas.get_bounding_rect()
+            cached = Decoration.frames[key] = (canvas.subsurface(bounds).convert(), bounds.x - x, bounds.y - y)
+        return cached
+
+    def paint(self, screen, base_x, anchor_y):
         if self.type == "hill":
             h_width = 32 * (2 + self.size)
             h_height = 32 * (self.size + 0.5)
-            base_x = dest.x
-            base_y = SCREEN_HEIGHT - TILE_SIZE * 2
+            base_y = anchor_y
             points = [(base_x, base_y), (base_x + h_width/2, base_y - h_height), (base_x + h_width, base_y)]
             pygame.draw.polygon(screen, HILL_GREEN, points)
             pygame.draw.polygon(screen, HILL_OUTLINE, points, 3)
         elif self.type == "cloud":
             c_width = 32 * (1 + self.size)
-            base_x = dest.x
-            base_y = dest.y
+            base_y = anchor_y
             pygame.draw.rect(screen, CLOUD_WHITE, (base_x, base_y, c_width, 24), border_radius=12)
             pygame.draw.circle(screen, CLOUD_WHITE, (base_x + 16, base_y), 16)
             if self.size > 1: pygame.draw.circle(screen, CLOUD_WHITE, (base_x + 48, base_y), 16)
             if self.size > 2: pygame.draw.circle(screen, CLOUD_WHITE, (base_x + 80, base_y), 16)
         elif self.type == "bush":
             b_width = 32 * (1 + self.size)
-            base_x = dest.x
-            base_y = SCREEN_HEIGHT - TILE_SIZE * 2 - 16
+            base_y = anchor_y - 16
             pygame.draw.circle(screen, PIPE_LIGHT, (base_x + 16, base_y + 8), 16)
             pygame.draw.circle(screen, PIPE_LIGHT, (base_x + b_width - 16, base_y + 8), 16)
             pygame.draw.rect(screen, PIPE_LIGHT, (base_x + 16, base_y, b_width - 32, 24))
 
+class SceneryLayer:
+    """Decorations sorted by x, so a frame only visits the ones near the camera.
+
+    Anything anchored from DECORATION_REACH left of the screen up to its
+    right edge is drawn, in the order the decorations were given.
+    """
+    def __init__(self, decorations=()):
+        self.decorations = list(decorations)
+        self.order = sorted(range(len(self.decorations)), key=lambda i: self.decorations[i].rect.x)
+        self.xs = [self.decorations[i].rect.x for i in self.order]
+
+    def __iter__(self):
+        return iter(self.decorations)
+
+    def __len__(self):
+        return len(self.decorations)
+
+    def draw(self, screen, camera):
+        left = -camera.camera.x
+        first = bisect.bisect_left(self.xs, left - DECORATION_REACH)
+        last = bisect.bisect_right(self.xs, left + SCREEN_WIDTH)
+        for i in sorted(self.order[first:last]):
+            self.decorations[i].draw(screen, camera)
+
 class Mario(Entity):
+    frames = {}
+
     def __init__(self, x, y):
         super().__init__(x, y, 28, 30, MARIO_RED)
+        self.palette = MARIO_PALETTE
         self.on_ground = False
         self.facing_right = True
         self.is_dead = False
@@ -115,14 +392,14 @@ class Mario(Entity):
         self.frame_timer = 0
         self.walk_frame = 0
 
-    def update(self, tiles, enemies, game_ref):
+    def update(self, grid, enemies, game_ref, keys):
         if self.state == "VICTORY" or not self.visible: return
         if self.state == "SLIDE":
             self.vel_y = 3
             self.rect.y += self.vel_y
             hit_ground = False
-            for tile in tiles:
-                if tile.type in ["flagpole", "castle", "castle_door", "flag_top", "cloud", "hill", "bush"]: continue
+            for tile in grid.query(self.rect):
+                if TILE_COLLISION[tile.type] != SOLID: continue
                 if self.rect.colliderect(tile.rect):
                     self.rect.bottom = tile.rect.top
                     hit_ground = True
@@ -141,13 +418,13 @@ class Mario(Entity):
             if self.frame_timer > 10:
                 self.walk_frame = (self.walk_frame + 1) % 3
                 self.frame_timer = 0
-            for tile in tiles:
-                if tile.type not in ["castle_door", "castle", "flagpole", "flag_top"]:
+            for tile in grid.query(self.rect):
+                if TILE_COLLISION[tile.type] == SOLID:
                     if self.rect.colliderect(tile.rect) and self.vel_y > 0:
                         self.rect.bottom = tile.rect.top
                         self.vel_y = 0
-            for tile in tiles:
-                if tile.type == "castle_door" and self.rect.colliderect(tile.rect):
+            for tile in grid.query(self.rect):
+                if TILE_COLLISION[tile.type] == VICTORY and self.rect.colliderect(tile.rect):
                     self.visible = False
                     game_ref.trigger_victory()
                     return
@@ -156,7 +433,6 @@ class Mario(Entity):
             self.vel_y += GRAVITY
             self.rect.y += self.vel_y
             return
-        keys = pygame.key.get_pressed()
         if keys[pygame.K_LEFT]:
             self.vel_x -= ACCEL
             self.facing_right = False
@@ -182,12 +458,13 @@ class Mario(Entity):
                 self.frame_timer = 0
         else:
             self.walk_frame = 0
-        self.rect.x += self.vel_x
-        self.collide(tiles, "x")
-        self.rect.y += self.vel_y
+        self.collide(grid, "x")
         self.on_ground = False
-        self.collide(tiles, "y")
-        hit_list = pygame.sprite.spritecollide(self, enemies, False)
+        self.collide(grid, "y")
+        if isinstance(enemies, GoombaSwarm):
+            hit_list = enemies.hits(self.rect)
+        else:
+            hit_list = pygame.sprite.spritecollide(self, enemies, False)
         for enemy in hit_list:
             if enemy.is_alive:
                 if self.vel_y > 0 and self.rect.bottom < enemy.rect.centery + 15:
@@ -199,28 +476,47 @@ class Mario(Entity):
         if self.rect.y > SCREEN_HEIGHT:
             self.die()
 
-    def collide(self, tiles, direction):
-        for tile in tiles:
-            if tile.type in ["castle", "flag_top", "castle_door", "bush", "cloud", "hill"]: continue
-            if self.rect.colliderect(tile.rect):
-                if tile.type == "flagpole":
-                    self.start_flag_sequence(tile)
-                    return
-                if direction == "x":
-                    if self.vel_x > 0:
-                        self.rect.right = tile.rect.left
-                        self.vel_x = 0
-                    elif self.vel_x < 0:
-                        self.rect.left = tile.rect.right
-                        self.vel_x = 0
-                if direction == "y":
-                    if self.vel_y > 0:
-                        self.rect.bottom = tile.rect.top
-                        self.vel_y = 0
-                        self.on_ground = True
-                    elif self.vel_y < 0:
-                        self.rect.top = tile.rect.bottom
-                        self.vel_y = 0
+    def collide(self, grid, direction):
+        """Move along one axis, stopping at the nearest SOLID tile on the way.
+
+        The whole swept path from the old to the new rect is looked up in the
+        grid, so no speed or timestep can carry Mario through a tile.
+        """
+        start = self.rect.copy()
+        if direction == "x":
+            self.rect.x += self.vel_x
+        else:
+            self.rect.y += self.vel_y
+        path = start.union(self.rect)
+        solids = []
+        poles = []
+        for tile in grid.query(path):
+            collision = TILE_COLLISION[tile.type]
+            if not path.colliderect(tile.rect): continue
+            if collision == SOLID:
+                solids.append(tile.rect)
+            elif collision == TRIGGER:
+                poles.append(tile)
+        if solids:
+            if direction == "x":
+                if self.vel_x > 0:
+                    self.rect.right = min(solid.left for solid in solids)
+                    self.vel_x = 0
+                elif self.vel_x < 0:
+                    self.rect.left = max(solid.right for solid in solids)
+                    self.vel_x = 0
+            elif self.vel_y > 0:
+                self.rect.bottom = min(solid.top for solid in solids)
+                self.vel_y = 0
+                self.on_ground = True
+            elif self.vel_y < 0:
+                self.rect.top = max(solid.bottom for solid in solids)
+                self.vel_y = 0
+        path = start.union(self.rect)
+        for pole in poles:
+            if path.colliderect(pole.rect):
+                self.start_flag_sequence(pole)
+                break
 
     def start_flag_sequence(self, pole):
         self.state = "SLIDE"
@@ -237,31 +533,41 @@ class Mario(Entity):
     def draw(self, screen, camera):
         if not self.visible: return
         pos = camera.apply(self)
-        hx, hy = pos.x, pos.y
+        key = (self.palette, self.walk_frame, self.facing_right)
+        frame = Mario.frames.get(key)
+        if frame is None:
+            frame = Mario.frames[key] = render_frame(self.paint)
+        screen.blit(frame, (pos.x - SPRITE_PAD, pos.y - SPRITE_PAD))
+
+    def paint(self, screen, hx, hy):
+        red, skin, brown, blue = self.palette
         dir = 1 if self.facing_right else -1
-        pygame.draw.rect(screen, MARIO_RED, (hx+2, hy+4, 24, 8))
-        pygame.draw.rect(screen, MARIO_SKIN, (hx+6, hy+10, 16, 10))
-        pygame.draw.rect(screen, MARIO_BROWN, (hx+4 if self.facing_right else hx+10, hy+8, 8, 6))
-        pygame.draw.rect(screen, MARIO_RED, (hx+4, hy+18, 20, 6))
-        pygame.draw.rect(screen, MARIO_BLUE, (hx+4, hy+22, 20, 8))
-        pygame.draw.rect(screen, MARIO_BROWN, (hx+2, hy+28, 8, 4))
-        pygame.draw.rect(screen, MARIO_BROWN, (hx+18, hy+28, 8, 4))
+        pygame.draw.rect(screen, red, (hx+2, hy+4, 24, 8))
+        pygame.draw.rect(screen, skin, (hx+6, hy+10, 16, 10))
+        pygame.draw.rect(screen, brown, (hx+4 if self.facing_right else hx+10, hy+8, 8, 6))
+        pygame.draw.rect(screen, red, (hx+4, hy+18, 20, 6))
+        pygame.draw.rect(screen, blue, (hx+4, hy+22, 20, 8))
+        pygame.draw.rect(screen, brown, (hx+2, hy+28, 8, 4))
+        pygame.draw.rect(screen, brown, (hx+18, hy+28, 8, 4))
         arm_x = hx + (2 if self.facing_right else 18) + (4 * dir if self.walk_frame % 2 else 0)
-        pygame.draw.rect(screen, MARIO_RED, (arm_x, hy+18, 6, 8))
+        pygame.draw.rect(screen, red, (arm_x, hy+18, 6, 8))
         leg_offset = 3 if self.walk_frame == 1 else -3
-        pygame.draw.rect(screen, MARIO_BLUE, (hx+6 + leg_offset*dir, hy+26, 6, 6))
-        pygame.draw.rect(screen, MARIO_BLUE, (hx+16 - leg_offset*dir, hy+26, 6, 6))
+        pygame.draw.rect(screen, blue, (hx+6 + leg_offset*dir, hy+26, 6, 6))
+        pygame.draw.rect(screen, blue, (hx+16 - leg_offset*dir, hy+26, 6, 6))
 
 class Goomba(Entity):
+    frames = {}
+
     def __init__(self, x, y):
         super().__init__(x, y, 32, 32, GOOMBA_BODY)
+        self.palette = GOOMBA_PALETTE
         self.vel_x = -2
         self.is_alive = True
         self.frame = 0
         self.frame_timer = 0
         self.dead_timer = 0
 
-    def update(self, tiles):
+    def update(self, grid):
         if not self.is_alive:
             self.dead_timer += 1
             if self.dead_timer > 30: self.kill()
@@ -272,13 +578,13 @@ class Goomba(Entity):
             self.frame = (self.frame + 1) % 2
             self.frame_timer = 0
         self.rect.x += self.vel_x
-        for tile in tiles:
-            if tile.type in ["castle", "flagpole", "flag_top", "castle_door", "bush", "hill", "cloud"]: continue
+        for tile in grid.query(self.rect):
+            if TILE_COLLISION[tile.type] != SOLID: continue
             if self.rect.colliderect(tile.rect):
                 self.vel_x *= -1
         self.rect.y += self.vel_y
-        for tile in tiles:
-            if tile.type in ["castle", "flagpole", "flag_top", "castle_door", "bush", "hill", "cloud"]: continue
+        for tile in grid.query(self.rect):
+            if TILE_COLLISION[tile.type] != SOLID: continue
             if self.rect.colliderect(tile.rect) and self.vel_y > 0:
                 self.rect.bottom = tile.rect.top
                 self.vel_y = 0
@@ -288,18 +594,148 @@ class Goomba(Entity):
 
     def draw(self, screen, camera):
         pos = camera.apply(self)
+        key = (self.palette, self.frame if self.is_alive else 0, self.is_alive)
+        frame = Goomba.frames.get(key)
+        if frame is None:
+            frame = Goomba.frames[key] = render_frame(self.paint)
+        screen.blit(frame, (pos.x - SPRITE_PAD, pos.y - SPRITE_PAD))
+
+    def paint(self, screen, x, y):
+        body, white, black = self.palette
         if not self.is_alive:
-            pygame.draw.rect(screen, GOOMBA_BODY, (pos.x+4, pos.y+16, 24, 16))
+            pygame.draw.rect(screen, body, (x+4, y+16, 24, 16))
             return
-        pygame.draw.ellipse(screen, GOOMBA_BODY, (pos.x+2, pos.y, 28, 24))
-        pygame.draw.rect(screen, WHITE, (pos.x+6, pos.y+8, 8, 8))
-        pygame.draw.rect(screen, WHITE, (pos.x+18, pos.y+8, 8, 8))
-        pygame.draw.rect(screen, BLACK, (pos.x+8, pos.y+10, 4, 4))
-        pygame.draw.rect(screen, BLACK, (pos.x+20, pos.y+10, 4, 4))
-        foot = (pos.x if self.frame == 0 else pos.x+2, pos.y+24, 10, 6)
-        pygame.draw.rect(screen, BLACK, foot)
-        foot2 = (pos.x+20 if self.frame == 0 else pos.x+18, pos.y+24, 10, 6)
-        pygame.draw.rect(screen, BLACK, foot2)
+        pygame.draw.ellipse(screen, body, (x+2, y, 28, 24))
+        pygame.draw.rect(screen, white, (x+6, y+8, 8, 8))
+        pygame.draw.rect(screen, white, (x+18, y+8, 8, 8))
+        pygame.draw.rect(screen, black, (x+8, y+10, 4, 4))
+        pygame.draw.rect(screen, black, (x+20, y+10, 4, 4))
+        foot = (x if self.frame == 0 else x+2, y+24, 10, 6)
+        pygame.draw.rect(screen, black, foot)
+        foot2 = (x+20 if self.frame == 0 else x+18, y+24, 10, 6)
+        pygame.draw.rect(screen, black, foot2)
+
+class SwarmGoomba:
+    """Read view of one GoombaSwarm slot, shaped like a Goomba for Mario and the HUD."""
+    __slots__ = ("swarm", "i")
+
+    def __init__(self, swarm, i):
+        self.swarm = swarm
+        self.i = i
+
+    @property
+    def rect(self):
+        return pygame.Rect(int(self.swarm.x[self.i]), int(self.swarm.y[self.i]), TILE_SIZE, TILE_SIZE)
+
+    @property
+    def vel_x(self): return int(self.swarm.vel_x[self.i])
+    @property
+    def vel_y(self): return float(self.swarm.vel_y[self.i])
+    @property
+    def is_alive(self): return bool(self.swarm.alive[self.i])
+    @property
+    def dead_timer(self): return int(self.swarm.dead_timer[self.i])
+
+    def die(self):
+        self.swarm.alive[self.i] = False
+
+class GoombaSwarm:
+    """Goombas as NumPy arrays, stepped together; same rules as Goomba.update.
+
+    Tiles must sit on the TILE_SIZE grid (every level source snaps them), so
+    each goomba overlaps at most 2x2 cells of TileGrid.solid_map().
+    """
+    fields = ("x", "y", "vel_x", "vel_y", "alive", "frame", "frame_timer", "dead_timer")
+
+    def __init__(self, goombas=()):
+        goombas = list(goombas)
+        self.x = np.array([g.rect.x for g in goombas], dtype=np.int64)
+        self.y = np.array([g.rect.y for g in goombas], dtype=np.int64)
+        self.vel_x = np.array([g.vel_x for g in goombas], dtype=np.int64)
+        self.vel_y = np.array([g.vel_y for g in goombas], dtype=np.float64)
+        self.alive = np.array([g.is_alive for g in goombas], dtype=bool)
+        self.frame = np.array([g.frame for g in goombas], dtype=np.int64)
+        self.frame_timer = np.array([g.frame_timer for g in goombas], dtype=np.int64)
+        self.dead_timer = np.array([g.dead_timer for g in goombas], dtype=np.int64)
+
+    def __len__(self):
+        return len(self.x)
+
+    def __iter__(self):
+        return (SwarmGoomba(self, i) for i in range(len(self.x)))
+
+    def empty(self):
+        self.keep(np.zeros(len(self.x), dtype=bool))
+
+    def keep(self, mask):
+        for name in self.fields:
+            setattr(self, name, getattr(self, name)[mask])
+
+    def update(self, grid):
+        dead = ~self.alive
+        self.dead_timer[dead] += 1
+        if (self.dead_timer > 30).any():
+            self.keep(self.dead_timer <= 30)
+            dead = ~self.alive
+        live = self.alive
+        self.vel_y[live] += GRAVITY
+        self.frame_timer[live] += 1
+        flip = live & (self.frame_timer > 10)
+        self.frame[flip] = (self.frame[flip] + 1) % 2
+        self.frame_timer[flip] = 0
+        count, first, cx0, cy0 = grid.solid_map()
+
+        self.x[live] += self.vel_x[live]
+        hits, _, _ = self.overlap(count, first, cx0, cy0)
+        reverse = live & (hits % 2 == 1)  # Goomba.update flips once per overlapping tile
+        self.vel_x[reverse] *= -1
+
+        self.y[live] = np.trunc(self.y[live] + self.vel_y[live]).astype(np.int64)
+        hits, _, row = self.overlap(count, first, cx0, cy0)
+        land = live & (hits > 0) & (self.vel_y > 0)
+        self.y[land] = (row[land] - 1) * TILE_SIZE
+        self.vel_y[land] = 0
+
+    def overlap(self, count, first, cx0, cy0):
+        """Per goomba: solid tiles touched, and the grid row of the earliest-added one."""
+        rows, cols = count.shape
+        c0 = self.x // TILE_SIZE
+        c1 = (self.x + TILE_SIZE - 1) // TILE_SIZE
+        r0 = self.y // TILE_SIZE
+        r1 = (self.y + TILE_SIZE - 1) // TILE_SIZE
+        never = np.iinfo(np.int64).max
+        hits = np.zeros(len(self.x), dtype=np.int64)
+        best = np.full(len(self.x), never)
+        row = np.zeros(len(self.x), dtype=np.int64)
+        for r, c, fresh in ((r0, c0, True), (r0, c1, c1 != c0), (r1, c0, r1 != r0), (r1, c1, (r1 != r0) & (c1 != c0))):
+            i, j = r - cy0, c - cx0
+            inside = fresh & (i >= 0) & (i < rows) & (j >= 0) & (j < cols)
+            i, j = np.where(inside, i, 0), np.where(inside, j, 0)
+            hits += np.where(inside, count[i, j], 0)
+            seq = np.where(inside, first[i, j], never)
+            earlier = seq < best
+            best = np.where(earlier, seq, best)
+            row = np.where(earlier, r, row)
+        return hits, best, row
+
+    def hits(self, rect):
+        """Goombas overlapping rect, in spawn order, like spritecollide."""
+        touching = ((self.x < rect.right) & (self.x + TILE_SIZE > rect.left)
+                    & (self.y < rect.bottom) & (self.y + TILE_SIZE > rect.top))
+        return [SwarmGoomba(self, i) for i in np.flatnonzero(touching)]
+
+    def draw(self, screen, camera):
+        cam_x, cam_y = camera.camera.topleft
+        on_screen = np.flatnonzero((self.x + cam_x > -TILE_SIZE - SPRITE_PAD) & (self.x + cam_x < SCREEN_WIDTH + SPRITE_PAD))
+        for i in on_screen:
+            alive = bool(self.alive[i])
+            key = (GOOMBA_PALETTE, int(self.frame[i]) if alive else 0, alive)
+            frame = Goomba.frames.get(key)
+            if frame is None:
+                painter = Goomba(0, 0)
+                painter.frame, painter.is_alive = key[1], alive
+                frame = Goomba.frames[key] = render_frame(painter.paint)
+            screen.blit(frame, (int(self.x[i]) + cam_x - SPRITE_PAD, int(self.y[i]) + cam_y - SPRITE_PAD))
 
 class Tile(pygame.sprite.Sprite):
     def __init__(self, x, y, type_):
@@ -340,31 +776,477 @@ class Tile(pygame.sprite.Sprite):
             pygame.draw.rect(screen, BLACK, pos)
             pygame.draw.rect(screen, CASTLE_BRICK, (pos.x+8, pos.y+8, pos.width-16, pos.height-16))
 
-class Game:
+class TileGrid:
+    """Uniform spatial hash of tiles, one bucket per TILE_SIZE cell.
+
+    query() returns candidates in insertion order so collision resolution
+    matches a plain walk over the tile group.
+    """
+    def __init__(self, tiles=()):
+        self.cells = {}
+        self.order = {}
+        self._solid = None
+        for tile in tiles:
+            self.add(tile)
+
+    def _cells(self, rect):
+        for cx in range(rect.left // TILE_SIZE, (rect.right - 1) // TILE_SIZE + 1):
+            for cy in range(rect.top // TILE_SIZE, (rect.bottom - 1) // TILE_SIZE + 1):
+                yield cx, cy
+
+    def add(self, tile):
+        if tile in self.order: return
+        self._solid = None
+        self.order[tile] = len(self.order)
+        for cell in self._cells(tile.rect):
+            self.cells.setdefault(cell, []).append(tile)
+
+    def remove(self, tile):
+        if self.order.pop(tile, None) is None: return
+        self._solid = None
+        for cell in self._cells(tile.rect):
+            bucket = self.cells.get(cell)
+            if bucket and tile in bucket:
+                bucket.remove(tile)
+                if not bucket: del self.cells[cell]
+
+    def copy(self):
+        grid = TileGrid()
+        grid.cells = {cell: list(bucket) for cell, bucket in self.cells.items()}
+        grid.order = dict(self.order)
+        return grid
+
+    def solid_map(self):
+        """NumPy (count, first, x0, y0) over the cells holding SOLID tiles.
+
+        count[row, col] is how many tiles fill the cell and first the insertion
+        index of the earliest one; (x0, y0) is the cell at [0, 0].
+        """
+        if self._solid is not None:
+            return self._solid
+        solids = [(tile.rect.x // TILE_SIZE, tile.rect.y // TILE_SIZE, seq)
+                  for tile, seq in self.order.items() if TILE_COLLISION[tile.type] == SOLID]
+        if not solids:
+            solids = [(0, 0, None)]
+        cx0 = min(c for c, _, _ in solids)
+        cy0 = min(r for _, r, _ in solids)
+        count = np.zeros((max(r for _, r, _ in solids) - cy0 + 1, max(c for c, _, _ in solids) - cx0 + 1), dtype=np.int64)
+        first = np.full(count.shape, np.iinfo(np.int64).max)
+        for c, r, seq in solids:
+            if seq is None: continue
+            count[r - cy0, c - cx0] += 1
+            first[r - cy0, c - cx0] = min(first[r - cy0, c - cx0], seq)
+        self._solid = (count, first, cx0, cy0)
+        return self._solid
+
+    def query(self, rect):
+        found = []
+        for cell in self._cells(rect):
+            for tile in self.cells.get(cell, ()):
+                if tile not in found: found.append(tile)
+        if len(found) > 1: found.sort(key=self.order.__getitem__)
+        return found
+
+class LevelTile:
+    """Sprite-free tile record for levels read from a level file; draws like Tile."""
+    __slots__ = ("type", "rect", "frame_timer")
+
+    def __init__(self, x, y, type_):
+        self.type = type_
+        self.rect = pygame.Rect(x, y, TILE_SIZE, TILE_SIZE)
+        self.frame_timer = 0
+
+    draw = Tile.draw
+
+def save_level_file(path, tiles, enemies, compress=False):
+    """Write tiles and goombas as a packed level grid (last tile per cell wins); returns bytes written."""
+    kinds = {kind: i for i, kind in enumerate(LEVEL_TILE_KINDS) if kind}
+    cells = {(t.rect.x // TILE_SIZE, t.rect.y // TILE_SIZE): kinds[t.type] for t in tiles}
+    if cells:
+        x0 = min(x for x, _ in cells)
+        y0 = min(y for _, y in cells)
+        width = max(x for x, _ in cells) - x0 + 1
+        height = max(y for _, y in cells) - y0 + 1
+    else:
+        x0 = y0 = width = height = 0
+    grid = bytearray(width * height)
+    for (x, y), kind in cells.items():
+        grid[(y - y0) * width + (x - x0)] = kind
+    payload = bytes(grid) + b"".join(LEVEL_ENEMY.pack(e.rect.x, e.rect.y) for e in enemies)
+    flags = 0
+    if compress:
+        payload = zlib.compress(payload)
+        flags |= LEVEL_FLAG_ZLIB
+    header = LEVEL_HEADER.pack(LEVEL_MAGIC, LEVEL_VERSION, flags, x0, y0, width, height, len(enemies))
+    # A temporary file next to the target is swapped in whole, so a crash
+    # mid-save leaves the previous level file intact
+    fd, temp = tempfile.mkstemp(prefix=os.path.basename(path) + ".", suffix=".tmp",
+                                dir=os.path.dirname(os.path.abspath(path)))
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(header)
+            f.write(payload)
+        os.replace(temp, path)
+    except OSError:
+        os.remove(temp)
+        raise
+    return len(header) + len(payload)
+
+def read_level_file(path):
+    """Memory-map a level file; returns ([(x, y, kind)], [(x, y)]) in pixels.
+
+    Raises OSError if the file can't be read and ValueError if it is empty,
+    truncated, from another version or holds an unknown tile kind.
+    """
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size < LEVEL_HEADER.size:
+            raise ValueError(f"{path}: truncated level file")
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    with data:
+        magic, version, flags, x0, y0, width, height, enemy_count = LEVEL_HEADER.unpack_from(data)
+        if magic != LEVEL_MAGIC or version != LEVEL_VERSION:
+            raise ValueError(f"{path}: not a version {LEVEL_VERSION} level file")
+        try:
+            payload = zlib.decompress(data[LEVEL_HEADER.size:]) if flags & LEVEL_FLAG_ZLIB else data
+        except zlib.error as error:
+            raise ValueError(f"{path}: {error}") from None
+        start = 0 if flags & LEVEL_FLAG_ZLIB else LEVEL_HEADER.size
+        if len(payload) < start + width * height + enemy_count * LEVEL_ENEMY.size:
+            raise ValueError(f"{path}: truncated level file")
+        if max(payload[start:start + width * height], default=0) >= len(LEVEL_TILE_KINDS):
+            raise ValueError(f"{path}: unknown tile kind")
+        tiles = []
+        for row in range(height):
+            base = start + row * width
+            line = payload[base:base + width]
+            for col in range(width):
+                if line[col]:
+                    tiles.append(((x0 + col) * TILE_SIZE, (y0 + row) * TILE_SIZE, LEVEL_TILE_KINDS[line[col]]))
+        enemies_at = start + width * height
+        enemies = [LEVEL_ENEMY.unpack_from(payload, enemies_at + i * LEVEL_ENEMY.size) for i in range(enemy_count)]
+    return tiles, enemies
+
+def add_pipe(x, height, tiles):
+    for h in range(height):
+        tiles.append(Tile(x * TILE_SIZE, SCREEN_HEIGHT - (2+h) * TILE_SIZE, "pipe"))
+    tiles.append(Tile(x * TILE_SIZE, SCREEN_HEIGHT - (2+height) * TILE_SIZE, "pipe_top"))
+
+def add_castle(x, tiles):
+    for cx in range(5):
+        for cy in range(2):
+            tiles.append(Tile((x + cx) * TILE_SIZE, SCREEN_HEIGHT - (2+cy)*TILE_SIZE, "castle"))
+    tiles.append(Tile((x + 2) * TILE_SIZE, SCREEN_HEIGHT - 3*TILE_SIZE, "castle_door"))
+
+def generate_level(world):
+    """Build one world's stage; returns (tiles, scenery, goomba spawn points)."""
+    tiles, scenery, spawns = [], [], []
+    map_width = 180 + world * 10
+    pits = [69, 70, 86, 87, 88, 120 + world]
+    for x in range(map_width):
+        if x not in pits:
+            tiles.append(Tile(x * TILE_SIZE, SCREEN_HEIGHT - TILE_SIZE, "ground"))
+            tiles.append(Tile(x * TILE_SIZE, SCREEN_HEIGHT - TILE_SIZE * 2, "ground"))
+    for x in range(0, map_width, 16):
+        scenery.append(Decoration((x + 0) * TILE_SIZE, 0, "hill", size=2))
+        scenery.append(Decoration((x + 16) * TILE_SIZE, 0, "hill", size=1))
+        scenery.append(Decoration((x + 11) * TILE_SIZE, 0, "bush", size=2))
+        scenery.append(Decoration((x + 8) * TILE_SIZE, 80, "cloud", size=2))
+    add_pipe(28, 1, tiles)
+    add_pipe(46, 2 if world > 3 else 1, tiles)
+    structures = [(16,5,'block'),(22,5,'brick'),(22,9,'block'),(77,5,'brick'),(80,9,'brick'),(94,5,'brick')]
+    for s in structures:
+        tiles.append(Tile(s[0]*TILE_SIZE, SCREEN_HEIGHT-(2+s[1])*TILE_SIZE, s[2]))
+    def build_stair(start_x, height, reverse=False):
+        for i in range(height):
+            for h in range(i+1):
+                x = start_x + (i if not reverse else height-1-i)
+                tiles.append(Tile(x*TILE_SIZE, SCREEN_HEIGHT-(3+h)*TILE_SIZE, "block"))
+    build_stair(134, 4 + world//3)
+    build_stair(181, 8)
+    flag_x = 198
+    for i in range(1, 10):
+        tiles.append(Tile(flag_x * TILE_SIZE, SCREEN_HEIGHT - (2+i)*TILE_SIZE, "flagpole"))
+    tiles.append(Tile(flag_x * TILE_SIZE, SCREEN_HEIGHT - (2+10)*TILE_SIZE, "flag_top"))
+    add_castle(202, tiles)
+    goomba_count = 12 + world * 2
+    for loc in range(goomba_count):
+        spawns.append(((20 + loc*12) * TILE_SIZE, SCREEN_HEIGHT - TILE_SIZE * 5))
+    return tiles, scenery, spawns
+
+def following_stage(world, level):
+    """The (world, level) after this one; 8-4 is the last stage."""
+    level += 1
+    if level > 4:
+        level = 1
+        world += 1
+    if world > 8:
+        world = 8
+        level = 4
+    return world, level
+
+class CompiledLevel:
+    """A generated stage ready to play: tiles, a SceneryLayer, their TileGrid and goomba spawns.
+
+    Tiles and scenery never change during play, so every restart shares them;
+    only the goombas are rebuilt.
+    """
+    __slots__ = ("tiles", "scenery", "spawns", "grid")
+
+    def __init__(self, tiles, scenery, spawns):
+        self.tiles = tiles
+        self.scenery = SceneryLayer(scenery)
+        self.spawns = spawns
+        self.grid = TileGrid(tiles)
+
+    def pack(self, source):
+        """This stage as a level cache entry for the game file whose CRC is source."""
+        kinds = {kind: i for i, kind in enumerate(LEVEL_TILE_KINDS) if kind}
+        records = b"".join([
+            b"".join(LEVEL_CACHE_TILE.pack(t.rect.x, t.rect.y, kinds[t.type]) for t in self.tiles),
+            b"".join(LEVEL_CACHE_DECORATION.pack(d.rect.x, d.rect.y, LEVEL_SCENERY_KINDS.index(d.type), d.size)
+                     for d in self.scenery),
+            b"".join(LEVEL_ENEMY.pack(x, y) for x, y in self.spawns)])
+        return LEVEL_CACHE_HEADER.pack(LEVEL_CACHE_MAGIC, LEVEL_CACHE_VERSION, source, zlib.crc32(records),
+                                       len(self.tiles), len(self.scenery), len(self.spawns)) + records
+
+    @classmethod
+    def unpack(cls, data, source):
+        """Rebuild a stage from pack() output; raises ValueError unless it is intact and current."""
+        if len(data) < LEVEL_CACHE_HEADER.size:
+            raise ValueError("truncated level cache entry")
+        magic, version, data_source, crc, tiles, decorations, spawns = LEVEL_CACHE_HEADER.unpack_from(data)
+        if magic != LEVEL_CACHE_MAGIC or version != LEVEL_CACHE_VERSION or data_source != source:
+            raise ValueError("stale level cache entry")
+        records = memoryview(data)[LEVEL_CACHE_HEADER.size:]
+        tiles_end = tiles * LEVEL_CACHE_TILE.size
+        decorations_end = tiles_end + decorations * LEVEL_CACHE_DECORATION.size
+        if len(records) != decorations_end + spawns * LEVEL_ENEMY.size or zlib.crc32(records) != crc:
+            raise ValueError("corrupt level cache entry")
+        try:
+            return cls([Tile(x, y, LEVEL_TILE_KINDS[kind])
+                        for x, y, kind in LEVEL_CACHE_TILE.iter_unpack(records[:tiles_end])],
+                       [Decoration(x, y, LEVEL_SCENERY_KINDS[kind], size)
+                        for x, y, kind, size in LEVEL_CACHE_DECORATION.iter_unpack(records[tiles_end:decorations_end])],
+                       list(LEVEL_ENEMY.iter_unpack(records[decorations_end:])))
+        except (IndexError, KeyError) as error:
+            raise ValueError(f"corrupt level cache entry: {error}") from None
+
+class LevelCache:
+    """Compiled stages, in memory and optionally on disk, with the next one built on a background thread.
+
+    The layout only depends on the world, so each world is compiled once for
+    its four levels. With a directory, entries are also read from and written
+    to it; any entry that can't be read or fails its checks is rebuilt.
+    Generating a stage costs about as much as reading it back, so the disk
+    layer is off unless a directory is given.
+    """
+    def __init__(self, directory=None):
+        self.directory = directory
+        self.levels = {}
+        self.pending = {}
+        with open(__file__, "rb") as f:
+            self.source = zlib.crc32(f.read())
+
+    def path(self, world):
+        return os.path.join(self.directory, f"world-{world}.level")
+
+    def get(self, world, level):
+        """The CompiledLevel for world-level, waiting on a background build if one is running."""
+        if not 1 <= world <= 8:
+            return CompiledLevel(*generate_level(world))
+        thread = self.pending.pop(world, None)
+        if thread: thread.join()
+        compiled = self.levels.get(world)
+        if compiled is None:
+            compiled = self.levels[world] = self.build(world)
+        return compiled
+
+    def prefetch(self, world, level):
+        """Start compiling world-level on a daemon thread unless it is cached or underway."""
+        if not 1 <= world <= 8 or world in self.levels or world in self.pending: return
+        thread = threading.Thread(target=self.prefetched, args=(world,), daemon=True)
+        self.pending[world] = thread
+        thread.start()
+
+    def prefetched(self, world):
+        self.levels[world] = self.build(world)
+
+    def build(self, world):
+        compiled = self.load(world)
+        if compiled is None:
+            compiled = CompiledLevel(*generate_level(world))
+            self.save(world, compiled)
+        return compiled
+
+    def load(self, world):
+        if self.directory is None: return None
+        try:
+            with open(self.path(world), "rb") as f:
+                return CompiledLevel.unpack(f.read(), self.source)
+        except (OSError, ValueError):
+            return None
+
+    def save(self, world, compiled):
+        # Written to a temporary file of its own first, so an interrupted write is
+        # never read back and processes saving the same world never share one
+        if self.directory is None: return
+        path = self.path(world)
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            fd, temp = tempfile.mkstemp(prefix=os.path.basename(path) + ".", suffix=".tmp", dir=self.directory)
+        except OSError:
+            return
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(compiled.pack(self.source))
+            os.replace(temp, path)
+        except OSError:
+            try: os.remove(temp)
+            except OSError: pass
+
+class FrameProfiler:
+    """Wall-clock milliseconds spent in each section of a frame.
+
+    lap(section) charges the time since the previous lap to that section and
+    end_frame() closes the frame. The last PROFILE_WINDOW frames feed the F3
+    overlay; while the F4 log is open every frame is also written as a CSV row.
+    """
     def __init__(self):
+        self.overlay = False
+        self.log = None
+        self.log_error = None  # OSError from the last failed attempt to open the log
+        self.frame = 0
+        self.history = deque(maxlen=PROFILE_WINDOW)
+        self.current = dict.fromkeys(PROFILE_SECTIONS, 0.0)
+        self.mark = time.perf_counter()
+        self.font = None
+        self.panel = None
+        self.rows = []
+
+    def lap(self, section):
+        now = time.perf_counter()
+        self.current[section] += (now - self.mark) * 1000
+        self.mark = now
+
+    def end_frame(self):
+        if self.overlay or self.log:
+            times = [self.current[section] for section in PROFILE_SECTIONS]
+            self.history.append(times)
+            if self.log:
+                self.log.write(f"{self.frame}," + ",".join(f"{ms:.3f}" for ms in times) + f",{sum(times):.3f}\n")
+        self.frame += 1
+        self.current = dict.fromkeys(PROFILE_SECTIONS, 0.0)
+
+    def toggle_log(self, path=PROFILE_LOG_PATH):
+        """Start or stop the per-frame CSV log; returns whether it is now open.
+
+        A log that can't be opened leaves its OSError in log_error for the
+        caller and the overlay instead of raising out of the event loop.
+        """
+        self.log_error = None
+        if self.log:
+            self.log.close()
+            self.log = None
+        else:
+            try:
+                self.log = open(path, "w")
+            except OSError as error:
+                self.log_error = error
+                return False
+            self.log.write("frame," + ",".join(PROFILE_SECTIONS) + ",total\n")
+        return self.log is not None
+
+    def draw(self, screen):
+        """Rolling average and p99 per section, plus a graph of recent frame times."""
+        if not self.overlay or not self.history: return
+        if self.panel is None:
+            self.font = pygame.font.SysFont("monospace", 13)
+            self.panel = pygame.Surface((250, 16 * (len(PROFILE_SECTIONS) + 3) + 70))
+            self.panel.set_alpha(200)
+        panel = self.panel
+        panel.fill((0, 0, 0))
+        if self.frame % 10 == 0 or not self.rows:
+            # The statistics are re-rendered a few times a second, not every frame
+            count = len(self.history)
+            totals = sorted(map(sum, self.history))
+            rows = [f"{'ms':<10}{'avg':>7}{'p99':>7}"]
+            for section, times in zip(PROFILE_SECTIONS, zip(*self.history)):
+                ordered = sorted(times)
+                rows.append(f"{section:<10}{sum(ordered) / count:7.2f}{ordered[int(0.99 * (count - 1))]:7.2f}")
+            rows.append(f"{'frame':<10}{sum(totals) / count:7.2f}{totals[int(0.99 * (count - 1))]:7.2f}")
+            if self.log: rows.append("logging to " + os.path.basename(self.log.name))
+            elif self.log_error: rows.append("log failed: " + (self.log_error.strerror or str(self.log_error)))
+            self.rows = [self.font.render(row, True, (255, 255, 255)) for row in rows]
+        for i, row in enumerate(self.rows):
+            panel.blit(row, (6, 4 + 16 * i))
+        # One bar per frame; the yellow line is the 1/FPS budget at a third of the height
+        budget = 1000 / FPS
+        base = panel.get_height() - 6
+        for i, times in enumerate(self.history):
+            total = sum(times)
+            height = min(60, round(total * 20 / budget))
+            color = (0, 200, 0) if total <= budget * 1.05 else (220, 40, 40)
+            pygame.draw.line(panel, color, (6 + 2 * i, base), (6 + 2 * i, base - height))
+        pygame.draw.line(panel, (255, 255, 0), (6, base - 20), (6 + 2 * PROFILE_WINDOW, base - 20))
+        screen.blit(panel, (SCREEN_WIDTH - panel.get_width() - 10, 80))
+
+class TextCache:
+    """LRU cache of rendered text Surfaces keyed by (font, text, color)."""
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self.surfaces = OrderedDict()
+
+    def render(self, font, text, color):
+        key = (font, text, color)
+        surface = self.surfaces.get(key)
+        if surface is None:
+            surface = self.surfaces[key] = font.render(text, True, color)
+            if len(self.surfaces) > self.maxsize:
+                self.surfaces.popitem(last=False)
+        else:
+            self.surfaces.move_to_end(key)
+        return surface
+
+class Game:
+    def __init__(self, headless=False):
+        self.headless = headless
+        if headless:
+            os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
         pygame.init()
         self.screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
         pygame.display.set_caption("SUPER MARIO WORLD - SMW 60FPS + HOTKEYS")
         self.clock = pygame.time.Clock()
         self.font = pygame.font.SysFont("monospace", 24, bold=True)
         self.big_font = pygame.font.SysFont("monospace", 72, bold=True)
+        self.text = TextCache()
+        self.profiler = FrameProfiler()
         self.state = "MENU"
+        self.shown = None  # what a menu last put on screen; None after any full-screen draw
         self.menu_selection = 0
         self.debug_world = 1
         self.debug_level = 1
         self.editor_tiles = pygame.sprite.Group()
         self.editor_enemies = pygame.sprite.Group()
+        self.editor_grid = TileGrid()
         self.editor_camera = Camera(SCREEN_WIDTH * 3, SCREEN_HEIGHT)
         self.current_tool = "ground"
         self.saved_level = None
+        self.level_file = None
+        self.enemy_swarm = "auto"
+        self.level_cache = LevelCache()
+        self.recorder = None
+        self.record_path = None
+        self.replay = None
+        self.replay_frame = 0
         self.world = 1
         self.level = 1
+        self.checkpoint = None  # F5 saves a snapshot() here, F9 restores it
+        self.rewind = RewindBuffer()
         self.reset()
 
     def reset(self):
-        self.tiles = pygame.sprite.Group()
+        self.rewind.clear()
         self.enemies = pygame.sprite.Group()
-        self.scenery = pygame.sprite.Group()
         self.camera = Camera(SCREEN_WIDTH, SCREEN_HEIGHT)
         self.mario = Mario(100, SCREEN_HEIGHT - TILE_SIZE * 5)
         self.game_over = False
@@ -373,95 +1255,243 @@ class Game:
         self.coins = 0
         self.time = 400
         self.time_ticker = 0
-        self.generate_level()
+        if self.level_file:
+            self.scenery = SceneryLayer()
+            self.load_level_file(self.level_file)
+            self.tile_grid = TileGrid(self.tiles)
+        else:
+            # Restarts reuse the compiled stage; only the goombas are new
+            compiled = self.level_cache.get(self.world, self.level)
+            self.tiles = list(compiled.tiles)
+            self.scenery = compiled.scenery
+            self.tile_grid = compiled.grid
+            for x, y in compiled.spawns:
+                self.enemies.add(Goomba(x, y))
+            self.level_cache.prefetch(*following_stage(self.world, self.level))
+        self.pack_enemies()
+
+    def pack_enemies(self):
+        """Swap the goomba group for a GoombaSwarm when NumPy is there and it pays off."""
+        if np is None or self.enemy_swarm == "off" or isinstance(self.enemies, GoombaSwarm): return
+        if self.enemy_swarm == "on" or len(self.enemies) >= SWARM_MIN_ENEMIES:
+            self.enemies = GoombaSwarm(self.enemies)
+
+    def load_level_file(self, path):
+        # Straight from the packed grid into the collision index, no Tile sprites
+        tiles, enemies = read_level_file(path)
+        self.tiles = [LevelTile(x, y, kind) for x, y, kind in tiles]
+        for x, y in enemies:
+            self.enemies.add(Goomba(x, y))
 
     def next_stage(self):
-        self.level += 1
-        if self.level > 4:
-            self.level = 1
-            self.world += 1
-        if self.world > 8:
-            self.world = 8
-            self.level = 4
+        self.world, self.level = following_stage(self.world, self.level)
+
+    def step(self, keys):
+        """Advance the PLAYING simulation one frame with the given key state."""
+        if self.game_over: return
+        profiler = self.profiler
+        profiler.lap("sim")
+        self.mario.update(self.tile_grid, self.enemies, self, keys)
+        profiler.lap("mario")
+        self.enemies.update(self.tile_grid)
+        profiler.lap("enemies")
+        self.camera.update(self.mario)
+        profiler.lap("camera")
+        if self.mario.state == "SLIDE" and not self.flag_triggered:
+            self.flag_triggered = True
+            self.enemies.empty()
+        if self.mario.state == "DEAD" and self.mario.rect.y > SCREEN_HEIGHT + 100:
+            self.game_over = True
+        if self.mario.state == "VICTORY":
+            self.game_over = True
+        if self.mario.state not in ["DEAD", "VICTORY"]:
+            self.time_ticker += 1
+            if self.time_ticker >= 60:
+                self.time -= 1
+                self.time_ticker = 0
+                if self.time <= 0:
+                    self.mario.die()
+
+    def state_hash(self):
+        """CRC of everything step() carries from frame to frame, for replay checks."""
+        m = self.mario
+        state = [m.rect.x, m.rect.y, m.vel_x, m.vel_y, m.state, m.on_ground, m.is_dead, m.visible,
+                 m.facing_right, m.walk_frame, m.frame_timer, self.camera.camera.x,
+                 self.score, self.time, self.time_ticker, self.flag_triggered, self.game_over]
+        for e in self.enemies:
+            state += (e.rect.x, e.rect.y, e.vel_x, float(e.vel_y), e.is_alive, e.dead_timer)
+        return zlib.crc32(repr(state).encode())
+
+    def snapshot(self):
+        """Pack everything step() changes into bytes for restore(); the stage itself is left out."""
+        m = self.mario
+        enemies = self.enemies
+        swarm = isinstance(enemies, GoombaSwarm)
+        if swarm:
+            records = np.empty(len(enemies), SNAPSHOT_GOOMBA_DTYPE)
+            for name in GoombaSwarm.fields:
+                records[name] = getattr(enemies, name)
+            goombas = ()
+        else:
+            goombas = ((g.rect.x, g.rect.y, g.vel_x, g.vel_y, g.is_alive, g.frame, g.frame_timer, g.dead_timer) for g in enemies)
+        flags = self.flag_triggered * SNAPSHOT_FLAG_TRIGGERED | self.game_over * SNAPSHOT_GAME_OVER | swarm * SNAPSHOT_SWARM
+        # Whether each velocity is an int or a float shows in state_hash(), so that is kept too
+        mario_flags = (m.on_ground | m.facing_right << 1 | m.is_dead << 2 | m.visible << 3
+                       | isinstance(m.vel_x, float) << 4 | isinstance(m.vel_y, float) << 5)
+        parts = [SNAPSHOT_HEADER.pack(SNAPSHOT_VERSION, self.world, self.level, flags, self.camera.camera.x,
+                                      self.score, self.coins, self.time, self.time_ticker, len(enemies)),
+                 SNAPSHOT_MARIO.pack(m.rect.x, m.rect.y, m.vel_x, m.vel_y, MARIO_STATES.index(m.state),
+                                     mario_flags, m.walk_frame, m.frame_timer)]
+        parts += [SNAPSHOT_GOOMBA.pack(*goomba) for goomba in goombas]
+        if swarm:
+            parts.append(records.tobytes())
+        return b"".join(parts)
+
+    def restore(self, data):
+        """Put the stage back into the state snapshot() packed into data."""
+        version, world, level, flags, camera_x, score, coins, time_left, time_ticker, count = SNAPSHOT_HEADER.unpack_from(data)
+        if version != SNAPSHOT_VERSION:
+            raise ValueError(f"not a version {SNAPSHOT_VERSION} snapshot")
+        if (world, level) != (self.world, self.level):
+            raise ValueError(f"snapshot is of stage {world}-{level}, not {self.world}-{self.level}")
+        self.camera.camera.x = camera_x
+        self.score, self.coins, self.time, self.time_ticker = score, coins, time_left, time_ticker
+        self.flag_triggered = bool(flags & SNAPSHOT_FLAG_TRIGGERED)
+        self.game_over = bool(flags & SNAPSHOT_GAME_OVER)
+
+        m = self.mario
+        x, y, vel_x, vel_y, state, mario_flags, m.walk_frame, m.frame_timer = SNAPSHOT_MARIO.unpack_from(data, SNAPSHOT_HEADER.size)
+        m.rect.topleft = (x, y)
+        m.vel_x = vel_x if mario_flags >> 4 & 1 else int(vel_x)
+        m.vel_y = vel_y if mario_flags >> 5 & 1 else int(vel_y)
+        m.state = MARIO_STATES[state]
+        m.on_ground, m.facing_right, m.is_dead, m.visible = (bool(mario_flags >> bit & 1) for bit in range(4))
+
+        offset = SNAPSHOT_HEADER.size + SNAPSHOT_MARIO.size
+        if flags & SNAPSHOT_SWARM:
+            records = np.frombuffer(data, SNAPSHOT_GOOMBA_DTYPE, count, offset)
+            swarm = GoombaSwarm()
+            for name in GoombaSwarm.fields:
+                setattr(swarm, name, records[name].astype(getattr(swarm, name).dtype))
+            self.enemies = swarm
+            return
+        # Reuse the goombas already on hand rather than building new sprites
+        group = not isinstance(self.enemies, GoombaSwarm)
+        spare = self.enemies.sprites() if group else []
+        goombas = []
+        records = SNAPSHOT_GOOMBA.iter_unpack(data[offset:offset + count * SNAPSHOT_GOOMBA.size])
+        for i, (x, y, vel_x, vel_y, alive, frame, frame_timer, dead_timer) in enumerate(records):
+            g = spare[i] if i < len(spare) else Goomba(x, y)
+            g.rect.topleft = (x, y)
+            g.vel_x, g.vel_y, g.is_alive = vel_x, vel_y, bool(alive)
+            g.frame, g.frame_timer, g.dead_timer = frame, frame_timer, dead_timer
+            goombas.append(g)
+        if not group or len(goombas) != len(spare):
+            self.enemies = pygame.sprite.Group(goombas)
+
+    def start_recording(self, path):
+        self.recorder = InputRecorder(self.world, self.level)
+        self.record_path = path
+
+    def stop_recording(self):
+        if self.recorder and self.recorder.frames:
+            self.recorder.save(self.record_path)
+            print(f"★ {self.recorder.frames} FRAMES RECORDED TO {self.record_path} ★")
+        self.recorder = None
+
+    def start_replay(self, path):
+        self.replay = InputReplay(path)
+        self.replay_frame = 0
+        self.world = self.replay.world
+        self.level = self.replay.level
+        self.state = "PLAYING"
+        self.reset()
+
+    def replay_step(self):
+        """Step one recorded frame; returns False once the replay has run out."""
+        replay = self.replay
+        if self.replay_frame >= replay.frames:
+            return False
+        self.step(replay.keys(self.replay_frame))
+        if not replay.check(self.replay_frame, self) and replay.desync == self.replay_frame:
+            print(f"replay desync at frame {self.replay_frame}")
+        self.replay_frame += 1
+        return True
+
+    def run_replay(self, path):
+        """Replay a recording as fast as possible; returns (seconds, frames)."""
+        self.start_replay(path)
+        start = time.perf_counter()
+        while self.replay_step():
+            pass
+        return time.perf_counter() - start, self.replay_frame
+
+    def run_headless(self, frames, world=1, level=1):
+        """Simulate frames steps with scripted input, no drawing or frame cap; returns seconds."""
+        self.world = world
+        self.level = level
+        self.state = "PLAYING"
+        self.reset()
+        start = time.perf_counter()
+        for frame in range(frames):
+            if self.game_over: self.reset()
+            self.step(scripted_inputs(frame))
+        return time.perf_counter() - start
 
     def trigger_victory(self):
         self.mario.state = "VICTORY"
         self.game_over = True
 
-    def add_pipe(self, x, height, group):
-        for h in range(height):
-            group.add(Tile(x * TILE_SIZE, SCREEN_HEIGHT - (2+h) * TILE_SIZE, "pipe"))
-        group.add(Tile(x * TILE_SIZE, SCREEN_HEIGHT - (2+height) * TILE_SIZE, "pipe_top"))
-
-    def add_castle(self, x, group):
-        for cx in range(5):
-            for cy in range(2):
-                group.add(Tile((x + cx) * TILE_SIZE, SCREEN_HEIGHT - (2+cy)*TILE_SIZE, "castle"))
-        group.add(Tile((x + 2) * TILE_SIZE, SCREEN_HEIGHT - 3*TILE_SIZE, "castle_door"))
-
-    def generate_level(self):
-        map_width = 180 + self.world * 10
-        pits = [69, 70, 86, 87, 88, 120 + self.world]
-        for x in range(map_width):
-            if x not in pits:
-                self.tiles.add(Tile(x * TILE_SIZE, SCREEN_HEIGHT - TILE_SIZE, "ground"))
-                self.tiles.add(Tile(x * TILE_SIZE, SCREEN_HEIGHT - TILE_SIZE * 2, "ground"))
-        for x in range(0, map_width, 16):
-            self.scenery.add(Decoration((x + 0) * TILE_SIZE, 0, "hill", size=2))
-            self.scenery.add(Decoration((x + 16) * TILE_SIZE, 0, "hill", size=1))
-            self.scenery.add(Decoration((x + 11) * TILE_SIZE, 0, "bush", size=2))
-            self.scenery.add(Decoration((x + 8) * TILE_SIZE, 80, "cloud", size=2))
-        self.add_pipe(28, 1, self.tiles)
-        self.add_pipe(46, 2 if self.world > 3 else 1, self.tiles)
-        structures = [(16,5,'block'),(22,5,'brick'),(22,9,'block'),(77,5,'brick'),(80,9,'brick'),(94,5,'brick')]
-        for s in structures:
-            self.tiles.add(Tile(s[0]*TILE_SIZE, SCREEN_HEIGHT-(2+s[1])*TILE_SIZE, s[2]))
-        def build_stair(start_x, height, reverse=False):
-            for i in range(height):
-                for h in range(i+1):
-                    x = start_x + (i if not reverse else height-1-i)
-                    self.tiles.add(Tile(x*TILE_SIZE, SCREEN_HEIGHT-(3+h)*TILE_SIZE, "block"))
-        build_stair(134, 4 + self.world//3)
-        build_stair(181, 8)
-        flag_x = 198
-        for i in range(1, 10):
-            self.tiles.add(Tile(flag_x * TILE_SIZE, SCREEN_HEIGHT - (2+i)*TILE_SIZE, "flagpole"))
-        self.tiles.add(Tile(flag_x * TILE_SIZE, SCREEN_HEIGHT - (2+10)*TILE_SIZE, "flag_top"))
-        self.add_castle(202, self.tiles)
-        goomba_count = 12 + self.world * 2
-        for loc in range(goomba_count):
-            self.enemies.add(Goomba((20 + loc*12) * TILE_SIZE, SCREEN_HEIGHT - TILE_SIZE * 5))
-
     def draw_menu(self):
-        self.screen.fill(BLACK)
-        super_t = self.big_font.render("SUPER", True, YELLOW)
-        mario_t = self.big_font.render("MARIO", True, MARIO_RED)
-        bros_t = self.font.render("WORLD", True, WHITE)
-        self.screen.blit(super_t, (SCREEN_WIDTH//2 - super_t.get_width()//2 - 80, 80))
-        self.screen.blit(mario_t, (SCREEN_WIDTH//2 - mario_t.get_width()//2 + 90, 150))
-        self.screen.blit(bros_t, (SCREEN_WIDTH//2 - bros_t.get_width()//2, 230))
+        """Draw the title menu; returns the screen areas that changed since last time."""
+        shown = ("MENU", self.menu_selection)
+        if self.shown == shown: return []
+        full = self.shown is None or self.shown[0] != "MENU"
+        self.shown = shown
+        options_area = pygame.Rect(0, 300, SCREEN_WIDTH, 120)
+        if full:
+            self.screen.fill(BLACK)
+            super_t = self.text.render(self.big_font, "SUPER", YELLOW)
+            mario_t = self.text.render(self.big_font, "MARIO", MARIO_RED)
+            bros_t = self.text.render(self.font, "WORLD", WHITE)
+            self.screen.blit(super_t, (SCREEN_WIDTH//2 - super_t.get_width()//2 - 80, 80))
+            self.screen.blit(mario_t, (SCREEN_WIDTH//2 - mario_t.get_width()//2 + 90, 150))
+            self.screen.blit(bros_t, (SCREEN_WIDTH//2 - bros_t.get_width()//2, 230))
+
+            # HOTKEY HINT
+            hint = self.text.render(self.font, "S/ENTER = Start   D = Debug   E = Editor   L = Saved", CREAM)
+            self.screen.blit(hint, (SCREEN_WIDTH//2 - hint.get_width()//2, 420))
+
+            copy = self.text.render(self.font, "© 1985-2026 NINTENDO / AC HOLDINGS CATSDK", CREAM)
+            self.screen.blit(copy, (SCREEN_WIDTH//2 - copy.get_width()//2, 450))
+        else:
+            self.screen.fill(BLACK, options_area)
 
         options = ["START GAME (1-1)", "DEBUG LEVEL SELECT", "MARIO MAKER EDITOR"]
         for i, txt in enumerate(options):
             color = YELLOW if i == self.menu_selection else WHITE
-            t = self.font.render(txt, True, color)
+            t = self.text.render(self.font, txt, color)
             self.screen.blit(t, (SCREEN_WIDTH//2 - t.get_width()//2, 300 + i*40))
-
-        # HOTKEY HINT
-        hint = self.font.render("S/ENTER = Start   D = Debug   E = Editor", True, CREAM)
-        self.screen.blit(hint, (SCREEN_WIDTH//2 - hint.get_width()//2, 420))
-
-        copy = self.font.render("© 1985-2026 NINTENDO / AC HOLDINGS CATSDK", True, CREAM)
-        self.screen.blit(copy, (SCREEN_WIDTH//2 - copy.get_width()//2, 450))
+        return [self.screen.get_rect() if full else options_area]
 
     def draw_debug_menu(self):
-        self.screen.fill(BLACK)
-        title = self.big_font.render("DEBUG SELECT", True, YELLOW)
-        self.screen.blit(title, (SCREEN_WIDTH//2 - title.get_width()//2, 80))
-        wtxt = self.font.render(f"WORLD: {self.debug_world}   LEVEL: {self.debug_level}", True, WHITE)
+        """Draw the level select; returns the screen areas that changed since last time."""
+        shown = ("DEBUG_MENU", self.debug_world, self.debug_level)
+        if self.shown == shown: return []
+        full = self.shown is None or self.shown[0] != "DEBUG_MENU"
+        self.shown = shown
+        choice_area = pygame.Rect(0, 200, SCREEN_WIDTH, 40)
+        if full:
+            self.screen.fill(BLACK)
+            title = self.text.render(self.big_font, "DEBUG SELECT", YELLOW)
+            self.screen.blit(title, (SCREEN_WIDTH//2 - title.get_width()//2, 80))
+            hint = self.text.render(self.font, "↑↓ world   ←→ level   ENTER play   ESC back", CREAM)
+            self.screen.blit(hint, (SCREEN_WIDTH//2 - hint.get_width()//2, 300))
+        else:
+            self.screen.fill(BLACK, choice_area)
+        wtxt = self.text.render(self.font, f"WORLD: {self.debug_world}   LEVEL: {self.debug_level}", WHITE)
         self.screen.blit(wtxt, (SCREEN_WIDTH//2 - wtxt.get_width()//2, 200))
-        hint = self.font.render("↑↓ world   ←→ level   ENTER play   ESC back", True, CREAM)
-        self.screen.blit(hint, (SCREEN_WIDTH//2 - hint.get_width()//2, 300))
+        return [self.screen.get_rect() if full else choice_area]
 
     def draw_editor(self):
         self.screen.fill(SKY_BLUE)
@@ -469,18 +1499,118 @@ class Game:
             tile.draw(self.screen, self.editor_camera)
         for enemy in self.editor_enemies:
             enemy.draw(self.screen, self.editor_camera)
-        tool_txt = self.font.render(f"TOOL: {self.current_tool.upper()}", True, WHITE)
+        tool_txt = self.text.render(self.font, f"TOOL: {self.current_tool.upper()}", WHITE)
         self.screen.blit(tool_txt, (10, 10))
         pygame.draw.rect(self.screen, TOOL_COLORS[self.current_tool], (10, 50, 40, 40))
-        hint = self.font.render("1-5 = tools   LEFT/RIGHT mouse = place/erase   SPACE = test play   S = save   ESC = menu", True, CREAM)
+        hint = self.text.render(self.font, "1-5 = tools   LEFT/RIGHT mouse = place/erase   SPACE = test play   S = save   L = load   ESC = menu", CREAM)
         self.screen.blit(hint, (10, SCREEN_HEIGHT - 30))
 
+    def draw(self):
+        profiler = self.profiler
+        self.screen.fill(SKY_BLUE)
+        self.scenery.draw(self.screen, self.camera)
+        profiler.lap("scenery")
+        for tile in self.tiles:
+            tile.draw(self.screen, self.camera)
+        profiler.lap("tiles")
+        if isinstance(self.enemies, GoombaSwarm):
+            self.enemies.draw(self.screen, self.camera)
+        else:
+            for enemy in self.enemies:
+                enemy.draw(self.screen, self.camera)
+        self.mario.draw(self.screen, self.camera)
+        profiler.lap("entities")
+        self.draw_hud()
+        if self.game_over:
+            if self.mario.state == "VICTORY":
+                txt = self.text.render(self.font, "COURSE CLEAR!", WHITE)
+                self.screen.blit(txt, (SCREEN_WIDTH//2 - txt.get_width()//2, SCREEN_HEIGHT//3))
+                sub = self.text.render(self.font, f"WORLD {self.world}-{self.level} COMPLETE", YELLOW)
+                self.screen.blit(sub, (SCREEN_WIDTH//2 - sub.get_width()//2, SCREEN_HEIGHT//2))
+                sub2 = self.text.render(self.font, "Press R for next / ESC menu", WHITE)
+                self.screen.blit(sub2, (SCREEN_WIDTH//2 - sub2.get_width()//2, SCREEN_HEIGHT//2 + 60))
+            else:
+                txt = self.text.render(self.font, "GAME OVER", WHITE)
+                sub = self.text.render(self.font, "Press R to Restart", WHITE)
+                self.screen.blit(txt, (SCREEN_WIDTH//2 - txt.get_width()//2, SCREEN_HEIGHT//3))
+                self.screen.blit(sub, (SCREEN_WIDTH//2 - sub.get_width()//2, SCREEN_HEIGHT//2))
+        profiler.lap("hud")
+
+    def advance(self):
+        """One fixed PLAYING step: replayed keys, else the keyboard (recorded if recording)."""
+        if self.replay:
+            if not self.replay_step():
+                print(f"replay finished: {self.replay_frame} frames, "
+                      + ("in sync" if self.replay.desync is None else f"desync at frame {self.replay.desync}"))
+                self.replay = None
+        else:
+            keys = pygame.key.get_pressed()
+            if keys[pygame.K_BACKSPACE]:
+                # A recording can't reproduce a jump back in time
+                self.stop_recording()
+                self.rewind.step_back(self)
+            elif not self.game_over:
+                self.rewind.record(self)
+                self.step(keys)
+                if self.recorder:
+                    self.recorder.record(keys, self)
+                    if self.game_over: self.stop_recording()
+
+    def motion_snapshot(self):
+        """Where everything that moves is, taken before each step for draw_interpolated()."""
+        rects = [self.camera.camera, self.mario.rect]
+        if isinstance(self.enemies, GoombaSwarm):
+            return [(rect, rect.x, rect.y) for rect in rects], (self.enemies, self.enemies.x.copy(), self.enemies.y.copy())
+        rects += [e.rect for e in self.enemies]
+        return [(rect, rect.x, rect.y) for rect in rects], None
+
+    def draw_interpolated(self, previous, alpha):
+        """draw() with movers placed alpha of the way from their previous to their current spot."""
+        moved, swarm = previous
+        current = [(rect, rect.x, rect.y) for rect, _, _ in moved]
+        for rect, x, y in moved:
+            rect.topleft = (round(x + (rect.x - x) * alpha), round(y + (rect.y - y) * alpha))
+        if swarm and len(swarm[0]) == len(swarm[1]):
+            enemies, x, y = swarm
+            swarm_now = enemies.x, enemies.y
+            enemies.x = np.round(x + (enemies.x - x) * alpha).astype(np.int64)
+            enemies.y = np.round(y + (enemies.y - y) * alpha).astype(np.int64)
+        else:
+            swarm = None
+        try:
+            self.draw()
+        finally:
+            for rect, x, y in current:
+                rect.topleft = (x, y)
+            if swarm:
+                swarm[0].x, swarm[0].y = swarm_now
+
     def run(self):
+        # Fixed FPS simulation: each drawn frame runs however many steps real time
+        # calls for (at most MAX_FRAME_SKIP), then draws between the last two.
+        lag = 0.0
+        previous = self.motion_snapshot()
+        fps = RENDER_FPS
+        profiler = self.profiler
         while True:
+            lag += min(self.clock.tick(fps) / 1000, FRAME_TIME * MAX_FRAME_SKIP)
+            profiler.lap("wait")
+            profiler.end_frame()
             for event in pygame.event.get():
                 if event.type == pygame.QUIT:
+                    self.stop_recording()
+                    if profiler.log: profiler.toggle_log()
                     pygame.quit()
                     sys.exit()
+                if event.type == pygame.WINDOWEXPOSED:
+                    self.shown = None
+                if event.type == pygame.KEYDOWN and event.key == pygame.K_F3:
+                    profiler.overlay = not profiler.overlay
+                if event.type == pygame.KEYDOWN and event.key == pygame.K_F4:
+                    if profiler.toggle_log():
+                        print(f"★ FRAME LOG WRITING TO {PROFILE_LOG_PATH} ★")
+                    else:
+                        print(f"★ FRAME LOG {'NOT OPENED: ' + str(profiler.log_error) if profiler.log_error else 'CLOSED'} ★")
 
                 if event.type == pygame.KEYDOWN:
                     if self.state == "MENU":
@@ -491,8 +1621,17 @@ class Game:
                         if event.key in (pygame.K_RETURN, pygame.K_SPACE, pygame.K_s):
                             self.world = 1
                             self.level = 1
+                            self.level_file = None
                             self.state = "PLAYING"
                             self.reset()
+                        if event.key == pygame.K_l and os.path.exists(EDITOR_LEVEL_PATH):
+                            self.level_file = EDITOR_LEVEL_PATH
+                            try:
+                                self.reset()
+                                self.state = "PLAYING"
+                            except (OSError, ValueError) as error:
+                                self.level_file = None
+                                print(f"★ LEVEL NOT LOADED: {error} ★")
                         if event.key == pygame.K_d:
                             self.state = "DEBUG_MENU"
                         if event.key == pygame.K_e:
@@ -504,6 +1643,7 @@ class Game:
                                 self.editor_tiles.add(Tile(x * TILE_SIZE, SCREEN_HEIGHT - TILE_SIZE, "ground"))
                             for x in range(25):
                                 self.editor_tiles.add(Tile(x * TILE_SIZE, SCREEN_HEIGHT - TILE_SIZE*2, "ground"))
+                            self.editor_grid = TileGrid(self.editor_tiles)
 
                     elif self.state == "DEBUG_MENU":
                         if event.key == pygame.K_UP:
@@ -517,6 +1657,7 @@ class Game:
                         if event.key in (pygame.K_RETURN, pygame.K_SPACE):
                             self.world = self.debug_world
                             self.level = self.debug_level
+                            self.level_file = None
                             self.state = "PLAYING"
                             self.reset()
                         if event.key == pygame.K_ESCAPE:
@@ -533,21 +1674,52 @@ class Game:
                         if event.key == pygame.K_SPACE:  # TEST PLAY
                             self.world = 99
                             self.level = 1
-                            self.tiles = self.editor_tiles.copy()
-                            self.enemies = self.editor_enemies.copy()
+                            self.level_file = None
                             self.state = "PLAYING"
                             self.reset()
-                            self.tiles.empty()
-                            self.enemies.empty()
-                            for t in self.editor_tiles: self.tiles.add(t)
-                            for e in self.editor_enemies: self.enemies.add(e)
+                            self.tiles = list(self.editor_tiles)
+                            self.enemies = pygame.sprite.Group(self.editor_enemies.sprites())
+                            self.tile_grid = self.editor_grid.copy()
+                            self.pack_enemies()
                         if event.key == pygame.K_s:
-                            self.saved_level = (list(self.editor_tiles), list(self.editor_enemies))
-                            print("★ LEVEL SAVED TO MEMORY ★")
+                            try:
+                                size = save_level_file(EDITOR_LEVEL_PATH, self.editor_tiles, self.editor_enemies)
+                            except OSError as error:
+                                print(f"★ LEVEL NOT SAVED: {error} ★")
+                            else:
+                                self.saved_level = EDITOR_LEVEL_PATH
+                                print(f"★ LEVEL SAVED TO {EDITOR_LEVEL_PATH} ({size} bytes) ★")
+                        if event.key == pygame.K_l and os.path.exists(EDITOR_LEVEL_PATH):
+                            try:
+                                tiles, enemies = read_level_file(EDITOR_LEVEL_PATH)
+                            except (OSError, ValueError) as error:
+                                print(f"★ LEVEL NOT LOADED: {error} ★")
+                            else:
+                                self.editor_tiles.empty()
+                                self.editor_enemies.empty()
+                                for x, y, kind in tiles:
+                                    self.editor_tiles.add(Tile(x, y, kind))
+                                for x, y in enemies:
+                                    self.editor_enemies.add(Goomba(x, y))
+                                self.editor_grid = TileGrid(self.editor_tiles)
+                                print(f"★ LEVEL LOADED FROM {EDITOR_LEVEL_PATH} ★")
 
                     if event.key == pygame.K_r and self.state == "PLAYING":
+                        self.stop_recording()
+                        self.replay = None
                         self.state = "PLAYING"
                         self.reset()
+                    if event.key == pygame.K_F5 and self.state == "PLAYING":
+                        self.checkpoint = self.snapshot()
+                        print(f"★ CHECKPOINT SAVED ({len(self.checkpoint)} bytes) ★")
+                    if event.key == pygame.K_F9 and self.state == "PLAYING" and self.checkpoint:
+                        # A recording can't reproduce a jump back in time
+                        self.stop_recording()
+                        self.replay = None
+                        try:
+                            self.restore(self.checkpoint)
+                        except ValueError as error:
+                            print(f"★ CHECKPOINT NOT LOADED: {error} ★")
 
                 if event.type == pygame.MOUSEBUTTONDOWN and self.state == "EDITOR":
                     mx, my = pygame.mouse.get_pos()
@@ -561,74 +1733,53 @@ class Game:
                         else:
                             new_tile = Tile(grid_x, grid_y, self.current_tool)
                             self.editor_tiles.add(new_tile)
+                            self.editor_grid.add(new_tile)
                     elif event.button == 3:
-                        for t in list(self.editor_tiles):
+                        for t in self.editor_grid.query(pygame.Rect(world_x, world_y, 1, 1)):
                             if t.rect.collidepoint(world_x, world_y):
                                 t.kill()
+                                self.editor_grid.remove(t)
                         for e in list(self.editor_enemies):
                             if e.rect.collidepoint(world_x, world_y):
                                 e.kill()
+            profiler.lap("input")
 
-            if self.state == "PLAYING":
-                if not self.game_over:
-                    self.mario.update(self.tiles, self.enemies, self)
-                    self.enemies.update(self.tiles)
-                    self.camera.update(self.mario)
-                    if self.mario.state == "SLIDE" and not self.flag_triggered:
-                        self.flag_triggered = True
-                        self.enemies.empty()
-                    if self.mario.state == "DEAD" and self.mario.rect.y > SCREEN_HEIGHT + 100:
-                        self.game_over = True
-                    if self.mario.state == "VICTORY":
-                        self.game_over = True
-                    if self.mario.state not in ["DEAD", "VICTORY"]:
-                        self.time_ticker += 1
-                        if self.time_ticker >= 60:
-                            self.time -= 1
-                            self.time_ticker = 0
-                            if self.time <= 0:
-                                self.mario.die()
+            if self.state != "PLAYING":
+                lag = 0.0
+            steps = 0
+            while lag >= FRAME_TIME and steps < MAX_FRAME_SKIP:
+                previous = self.motion_snapshot()
+                self.advance()
+                lag -= FRAME_TIME
+                steps += 1
+            profiler.lap("sim")
 
+            # Menus are static between key presses: update only what changed, and idle
+            fps = IDLE_FPS
             if self.state == "MENU":
-                self.draw_menu()
+                pygame.display.update(self.draw_menu())
             elif self.state == "DEBUG_MENU":
-                self.draw_debug_menu()
-            elif self.state == "EDITOR":
-                self.draw_editor()
+                pygame.display.update(self.draw_debug_menu())
             else:
-                self.screen.fill(SKY_BLUE)
-                for decor in self.scenery:
-                    decor.draw(self.screen, self.camera)
-                for tile in self.tiles:
-                    tile.draw(self.screen, self.camera)
-                for enemy in self.enemies:
-                    enemy.draw(self.screen, self.camera)
-                self.mario.draw(self.screen, self.camera)
-                self.draw_hud()
-                if self.game_over:
-                    if self.mario.state == "VICTORY":
-                        txt = self.font.render("COURSE CLEAR!", True, WHITE)
-                        self.screen.blit(txt, (SCREEN_WIDTH//2 - txt.get_width()//2, SCREEN_HEIGHT//3))
-                        sub = self.font.render(f"WORLD {self.world}-{self.level} COMPLETE", True, YELLOW)
-                        self.screen.blit(sub, (SCREEN_WIDTH//2 - sub.get_width()//2, SCREEN_HEIGHT//2))
-                        sub2 = self.font.render("Press R for next / ESC menu", True, WHITE)
-                        self.screen.blit(sub2, (SCREEN_WIDTH//2 - sub2.get_width()//2, SCREEN_HEIGHT//2 + 60))
-                    else:
-                        txt = self.font.render("GAME OVER", True, WHITE)
-                        sub = self.font.render("Press R to Restart", True, WHITE)
-                        self.screen.blit(txt, (SCREEN_WIDTH//2 - txt.get_width()//2, SCREEN_HEIGHT//3))
-                        self.screen.blit(sub, (SCREEN_WIDTH//2 - sub.get_width()//2, SCREEN_HEIGHT//2))
-
-            pygame.display.flip()
-            self.clock.tick(FPS)
+                self.shown = None
+                fps = RENDER_FPS
+                if self.state == "EDITOR":
+                    self.draw_editor()
+                    profiler.lap("tiles")
+                else:
+                    self.draw_interpolated(previous, lag / FRAME_TIME)
+                profiler.draw(self.screen)
+                profiler.lap("profiler")
+                pygame.display.flip()
+            profiler.lap("flip")
 
     def draw_hud(self):
-        mario_lbl = self.font.render("MARIO", True, WHITE)
-        world_lbl = self.font.render("WORLD", True, WHITE)
-        time_lbl = self.font.render("TIME", True, WHITE)
-        score_val = self.font.render(f"{self.score:06d}", True, WHITE)
-        world_val = self.font.render(f"{self.world}-{self.level}", True, WHITE)
-        time_val = self.font.render(f"{self.time:03d}", True, WHITE)
+        mario_lbl = self.text.render(self.font, "MARIO", WHITE)
+        world_lbl = self.text.render(self.font, "WORLD", WHITE)
+        time_lbl = self.text.render(self.font, "TIME", WHITE)
+        score_val = self.text.render(self.font, f"{self.score:06d}", WHITE)
+        world_val = self.text.render(self.font, f"{self.world}-{self.level}", WHITE)
+        time_val = self.text.render(self.font, f"{self.time:03d}", WHITE)
         self.screen.blit(mario_lbl, (40, 20))
         self.screen.blit(score_val, (40, 45))
         self.screen.blit(world_lbl, (480, 20))
@@ -636,6 +1787,186 @@ class Game:
         self.screen.blit(time_lbl, (680, 20))
         self.screen.blit(time_val, (690, 45))
 
+def agent_inputs(seed, game):
+    """Seeded runner: holds RIGHT and jumps at walls, pits and goombas ahead.
+
+    The seed picks how far ahead it looks, how long it holds a jump and how
+    often it hops for no reason, so different seeds take different lines.
+    """
+    rng = random.Random(seed)
+    reach = rng.randint(24, 72)
+    hold = rng.randint(10, 26)
+    whim = rng.uniform(0, 0.03)
+    jump_end = 0
+    def solid_at(rect):
+        return any(TILE_COLLISION[tile.type] == SOLID and rect.colliderect(tile.rect)
+                   for tile in game.tile_grid.query(rect))
+    def keys(frame):
+        nonlocal jump_end
+        mario = game.mario.rect
+        if frame >= jump_end + 2:
+            wall = solid_at(pygame.Rect(mario.right, mario.top, reach, mario.height - 1))
+            pit = not solid_at(pygame.Rect(mario.right + reach, mario.bottom, 4, TILE_SIZE * 3))
+            goomba = any(e.is_alive and 0 <= e.rect.left - mario.right <= reach * 2 and abs(e.rect.y - mario.y) < TILE_SIZE * 2
+                         for e in game.enemies)
+            if wall or pit or goomba or rng.random() < whim:
+                jump_end = frame + hold
+        return InputState({pygame.K_RIGHT: True, pygame.K_SPACE: frame < jump_end})
+    return keys
+
+def rollout_inputs(script, game):
+    """Key source for a rollout: "scripted", "agent:SEED" or the path of a replay file."""
+    if script == "scripted":
+        return scripted_inputs
+    if script.startswith("agent:"):
+        return agent_inputs(int(script[len("agent:"):]), game)
+    replay = InputReplay(script)
+    return lambda frame: replay.keys(frame) if frame < replay.frames else InputState()
+
+_rollout_game = None
+
+def rollout(task):
+    """Play one (world, level, level_file, script) task headless; returns its outcome."""
+    global _rollout_game
+    world, level, level_file, script = task
+    if _rollout_game is None:
+        _rollout_game = Game(headless=True)
+    game = _rollout_game
+    game.world, game.level, game.level_file = world, level, level_file
+    game.state = "PLAYING"
+    game.reset()
+    keys = rollout_inputs(script, game)
+    start = time.perf_counter()
+    frame = furthest = furthest_frame = 0
+    while frame < ROLLOUT_MAX_FRAMES and not game.game_over:
+        game.step(keys(frame))
+        frame += 1
+        if game.mario.rect.y > SCREEN_HEIGHT + 100:
+            break
+        if game.mario.rect.x > furthest:
+            furthest, furthest_frame = game.mario.rect.x, frame
+        elif frame - furthest_frame >= ROLLOUT_STALL_FRAMES:
+            break
+    mario = game.mario
+    return {"world": world, "level": level, "level_file": level_file, "script": script,
+            "cleared": mario.state == "VICTORY", "died_at": mario.rect.x if mario.is_dead else None,
+            "stalled": not game.game_over and frame < ROLLOUT_MAX_FRAMES and mario.rect.y <= SCREEN_HEIGHT + 100,
+            "fell_out": not game.game_over and mario.rect.y > SCREEN_HEIGHT + 100,
+            "x": mario.rect.x, "time_left": game.time, "frames": frame,
+            "seconds": round(time.perf_counter() - start, 4)}
+
+def rollout_worker_init():
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+def run_rollouts(tasks, workers=None):
+    """rollout() every task on a multiprocessing pool; results come back in task order."""
+    if workers == 1:
+        rollout_worker_init()
+        return [rollout(task) for task in tasks]
+    # SDL turns SIGTERM into a QUIT event, so the workers are closed, not terminated
+    pool = multiprocessing.Pool(workers, initializer=rollout_worker_init)
+    try:
+        return pool.map(rollout, tasks, chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
+
+def verify_levels(level_files=(), agents=ROLLOUT_AGENTS, workers=None):
+    """Try all 32 stages and the given level files with the scripted run and agent seeds.
+
+    Returns (results, stages) where stages maps each stage label to whether
+    any of its rollouts cleared it.
+    """
+    scripts = ["scripted"] + [f"agent:{seed}" for seed in range(agents)]
+    stages = [(world, level, None) for world in range(1, 9) for level in range(1, 5)]
+    stages += [(1, 1, path) for path in level_files]
+    tasks = [stage + (script,) for stage in stages for script in scripts]
+    results = run_rollouts(tasks, workers)
+    cleared = {}
+    for result in results:
+        label = result["level_file"] or f"{result['world']}-{result['level']}"
+        cleared[label] = cleared.get(label, False) or result["cleared"]
+    return results, cleared
+
 if __name__ == "__main__":
-    game = Game()
-    game.run()
+    parser = argparse.ArgumentParser(description="ULTRA Mario World v3")
+    parser.add_argument("--headless", action="store_true", help="simulate without a window or frame limiter")
+    parser.add_argument("--frames", type=int, default=3600, help="frames to simulate in headless mode")
+    parser.add_argument("--world", type=int, default=1)
+    parser.add_argument("--level", type=int, default=1)
+    parser.add_argument("--level-file", help="play a level saved from the editor")
+    parser.add_argument("--enemy-swarm", choices=("auto", "on", "off"), default="auto",
+                        help=f"NumPy goomba physics: auto uses it from {SWARM_MIN_ENEMIES} goombas up")
+    parser.add_argument("--record", metavar="PATH", help="record the inputs of the windowed run to PATH")
+    parser.add_argument("--replay", metavar="PATH", help="play back a recording and check its state hashes")
+    parser.add_argument("--profile-log", action="store_true",
+                        help=f"log per-frame section timings to {PROFILE_LOG_PATH} from the start (F4 toggles)")
+    parser.add_argument("--verify-levels", nargs="*", metavar="LEVEL_FILE",
+                        help="play every stage, plus these level files, headless in parallel and report which clear")
+    parser.add_argument("--agents", type=int, default=ROLLOUT_AGENTS, help="random agent seeds per stage when verifying")
+    parser.add_argument("--workers", type=int, help="verification processes (default: one per CPU)")
+    parser.add_argument("--report", metavar="PATH", help="write every verification rollout to PATH as JSON")
+    parser.add_argument("--precompile-levels", action="store_true",
+                        help=f"compile all 32 stages into {LEVEL_CACHE_DIR}/ and exit")
+    parser.add_argument("--level-cache", action="store_true",
+                        help=f"read and write compiled stages in {LEVEL_CACHE_DIR}/ (see --precompile-levels)")
+    args = parser.parse_args()
+    if args.verify_levels is not None:
+        start = time.perf_counter()
+        results, cleared = verify_levels(args.verify_levels, args.agents, args.workers)
+        elapsed = time.perf_counter() - start
+        for label, ok in cleared.items():
+            runs = [r for r in results if (r["level_file"] or f"{r['world']}-{r['level']}") == label]
+            best = max(runs, key=lambda r: (r["cleared"], r["time_left"] if r["cleared"] else r["x"]))
+            detail = f"time left {best['time_left']}" if ok else f"furthest x {best['x']}"
+            print(f"{label:>20}  {'CLEARED' if ok else 'FAILED ':7}  {sum(r['cleared'] for r in runs)}/{len(runs)} runs  {detail}")
+        frames = sum(r["frames"] for r in results)
+        print(f"{len(results)} rollouts, {frames} frames in {elapsed:.2f}s; "
+              f"{sum(cleared.values())}/{len(cleared)} stages cleared")
+        if args.report:
+            with open(args.report, "w") as f:
+                json.dump({"stages": cleared, "results": results}, f, indent=2)
+        sys.exit(not all(cleared.values()))
+    elif args.precompile_levels:
+        cache = LevelCache(LEVEL_CACHE_DIR)
+        start = time.perf_counter()
+        for world in range(1, 9):
+            cache.get(world, 1)
+        print(f"32 stages compiled in {time.perf_counter() - start:.3f}s")
+    elif args.headless and args.replay:
+        game = Game(headless=True)
+        game.level_file = args.level_file
+        game.enemy_swarm = args.enemy_swarm
+        elapsed, frames = game.run_replay(args.replay)
+        desync = game.replay.desync
+        print(f"{frames} frames in {elapsed:.3f}s = {frames / elapsed:.0f} steps/s, "
+              + ("in sync" if desync is None else f"DESYNC at frame {desync}"))
+        pygame.quit()
+        sys.exit(desync is not None)
+    elif args.headless:
+        game = Game(headless=True)
+        game.level_file = args.level_file
+        game.enemy_swarm = args.enemy_swarm
+        elapsed = game.run_headless(args.frames, args.world, args.level)
+        print(f"{args.frames} frames in {elapsed:.3f}s = {args.frames / elapsed:.0f} steps/s (WORLD {args.world}-{args.level})")
+        pygame.quit()
+    else:
+        game = Game()
+        game.world = args.world
+        game.level = args.level
+        game.level_file = args.level_file
+        game.enemy_swarm = args.enemy_swarm
+        if args.level_cache:
+            game.level_cache = LevelCache(LEVEL_CACHE_DIR)
+        if args.replay:
+            game.start_replay(args.replay)
+        elif args.level_file or args.record:
+            game.state = "PLAYING"
+            game.reset()
+        if args.record:
+            game.start_recording(args.record)
+        if args.profile_log:
+            if not game.profiler.toggle_log():
+                print(f"★ FRAME LOG NOT OPENED: {game.profiler.log_error} ★")
+        game.run()
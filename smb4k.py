@@ -1,5 +1,14 @@
+import multiprocessing
+import os
 import pygame
 import sys
+import time
+from collections import OrderedDict, deque
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 # ============================================================================
 #  Super Mario Python 1-1 (Procedural / No Assets)
@@ -10,6 +19,14 @@ import sys
 SCREEN_WIDTH = 800
 SCREEN_HEIGHT = 480
 FPS = 60
+RENDER_FPS = 60      # draw rate cap; the simulation always steps at FPS
+FRAME_TIME = 1 / FPS
+MAX_FRAME_SKIP = 5   # simulation steps per drawn frame before the game slows down
+# Frame profiler: F3 toggles the overlay, F4 the per-frame CSV log
+PROFILE_SECTIONS = ("input", "sim", "mario", "enemies", "camera", "scenery", "tiles", "entities",
+                    "hud", "profiler", "flip", "wait")
+PROFILE_WINDOW = 120  # frames behind the overlay's averages, p99 and graph
+PROFILE_LOG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "frame_profile.csv")
 TILE_SIZE = 32
 
 # Physics
@@ -36,8 +53,36 @@ CASTLE_BRICK = (128, 0, 0)
 BLACK = (0, 0, 0)
 WHITE = (255, 255, 255)
 
+# Collision classes: SOLID blocks everything, PASSTHROUGH is scenery, touching
+# a TRIGGER starts the flag slide and a VICTORY tile ends the level
+SOLID, PASSTHROUGH, TRIGGER, VICTORY = range(4)
+
+# Tile kinds: Tile.kind indexes these per-kind tables. Static SOLID tiles
+# get merged into large collision rectangles.
+TILE_KINDS =     ("ground", "brick", "block", "pipe", "pipe_top", "flagpole", "flag_top",  "castle",    "castle_door")
+TILE_COLLISION = (SOLID,    SOLID,   SOLID,   SOLID,  SOLID,      TRIGGER,    PASSTHROUGH, PASSTHROUGH, VICTORY)
+TILE_KIND_IDS = {name: kind for kind, name in enumerate(TILE_KINDS)}
+
+# Vector environment (VectorEnv): agents pick one of ACTIONS per step and see
+# an OBS_ROWS x OBS_COLS window of cell codes around Mario plus OBS_FEATURES
+# numbers describing Mario and the OBS_ENEMIES nearest live goombas
+ACTIONS = ((), ("right",), ("right", "jump"), ("jump",), ("left",), ("left", "jump"))
+OBS_EMPTY, OBS_SOLID, OBS_GOAL, OBS_ENEMY = range(4)
+OBS_ROWS = SCREEN_HEIGHT // TILE_SIZE
+OBS_COLS = 16
+OBS_BEHIND = 4       # of the OBS_COLS columns, how many are left of Mario's
+OBS_ENEMIES = 4
+OBS_FEATURES = 6 + 4 * OBS_ENEMIES
+REWARD_CLEAR = 10.0  # on top of 1 per tile of progress to the right
+REWARD_DEATH = -10.0
+
 # --- ENGINE CLASSES ---
 
+class InputState(dict):
+    """Held keys, indexed like pygame.key.get_pressed(); unlisted keys read False."""
+    def __missing__(self, key):
+        return False
+
 class Camera:
     def __init__(self, width, height):
         self.camera = pygame.Rect(0, 0, width, height)
@@ -76,7 +121,7 @@ class Mario(Entity):
         self.state = "IDLE"
         self.visible = True
 
-    def update(self, tiles, enemies, game_ref):
+    def update(self, level, enemies, game_ref, keys):
         if self.state == "VICTORY" or not self.visible:
             return
 
@@ -85,11 +130,9 @@ class Mario(Entity):
             self.vel_y = 3
             self.rect.y += self.vel_y
             hit_ground = False
-            for tile in tiles:
-                if tile.type in ["flagpole", "castle", "castle_door", "flag_top"]:
-                    continue
-                if self.rect.colliderect(tile.rect):
-                    self.rect.bottom = tile.rect.top
+            for solid in level.solids:
+                if self.rect.colliderect(solid):
+                    self.rect.bottom = solid.top
                     hit_ground = True
             if hit_ground:
                 # Hop off pole
@@ -107,16 +150,15 @@ class Mario(Entity):
             self.rect.y += self.vel_y
             
             # Check collisions with ground only
-            for tile in tiles:
-                if tile.type not in ["castle_door", "castle", "flagpole", "flag_top"]:
-                    if self.rect.colliderect(tile.rect):
-                        if self.vel_y > 0:
-                            self.rect.bottom = tile.rect.top
-                            self.vel_y = 0
+            for solid in level.solids:
+                if self.rect.colliderect(solid):
+                    if self.vel_y > 0:
+                        self.rect.bottom = solid.top
+                        self.vel_y = 0
 
             # Check collision with castle door
-            for tile in tiles:
-                if tile.type == "castle_door":
+            for tile in level.tiles:
+                if TILE_COLLISION[tile.kind] == VICTORY:
                     if self.rect.colliderect(tile.rect):
                         self.visible = False # Disappear into castle
                         game_ref.trigger_victory()
@@ -130,7 +172,6 @@ class Mario(Entity):
             return
 
         # Input Handling
-        keys = pygame.key.get_pressed()
         if keys[pygame.K_LEFT]:
             self.vel_x -= ACCEL
             self.facing_right = False
@@ -151,13 +192,11 @@ class Mario(Entity):
         self.vel_y += GRAVITY
 
         # X Movement & Collision
-        self.rect.x += self.vel_x
-        self.collide(tiles, "x")
+        self.collide(level, "x")
 
         # Y Movement & Collision
-        self.rect.y += self.vel_y
         self.on_ground = False
-        self.collide(tiles, "y")
+        self.collide(level, "y")
 
         # Enemy Interaction
         hit_list = pygame.sprite.spritecollide(self, enemies, False)
@@ -175,32 +214,44 @@ class Mario(Entity):
         if self.rect.y > SCREEN_HEIGHT:
             self.die()
 
-    def collide(self, tiles, direction):
-        for tile in tiles:
-            if self.rect.colliderect(tile.rect):
-                if tile.type == "flagpole":
-                    self.start_flag_sequence(tile)
-                    return
-                elif tile.type == "castle":
-                    continue # Non-solid background object
-                elif tile.type == "castle_door":
-                    continue 
-
-                if direction == "x":
-                    if self.vel_x > 0:
-                        self.rect.right = tile.rect.left
-                        self.vel_x = 0
-                    elif self.vel_x < 0:
-                        self.rect.left = tile.rect.right
-                        self.vel_x = 0
-                if direction == "y":
-                    if self.vel_y > 0:
-                        self.rect.bottom = tile.rect.top
-                        self.vel_y = 0
-                        self.on_ground = True
-                    elif self.vel_y < 0:
-                        self.rect.top = tile.rect.bottom
-                        self.vel_y = 0
+    def collide(self, level, direction):
+        # Swept along one axis: everything between the old and the new rect is
+        # checked, so no speed or timestep carries Mario through a solid
+        start = self.rect.copy()
+        if direction == "x":
+            self.rect.x += self.vel_x
+        else:
+            self.rect.y += self.vel_y
+        path = start.union(self.rect)
+        solids = path.collidelistall(level.solids)
+        if solids:
+            self.push_out([level.solids[i] for i in solids], direction)
+        # Only the clipped path reaches the pole. Its base block stops Mario flush
+        # against the pole, so a pole touching the leading edge counts as hit
+        path = start.union(self.rect)
+        path = path.inflate(2, 0) if direction == "x" else path.inflate(0, 2)
+        for tile in level.tiles:
+            if TILE_COLLISION[tile.kind] == TRIGGER and path.colliderect(tile.rect):
+                self.start_flag_sequence(tile)
+                return
+
+    def push_out(self, solids, direction):
+        # The nearest solid along the direction of travel stops Mario
+        if direction == "x":
+            if self.vel_x > 0:
+                self.rect.right = min(solid.left for solid in solids)
+                self.vel_x = 0
+            elif self.vel_x < 0:
+                self.rect.left = max(solid.right for solid in solids)
+                self.vel_x = 0
+        if direction == "y":
+            if self.vel_y > 0:
+                self.rect.bottom = min(solid.top for solid in solids)
+                self.vel_y = 0
+                self.on_ground = True
+            elif self.vel_y < 0:
+                self.rect.top = max(solid.bottom for solid in solids)
+                self.vel_y = 0
 
     def start_flag_sequence(self, pole):
         self.state = "SLIDE"
@@ -244,31 +295,38 @@ class Goomba(Entity):
         self.vel_x = -1
         self.is_alive = True
 
-    def update(self, tiles):
+    def update(self, level):
         if not self.is_alive: return
 
         self.vel_y += GRAVITY
         
         # Move X
         self.rect.x += self.vel_x
-        for tile in tiles:
-            if tile.type in ["castle", "flagpole", "flag_top", "castle_door"]: continue
-            if self.rect.colliderect(tile.rect):
-                if self.vel_x > 0:
-                    self.rect.right = tile.rect.left
-                    self.vel_x = -1
-                elif self.vel_x < 0:
-                    self.rect.left = tile.rect.right
-                    self.vel_x = 1
+        for solid in self.hits(level.solids):
+            if self.vel_x > 0:
+                self.rect.right = solid.left
+                self.vel_x = -1
+            elif self.vel_x < 0:
+                self.rect.left = solid.right
+                self.vel_x = 1
 
         # Move Y
         self.rect.y += self.vel_y
-        for tile in tiles:
-            if tile.type in ["castle", "flagpole", "flag_top", "castle_door"]: continue
-            if self.rect.colliderect(tile.rect):
-                if self.vel_y > 0:
-                    self.rect.bottom = tile.rect.top
-                    self.vel_y = 0
+        for solid in self.hits(level.solids):
+            if self.vel_y > 0:
+                self.rect.bottom = solid.top
+                self.vel_y = 0
+
+    def hits(self, solids):
+        # The solids the rect overlaps, in list order, each tested after the
+        # previous one has pushed it; collidelist does the scanning in C
+        start = 0
+        while True:
+            i = self.rect.collidelist(solids[start:] if start else solids)
+            if i < 0:
+                return
+            yield solids[start + i]
+            start += i + 1
 
     def die(self):
         self.is_alive = False
@@ -292,23 +350,30 @@ class Goomba(Entity):
         pygame.draw.rect(screen, BLACK, (pos.x+2, pos.y+28 - anim, 10, 4))
         pygame.draw.rect(screen, BLACK, (pos.x+20, pos.y+28 - (4-anim), 10, 4))
 
-class Tile(pygame.sprite.Sprite):
+class Tile:
+    """A level tile: just a kind ID and a rect. Tiles never move, so they skip the Sprite machinery."""
+    __slots__ = ("kind", "rect")
+
     def __init__(self, x, y, type_):
-        super().__init__()
-        self.type = type_
+        self.kind = TILE_KIND_IDS[type_]
         self.rect = pygame.Rect(x, y, TILE_SIZE, TILE_SIZE)
 
+    @property
+    def type(self):
+        return TILE_KINDS[self.kind]
+
     def draw(self, screen, camera):
         pos = camera.apply_rect(self.rect)
         # Culling optimization
         if pos.right < 0 or pos.left > SCREEN_WIDTH: return
+        kind = TILE_KINDS[self.kind]
 
-        if self.type == "ground":
+        if kind == "ground":
             pygame.draw.rect(screen, GROUND_BROWN, pos)
             pygame.draw.rect(screen, BLACK, pos, 1)
             pygame.draw.rect(screen, (220, 90, 20), (pos.x+4, pos.y+4, 24, 24), 2)
 
-        elif self.type == "brick":
+        elif kind == "brick":
             pygame.draw.rect(screen, BRICK_BROWN, pos)
             pygame.draw.rect(screen, BLACK, pos, 1)
             # Brick pattern details
@@ -317,47 +382,194 @@ class Tile(pygame.sprite.Sprite):
             pygame.draw.line(screen, BLACK, (pos.x+8, pos.y+16), (pos.x+8, pos.bottom))
             pygame.draw.line(screen, BLACK, (pos.x+24, pos.y+16), (pos.x+24, pos.bottom))
 
-        elif self.type == "block":
+        elif kind == "block":
             pygame.draw.rect(screen, BLOCK_GOLD, pos)
             pygame.draw.rect(screen, BLACK, pos, 1)
             pygame.draw.rect(screen, (180, 100, 0), (pos.x+4, pos.y+4, 24, 24), 2)
             pygame.draw.circle(screen, BLACK, (pos.centerx+2, pos.centery+2), 2)
 
-        elif self.type == "pipe":
+        elif kind == "pipe":
             pygame.draw.rect(screen, PIPE_GREEN, pos)
             pygame.draw.rect(screen, PIPE_DARK, pos, 2)
             pygame.draw.rect(screen, PIPE_LIGHT, (pos.x+4, pos.y, 4, pos.height))
 
-        elif self.type == "pipe_top":
+        elif kind == "pipe_top":
             pygame.draw.rect(screen, PIPE_GREEN, (pos.x-2, pos.y, 36, 32))
             pygame.draw.rect(screen, PIPE_DARK, (pos.x-2, pos.y, 36, 32), 2)
             pygame.draw.rect(screen, PIPE_LIGHT, (pos.x+4, pos.y, 4, 32))
 
-        elif self.type == "flagpole":
+        elif kind == "flagpole":
             pygame.draw.rect(screen, (20, 180, 20), (pos.centerx-2, pos.y, 4, 32))
 
-        elif self.type == "flag_top":
+        elif kind == "flag_top":
             pygame.draw.circle(screen, (20, 180, 20), (pos.centerx, pos.bottom), 6)
 
-        elif self.type == "castle":
+        elif kind == "castle":
             pygame.draw.rect(screen, CASTLE_BRICK, pos)
             pygame.draw.rect(screen, BLACK, pos, 1)
 
-        elif self.type == "castle_door":
+        elif kind == "castle_door":
             pygame.draw.rect(screen, BLACK, pos)
             pygame.draw.circle(screen, CASTLE_BRICK, (pos.centerx, pos.y), 16)
 
-class Game:
+class CollisionMap:
+    """Merged solid rectangles plus the few tiles that need per-tile handling."""
+    def __init__(self, tiles):
+        self.tiles = [tile for tile in tiles if TILE_COLLISION[tile.kind] != SOLID]
+        self.solids = self.merge([tile.rect for tile in tiles if TILE_COLLISION[tile.kind] == SOLID])
+
+    @staticmethod
+    def merge(rects):
+        # Horizontal runs per row first...
+        rows = {}
+        for rect in rects:
+            rows.setdefault(rect.y, set()).add(rect.x)
+        runs = []
+        for y in sorted(rows):
+            xs = sorted(rows[y])
+            start = prev = xs[0]
+            for x in xs[1:]:
+                if x != prev + TILE_SIZE:
+                    runs.append((start, y, prev + TILE_SIZE - start))
+                    start = x
+                prev = x
+            runs.append((start, y, prev + TILE_SIZE - start))
+
+        # ...then stack runs with the same span on consecutive rows
+        merged = []
+        open_runs = {}
+        for x, y, width in runs:
+            solid = open_runs.get((x, width))
+            if solid is not None and solid.bottom == y:
+                solid.height += TILE_SIZE
+            else:
+                solid = pygame.Rect(x, y, width, TILE_SIZE)
+                open_runs[(x, width)] = solid
+                merged.append(solid)
+        return merged
+
+class FrameProfiler:
+    """Wall-clock milliseconds spent in each section of a frame.
+
+    lap(section) charges the time since the previous lap to that section and
+    end_frame() closes the frame. The last PROFILE_WINDOW frames feed the F3
+    overlay; while the F4 log is open every frame is also written as a CSV row.
+    """
     def __init__(self):
+        self.overlay = False
+        self.log = None
+        self.log_error = None  # OSError from the last failed attempt to open the log
+        self.frame = 0
+        self.history = deque(maxlen=PROFILE_WINDOW)
+        self.current = dict.fromkeys(PROFILE_SECTIONS, 0.0)
+        self.mark = time.perf_counter()
+        self.font = None
+        self.panel = None
+        self.rows = []
+
+    def lap(self, section):
+        now = time.perf_counter()
+        self.current[section] += (now - self.mark) * 1000
+        self.mark = now
+
+    def end_frame(self):
+        if self.overlay or self.log:
+            times = [self.current[section] for section in PROFILE_SECTIONS]
+            self.history.append(times)
+            if self.log:
+                self.log.write(f"{self.frame}," + ",".join(f"{ms:.3f}" for ms in times) + f",{sum(times):.3f}\n")
+        self.frame += 1
+        self.current = dict.fromkeys(PROFILE_SECTIONS, 0.0)
+
+    def toggle_log(self, path=PROFILE_LOG_PATH):
+        """Start or stop the per-frame CSV log; returns whether it is now open.
+
+        A log that can't be opened leaves its OSError in log_error for the
+        caller and the overlay instead of raising out of the event loop.
+        """
+        self.log_error = None
+        if self.log:
+            self.log.close()
+            self.log = None
+        else:
+            try:
+                self.log = open(path, "w")
+            except OSError as error:
+                self.log_error = error
+                return False
+            self.log.write("frame," + ",".join(PROFILE_SECTIONS) + ",total\n")
+        return self.log is not None
+
+    def draw(self, screen):
+        """Rolling average and p99 per section, plus a graph of recent frame times."""
+        if not self.overlay or not self.history: return
+        if self.panel is None:
+            self.font = pygame.font.SysFont("monospace", 13)
+            self.panel = pygame.Surface((250, 16 * (len(PROFILE_SECTIONS) + 3) + 70))
+            self.panel.set_alpha(200)
+        panel = self.panel
+        panel.fill((0, 0, 0))
+        if self.frame % 10 == 0 or not self.rows:
+            # The statistics are re-rendered a few times a second, not every frame
+            count = len(self.history)
+            totals = sorted(map(sum, self.history))
+            rows = [f"{'ms':<10}{'avg':>7}{'p99':>7}"]
+            for section, times in zip(PROFILE_SECTIONS, zip(*self.history)):
+                ordered = sorted(times)
+                rows.append(f"{section:<10}{sum(ordered) / count:7.2f}{ordered[int(0.99 * (count - 1))]:7.2f}")
+            rows.append(f"{'frame':<10}{sum(totals) / count:7.2f}{totals[int(0.99 * (count - 1))]:7.2f}")
+            if self.log: rows.append("logging to " + os.path.basename(self.log.name))
+            elif self.log_error: rows.append("log failed: " + (self.log_error.strerror or str(self.log_error)))
+            self.rows = [self.font.render(row, True, (255, 255, 255)) for row in rows]
+        for i, row in enumerate(self.rows):
+            panel.blit(row, (6, 4 + 16 * i))
+        # One bar per frame; the yellow line is the 1/FPS budget at a third of the height
+        budget = 1000 / FPS
+        base = panel.get_height() - 6
+        for i, times in enumerate(self.history):
+            total = sum(times)
+            height = min(60, round(total * 20 / budget))
+            color = (0, 200, 0) if total <= budget * 1.05 else (220, 40, 40)
+            pygame.draw.line(panel, color, (6 + 2 * i, base), (6 + 2 * i, base - height))
+        pygame.draw.line(panel, (255, 255, 0), (6, base - 20), (6 + 2 * PROFILE_WINDOW, base - 20))
+        screen.blit(panel, (SCREEN_WIDTH - panel.get_width() - 10, 80))
+
+class TextCache:
+    """LRU cache of rendered text Surfaces keyed by (font, text, color)."""
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self.surfaces = OrderedDict()
+
+    def render(self, font, text, color):
+        key = (font, text, color)
+        surface = self.surfaces.get(key)
+        if surface is None:
+            surface = self.surfaces[key] = font.render(text, True, color)
+            if len(self.surfaces) > self.maxsize:
+                self.surfaces.popitem(last=False)
+        else:
+            self.surfaces.move_to_end(key)
+        return surface
+
+class Game:
+    def __init__(self, headless=False):
+        # Headless games draw to an offscreen Surface, so any number can live in one process
+        if headless:
+            os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
         pygame.init()
-        self.screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
-        pygame.display.set_caption("Super Mario Python 1-1")
+        if headless:
+            self.screen = pygame.Surface((SCREEN_WIDTH, SCREEN_HEIGHT))
+        else:
+            self.screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
+            pygame.display.set_caption("Super Mario Python 1-1")
         self.clock = pygame.time.Clock()
         self.font = pygame.font.SysFont("monospace", 24, bold=True)
+        self.text = TextCache()
+        self.profiler = FrameProfiler()
         self.reset()
 
     def reset(self):
-        self.tiles = pygame.sprite.Group()
+        self.tiles = []
         self.enemies = pygame.sprite.Group()
         self.camera = Camera(SCREEN_WIDTH, SCREEN_HEIGHT)
         self.mario = Mario(100, SCREEN_HEIGHT - TILE_SIZE * 5)
@@ -376,19 +588,19 @@ class Game:
 
     def add_pipe(self, x, height):
         for h in range(height):
-            self.tiles.add(Tile(x * TILE_SIZE, SCREEN_HEIGHT - (2+h) * TILE_SIZE, "pipe"))
-        self.tiles.add(Tile(x * TILE_SIZE, SCREEN_HEIGHT - (2+height) * TILE_SIZE, "pipe_top"))
+            self.tiles.append(Tile(x * TILE_SIZE, SCREEN_HEIGHT - (2+h) * TILE_SIZE, "pipe"))
+        self.tiles.append(Tile(x * TILE_SIZE, SCREEN_HEIGHT - (2+height) * TILE_SIZE, "pipe_top"))
 
     def add_castle(self, x):
         # Decorative Castle
         for cx in range(5):
             for cy in range(2):
-                self.tiles.add(Tile((x + cx) * TILE_SIZE, SCREEN_HEIGHT - (2+cy)*TILE_SIZE, "castle"))
+                self.tiles.append(Tile((x + cx) * TILE_SIZE, SCREEN_HEIGHT - (2+cy)*TILE_SIZE, "castle"))
         for cx in range(1, 4):
             for cy in range(2, 4):
-                self.tiles.add(Tile((x + cx) * TILE_SIZE, SCREEN_HEIGHT - (2+cy)*TILE_SIZE, "castle"))
-        self.tiles.add(Tile((x + 2) * TILE_SIZE, SCREEN_HEIGHT - 6*TILE_SIZE, "castle"))
-        self.tiles.add(Tile((x + 2) * TILE_SIZE, SCREEN_HEIGHT - 3*TILE_SIZE, "castle_door"))
+                self.tiles.append(Tile((x + cx) * TILE_SIZE, SCREEN_HEIGHT - (2+cy)*TILE_SIZE, "castle"))
+        self.tiles.append(Tile((x + 2) * TILE_SIZE, SCREEN_HEIGHT - 6*TILE_SIZE, "castle"))
+        self.tiles.append(Tile((x + 2) * TILE_SIZE, SCREEN_HEIGHT - 3*TILE_SIZE, "castle_door"))
 
     def generate_level(self):
         # 1-1 Map Data
@@ -398,8 +610,8 @@ class Game:
         # Ground
         for x in range(map_width):
             if x not in pits:
-                self.tiles.add(Tile(x * TILE_SIZE, SCREEN_HEIGHT - TILE_SIZE, "ground"))
-                self.tiles.add(Tile(x * TILE_SIZE, SCREEN_HEIGHT - TILE_SIZE * 2, "ground"))
+                self.tiles.append(Tile(x * TILE_SIZE, SCREEN_HEIGHT - TILE_SIZE, "ground"))
+                self.tiles.append(Tile(x * TILE_SIZE, SCREEN_HEIGHT - TILE_SIZE * 2, "ground"))
 
         # Pipes
         self.add_pipe(28, 1)
@@ -421,14 +633,14 @@ class Game:
         ]
 
         for s in structures:
-            self.tiles.add(Tile(s[0] * TILE_SIZE, SCREEN_HEIGHT - (2+s[1]) * TILE_SIZE, s[2]))
+            self.tiles.append(Tile(s[0] * TILE_SIZE, SCREEN_HEIGHT - (2+s[1]) * TILE_SIZE, s[2]))
 
         # Stairs
         def build_stair(start_x, height, reverse=False):
             for i in range(height):
                 for h in range(i + 1):
                     x = start_x + (i if not reverse else (height - 1 - i))
-                    self.tiles.add(Tile(x * TILE_SIZE, SCREEN_HEIGHT - (3+h)*TILE_SIZE, "block"))
+                    self.tiles.append(Tile(x * TILE_SIZE, SCREEN_HEIGHT - (3+h)*TILE_SIZE, "block"))
 
         build_stair(134, 4)
         build_stair(140, 4, True)
@@ -439,11 +651,12 @@ class Game:
         # Flagpole
         flag_x = 198
         for i in range(1, 10):
-            self.tiles.add(Tile(flag_x * TILE_SIZE, SCREEN_HEIGHT - (2+i)*TILE_SIZE, "flagpole"))
-        self.tiles.add(Tile(flag_x * TILE_SIZE, SCREEN_HEIGHT - (2+10)*TILE_SIZE, "flag_top"))
-        self.tiles.add(Tile(flag_x * TILE_SIZE, SCREEN_HEIGHT - 3*TILE_SIZE, "block")) # Base
+            self.tiles.append(Tile(flag_x * TILE_SIZE, SCREEN_HEIGHT - (2+i)*TILE_SIZE, "flagpole"))
+        self.tiles.append(Tile(flag_x * TILE_SIZE, SCREEN_HEIGHT - (2+10)*TILE_SIZE, "flag_top"))
+        self.tiles.append(Tile(flag_x * TILE_SIZE, SCREEN_HEIGHT - 3*TILE_SIZE, "block")) # Base
 
         self.add_castle(202)
+        self.collision = CollisionMap(self.tiles)
 
         # Enemies
         goomba_locs = [22, 40, 50, 51, 80, 82, 97, 99, 114, 116, 124, 126, 128, 174, 176]
@@ -455,15 +668,15 @@ class Game:
         # 000000   1-1    000
         
         # Labels
-        mario_lbl = self.font.render("MARIO", True, WHITE)
-        world_lbl = self.font.render("WORLD", True, WHITE)
-        time_lbl = self.font.render("TIME", True, WHITE)
+        mario_lbl = self.text.render(self.font, "MARIO", WHITE)
+        world_lbl = self.text.render(self.font, "WORLD", WHITE)
+        time_lbl = self.text.render(self.font, "TIME", WHITE)
         
         # Values
-        score_val = self.font.render(f"{self.score:06d}", True, WHITE)
-        coin_val = self.font.render(f"x{self.coins:02d}", True, WHITE)
-        world_val = self.font.render(self.world, True, WHITE)
-        time_val = self.font.render(f"{self.time:03d}", True, WHITE)
+        score_val = self.text.render(self.font, f"{self.score:06d}", WHITE)
+        coin_val = self.text.render(self.font, f"x{self.coins:02d}", WHITE)
+        world_val = self.text.render(self.font, self.world, WHITE)
+        time_val = self.text.render(self.font, f"{self.time:03d}", WHITE)
 
         # Positions (SMB1 Layout)
         self.screen.blit(mario_lbl, (40, 20))
@@ -477,77 +690,286 @@ class Game:
         self.screen.blit(time_lbl, (680, 20))
         self.screen.blit(time_val, (690, 45))
 
+    def step(self, keys):
+        """Advance the simulation one frame with the given key state."""
+        if self.game_over:
+            if self.mario.state == "VICTORY" and self.time > 0:
+                # Score Countdown: 5 time units per frame
+                countdown_step = 5 if self.time >= 5 else self.time
+                self.time -= countdown_step
+                self.score += 50 * countdown_step
+                # Play sound here if available
+            return
+        profiler = self.profiler
+        profiler.lap("sim")
+        self.mario.update(self.collision, self.enemies, self, keys)
+        profiler.lap("mario")
+        self.enemies.update(self.collision)
+        profiler.lap("enemies")
+        self.camera.update(self.mario)
+        profiler.lap("camera")
+
+        # Flag Logic
+        if self.mario.state == "SLIDE" and not self.flag_triggered:
+            self.flag_triggered = True
+            self.enemies.empty() # Despawn enemies for victory lap
+
+        # Win/Loss Conditions
+        if self.mario.state == "DEAD" and self.mario.rect.y > SCREEN_HEIGHT + 100:
+            self.game_over = True
+
+        # Victory handled by Mario update now (when entering castle)
+        if self.mario.state == "VICTORY":
+            self.game_over = True
+
+        # Timer Logic
+        if self.mario.state not in ["DEAD", "VICTORY"]:
+            self.time_ticker += 1
+            if self.time_ticker >= 60: # Approx 1 second
+                self.time -= 1
+                self.time_ticker = 0
+                if self.time <= 0:
+                    self.mario.die()
+
+    def draw(self):
+        profiler = self.profiler
+        self.screen.fill(SKY_BLUE)
+        profiler.lap("scenery")
+        for tile in self.tiles: tile.draw(self.screen, self.camera)
+        profiler.lap("tiles")
+        for enemy in self.enemies: enemy.draw(self.screen, self.camera)
+        self.mario.draw(self.screen, self.camera)
+        profiler.lap("entities")
+        self.draw_hud()
+
+        # End Sequence / UI
+        if self.game_over:
+            if self.mario.state == "VICTORY":
+                # Draw "COURSE CLEAR!" immediately
+                msg = "COURSE CLEAR!"
+                txt = self.text.render(self.font, msg, WHITE)
+                self.screen.blit(txt, (SCREEN_WIDTH//2 - txt.get_width()//2, SCREEN_HEIGHT//3))
+
+                # Only show restart prompt when the countdown in step() finishes
+                if self.time <= 0:
+                    sub = self.text.render(self.font, "Press R to Play Again", WHITE)
+                    self.screen.blit(sub, (SCREEN_WIDTH//2 - sub.get_width()//2, SCREEN_HEIGHT//2))
+            else:
+                txt = self.text.render(self.font, "GAME OVER", WHITE)
+                sub = self.text.render(self.font, "Press R to Restart", WHITE)
+                self.screen.blit(txt, (SCREEN_WIDTH//2 - txt.get_width()//2, SCREEN_HEIGHT//3))
+                self.screen.blit(sub, (SCREEN_WIDTH//2 - sub.get_width()//2, SCREEN_HEIGHT//2))
+        profiler.lap("hud")
+
+    def motion_snapshot(self):
+        """Where everything that moves is, taken before each step for draw_interpolated()."""
+        return [(rect, rect.x, rect.y) for rect in (self.camera.camera, self.mario.rect, *(e.rect for e in self.enemies))]
+
+    def draw_interpolated(self, previous, alpha):
+        """draw() with movers placed alpha of the way from their previous to their current spot."""
+        current = [(rect, rect.x, rect.y) for rect, _, _ in previous]
+        for rect, x, y in previous:
+            rect.topleft = (round(x + (rect.x - x) * alpha), round(y + (rect.y - y) * alpha))
+        try:
+            self.draw()
+        finally:
+            for rect, x, y in current:
+                rect.topleft = (x, y)
+
     def run(self):
+        # Fixed FPS simulation: each drawn frame runs however many steps real time
+        # calls for (at most MAX_FRAME_SKIP), then draws between the last two.
+        lag = 0.0
+        previous = self.motion_snapshot()
+        profiler = self.profiler
         while True:
+            lag += min(self.clock.tick(RENDER_FPS) / 1000, FRAME_TIME * MAX_FRAME_SKIP)
+            profiler.lap("wait")
+            profiler.end_frame()
             for event in pygame.event.get():
                 if event.type == pygame.QUIT:
+                    if profiler.log: profiler.toggle_log()
                     pygame.quit()
                     sys.exit()
                 if event.type == pygame.KEYDOWN:
                     if event.key == pygame.K_r:
                         self.reset()
-
-            if not self.game_over:
-                self.mario.update(self.tiles, self.enemies, self)
-                self.enemies.update(self.tiles)
-                self.camera.update(self.mario)
-
-                # Flag Logic
-                if self.mario.state == "SLIDE" and not self.flag_triggered:
-                    self.flag_triggered = True
-                    self.enemies.empty() # Despawn enemies for victory lap
-
-                # Win/Loss Conditions
-                if self.mario.state == "DEAD" and self.mario.rect.y > SCREEN_HEIGHT + 100:
-                    self.game_over = True
-                
-                # Victory handled by Mario update now (when entering castle)
-                if self.mario.state == "VICTORY":
-                    self.game_over = True
-
-                # Timer Logic
-                if self.mario.state not in ["DEAD", "VICTORY"]:
-                    self.time_ticker += 1
-                    if self.time_ticker >= 60: # Approx 1 second
-                        self.time -= 1
-                        self.time_ticker = 0
-                        if self.time <= 0:
-                            self.mario.die()
-
-            # Draw
-            self.screen.fill(SKY_BLUE)
-            for tile in self.tiles: tile.draw(self.screen, self.camera)
-            for enemy in self.enemies: enemy.draw(self.screen, self.camera)
-            self.mario.draw(self.screen, self.camera)
-            self.draw_hud()
-
-            # End Sequence / UI
-            if self.game_over:
-                if self.mario.state == "VICTORY":
-                    # Draw "COURSE CLEAR!" immediately
-                    msg = "COURSE CLEAR!"
-                    txt = self.font.render(msg, True, WHITE)
-                    self.screen.blit(txt, (SCREEN_WIDTH//2 - txt.get_width()//2, SCREEN_HEIGHT//3))
-
-                    # Score Countdown Animation
-                    if self.time > 0:
-                        # Count down faster (5 units per frame) for effect
-                        countdown_step = 5 if self.time >= 5 else self.time
-                        self.time -= countdown_step
-                        self.score += 50 * countdown_step
-                        # Play sound here if available
-                    else:
-                        # Only show restart prompt when countdown finishes
-                        sub = self.font.render("Press R to Play Again", True, WHITE)
-                        self.screen.blit(sub, (SCREEN_WIDTH//2 - sub.get_width()//2, SCREEN_HEIGHT//2))
-                else:
-                    txt = self.font.render("GAME OVER", True, WHITE)
-                    sub = self.font.render("Press R to Restart", True, WHITE)
-                    self.screen.blit(txt, (SCREEN_WIDTH//2 - txt.get_width()//2, SCREEN_HEIGHT//3))
-                    self.screen.blit(sub, (SCREEN_WIDTH//2 - sub.get_width()//2, SCREEN_HEIGHT//2))
-
+                    if event.key == pygame.K_F3:
+                        profiler.overlay = not profiler.overlay
+                    if event.key == pygame.K_F4:
+                        if profiler.toggle_log():
+                            print(f"Frame log writing to {PROFILE_LOG_PATH}")
+                        else:
+                            print(f"Frame log {'not opened: ' + str(profiler.log_error) if profiler.log_error else 'closed'}")
+            profiler.lap("input")
+
+            steps = 0
+            while lag >= FRAME_TIME and steps < MAX_FRAME_SKIP:
+                previous = self.motion_snapshot()
+                self.step(pygame.key.get_pressed())
+                lag -= FRAME_TIME
+                steps += 1
+            profiler.lap("sim")
+            self.draw_interpolated(previous, lag / FRAME_TIME)
+            profiler.draw(self.screen)
+            profiler.lap("profiler")
             pygame.display.flip()
-            self.clock.tick(FPS)
+            profiler.lap("flip")
+
+# --- VECTOR ENVIRONMENT ---
+
+ACTION_KEYS = tuple(InputState({pygame.K_RIGHT: "right" in action, pygame.K_LEFT: "left" in action,
+                                pygame.K_SPACE: "jump" in action}) for action in ACTIONS)
+
+def level_codes(tiles):
+    """OBS_ROWS x level-width array of OBS_* codes for the static tiles, padded with empty columns."""
+    columns = max(tile.rect.x for tile in tiles) // TILE_SIZE + 1
+    codes = np.zeros((OBS_ROWS, OBS_COLS + columns + OBS_COLS), dtype=np.uint8)
+    for tile in tiles:
+        row = tile.rect.y // TILE_SIZE
+        collision = TILE_COLLISION[tile.kind]
+        if 0 <= row < OBS_ROWS and collision != PASSTHROUGH:
+            codes[row, OBS_COLS + tile.rect.x // TILE_SIZE] = OBS_SOLID if collision == SOLID else OBS_GOAL
+    return codes
+
+class VectorEnv:
+    """num_envs independent 1-1 games stepped in lockstep, for scripted and learned agents.
+
+    step(actions) takes one ACTIONS index per game and returns stacked
+    (grids, features, rewards, dones, infos). grids is uint8
+    (num_envs, OBS_ROWS, OBS_COLS) with OBS_BEHIND columns behind Mario and
+    features is float32 (num_envs, OBS_FEATURES): Mario's offset into his
+    tile, height, velocity, on_ground and time left, then dx, dy, vel_x and
+    a present flag for each of the nearest live goombas. Each action is held
+    for frame_skip frames. A game that ends is reset at once and its info
+    says how it ended. Nothing is drawn unless render() asks for it.
+
+    With workers > 1 the games are split across that many processes, each
+    running a VectorEnv of its share.
+    """
+    def __init__(self, num_envs, frame_skip=1, workers=1):
+        if np is None:
+            raise RuntimeError("VectorEnv needs numpy")
+        self.num_envs = num_envs
+        self.frame_skip = frame_skip
+        self.shards = []
+        if workers > 1:
+            self.games = []
+            bounds = np.linspace(0, num_envs, min(workers, num_envs) + 1).astype(int)
+            for start, stop in zip(bounds[:-1], bounds[1:]):
+                conn, child = multiprocessing.Pipe()
+                process = multiprocessing.Process(target=vector_env_worker, args=(child, stop - start, frame_skip), daemon=True)
+                process.start()
+                child.close()
+                self.shards.append((conn, process, start, stop))
+            return
+        self.games = [Game(headless=True) for _ in range(num_envs)]
+        # Every game plays the same generated 1-1
+        self.codes = level_codes(self.games[0].tiles)
+        self.window = np.arange(OBS_COLS)
+        self.last_x = np.zeros(num_envs)
+
+    def reset(self):
+        """Restart every game; returns (grids, features)."""
+        if self.shards:
+            grids, features = zip(*self.gather("reset", [None] * len(self.shards)))
+            return np.concatenate(grids), np.concatenate(features)
+        for i, game in enumerate(self.games):
+            game.reset()
+            self.last_x[i] = game.mario.rect.x
+        return self.observe()
+
+    def step(self, actions):
+        """Hold ACTIONS[actions[i]] in game i for frame_skip frames; returns (grids, features, rewards, dones, infos)."""
+        if self.shards:
+            grids, features, rewards, dones, infos = zip(*self.gather("step", [actions[start:stop] for _, _, start, stop in self.shards]))
+            return (np.concatenate(grids), np.concatenate(features), np.concatenate(rewards), np.concatenate(dones),
+                    [info for shard in infos for info in shard])
+        rewards = np.zeros(self.num_envs, dtype=np.float32)
+        dones = np.zeros(self.num_envs, dtype=bool)
+        infos = [{} for _ in self.games]
+        for i, game in enumerate(self.games):
+            keys = ACTION_KEYS[actions[i]]
+            mario = game.mario
+            for _ in range(self.frame_skip):
+                game.step(keys)
+                if game.game_over or mario.is_dead:
+                    break
+            rewards[i] = (mario.rect.x - self.last_x[i]) / TILE_SIZE
+            self.last_x[i] = mario.rect.x
+            if game.game_over or mario.is_dead:
+                cleared = mario.state == "VICTORY"
+                rewards[i] += REWARD_CLEAR if cleared else REWARD_DEATH
+                dones[i] = True
+                infos[i] = {"cleared": cleared, "x": mario.rect.x, "score": game.score, "time": game.time}
+                game.reset()
+                self.last_x[i] = game.mario.rect.x
+        return self.observe() + (rewards, dones, infos)
+
+    def observe(self):
+        n = self.num_envs
+        x = np.fromiter((game.mario.rect.x for game in self.games), dtype=np.int64, count=n)
+        columns = x // TILE_SIZE + (OBS_COLS - OBS_BEHIND)
+        grids = self.codes[:, columns[:, None] + self.window].transpose(1, 0, 2).copy()
+        features = np.zeros((n, OBS_FEATURES), dtype=np.float32)
+        for i, game in enumerate(self.games):
+            mario = game.mario
+            rect = mario.rect
+            features[i, :6] = (rect.x % TILE_SIZE / TILE_SIZE, rect.y / SCREEN_HEIGHT, mario.vel_x / MOVE_SPEED,
+                               mario.vel_y / -JUMP_POWER, mario.on_ground, game.time / 400)
+            left = (columns[i] - OBS_COLS) * TILE_SIZE
+            nearest = sorted((e for e in game.enemies if e.is_alive and e.rect.y < SCREEN_HEIGHT), key=lambda e: abs(e.rect.x - rect.x))[:OBS_ENEMIES]
+            for slot, enemy in enumerate(nearest):
+                features[i, 6 + 4 * slot:10 + 4 * slot] = ((enemy.rect.x - rect.x) / TILE_SIZE, (enemy.rect.y - rect.y) / TILE_SIZE,
+                                                           enemy.vel_x, 1)
+                column = (enemy.rect.centerx - left) // TILE_SIZE
+                row = enemy.rect.centery // TILE_SIZE
+                if 0 <= column < OBS_COLS and 0 <= row < OBS_ROWS:
+                    grids[i, row, column] = OBS_ENEMY
+        return grids, features
+
+    def render(self, index=0):
+        """Draw game index and return its frame as an (width, height, 3) uint8 array."""
+        if self.shards:
+            for conn, _, start, stop in self.shards:
+                if start <= index < stop:
+                    conn.send(("render", index - start))
+                    return conn.recv()
+            raise IndexError(index)
+        game = self.games[index]
+        game.draw()
+        return pygame.surfarray.array3d(game.screen)
+
+    def gather(self, command, payloads):
+        # Every shard works on its command before any reply is read
+        for (conn, _, _, _), payload in zip(self.shards, payloads):
+            conn.send((command, payload))
+        return [conn.recv() for conn, _, _, _ in self.shards]
+
+    def close(self):
+        # SDL turns SIGTERM into a QUIT event, so the workers are asked to stop, not terminated
+        for conn, _, _, _ in self.shards:
+            conn.send(("close", None))
+        for conn, process, _, _ in self.shards:
+            process.join()
+            conn.close()
+        self.shards = []
+
+def vector_env_worker(conn, num_envs, frame_skip):
+    """Serve reset/step/render/close commands for one shard of a VectorEnv."""
+    os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+    env = VectorEnv(num_envs, frame_skip)
+    while True:
+        command, payload = conn.recv()
+        if command == "reset":
+            conn.send(env.reset())
+        elif command == "step":
+            conn.send(env.step(payload))
+        elif command == "render":
+            conn.send(env.render(payload))
+        elif command == "close":
+            break
+    conn.close()
 
 if __name__ == "__main__":
     game = Game()
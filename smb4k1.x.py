@@ -1,6 +1,11 @@
+import os
 import pygame
 import sys
 import math
+import struct
+import time
+import zlib
+from collections import OrderedDict, deque
 
 # ============================================================================
 #  ULTRA Mario 2D Bros - Famicom 60FPS Edition
@@ -11,8 +16,47 @@ import math
 SCREEN_WIDTH = 800
 SCREEN_HEIGHT = 480
 FPS = 60
+RENDER_FPS = 60      # draw rate cap; the simulation always steps at FPS
+FRAME_TIME = 1 / FPS
+MAX_FRAME_SKIP = 5   # simulation steps per drawn frame before the game slows down
+TURBO_SPEEDS = (1, 4, 16, 64)  # F cycles the steps run per 1/60 s tick
+IDLE_FPS = 20        # loop rate on the menu, which only redraws what changed
+BLINK_MS = 25 * 1000 // FPS  # "PRESS START" on/off time
+# Frame profiler: F3 toggles the overlay, F4 the per-frame CSV log
+PROFILE_SECTIONS = ("input", "sim", "mario", "enemies", "camera", "scenery", "tiles", "entities",
+                    "hud", "profiler", "flip", "wait")
+PROFILE_WINDOW = 120  # frames behind the overlay's averages, p99 and graph
+PROFILE_LOG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "frame_profile.csv")
 TILE_SIZE = 32
 SCALER = 2
+CHUNK_WIDTH = 512
+CHUNK_CACHE_SIZE = 6
+ENEMY_SPAWN_MARGIN = TILE_SIZE * 2    # wake enemies this far past the camera's right edge
+ENEMY_DESPAWN_MARGIN = TILE_SIZE * 4  # drop enemies this far behind its left edge
+DECORATION_REACH = 300  # decorations anchored this far left of the screen may still show
+
+# Collision classes: SOLID blocks everything, PASSTHROUGH is scenery, touching
+# a TRIGGER starts the flag slide and a VICTORY tile ends the level
+SOLID, PASSTHROUGH, TRIGGER, VICTORY = range(4)
+
+# Tile kinds: Tile.kind indexes these per-kind tables
+TILE_KINDS =     ("ground", "brick", "block", "pipe", "pipe_top", "flagpole", "flag_top",  "castle",    "castle_door")
+TILE_COLLISION = (SOLID,    SOLID,   SOLID,   SOLID,  SOLID,      TRIGGER,    PASSTHROUGH, PASSTHROUGH, VICTORY)
+TILE_ANIMATED =  (False,    False,   True,    False,  False,      False,      False,       False,       False)
+TILE_KIND_IDS = {name: kind for kind, name in enumerate(TILE_KINDS)}
+
+# Snapshots: header, Mario, then one record per goomba, awake ones first.
+# Only what step() changes is stored, never the level.
+SNAPSHOT_VERSION = 1
+SNAPSHOT_HEADER = struct.Struct("<BBiIHhHII")  # version, flags, camera x, score, coins, time, time_ticker, awake, dormant
+SNAPSHOT_MARIO = struct.Struct("<iiddBBBH")  # x, y, vel_x, vel_y, state, flags, walk_frame, frame_timer
+SNAPSHOT_GOOMBA = struct.Struct("<iiidBBHH")  # x, y, vel_x, vel_y, alive, frame, frame_timer, dead_timer
+SNAPSHOT_FLAG_TRIGGERED, SNAPSHOT_GAME_OVER = 1, 2
+MARIO_STATES = ("IDLE", "SLIDE", "AUTO_WALK", "DEAD", "VICTORY")
+# Rewind (hold BACKSPACE): one snapshot per frame for this long, within this many bytes
+REWIND_SECONDS = 30
+REWIND_MAX_BYTES = 2 * 1024 * 1024
+REWIND_KEYFRAME_EVERY = 30  # frames stored as deltas between full snapshots
 
 # Physics (Famicom Feel)
 GRAVITY = 0.6
@@ -36,6 +80,7 @@ GOOMBA_BODY = (228, 92, 16)
 HILL_GREEN = (0, 168, 0)
 HILL_OUTLINE = (0, 80, 0)
 CLOUD_WHITE = (255, 255, 255)
+COLORKEY = (255, 0, 255)
 CASTLE_BRICK = (128, 0, 0)
 BLACK = (0, 0, 0)
 WHITE = (255, 255, 255)
@@ -73,6 +118,8 @@ class Entity(pygame.sprite.Sprite):
         self.vel_y = 0
 
 class Decoration(pygame.sprite.Sprite):
+    frames = {}
+
     def __init__(self, x, y, type_, size=1):
         super().__init__()
         self.type = type_
@@ -80,21 +127,39 @@ class Decoration(pygame.sprite.Sprite):
         self.rect = pygame.Rect(x, y, 0, 0)
 
     def draw(self, screen, camera):
-        dest = camera.apply_rect(pygame.Rect(self.rect.x, self.rect.y, 1, 1))
-        if dest.x < -300 or dest.x > SCREEN_WIDTH: return
+        x = self.rect.x + camera.camera.x
+        if x < -DECORATION_REACH or x > SCREEN_WIDTH: return
+        # Clouds hang at their own height, hills and bushes stand on the ground
+        frame, dx, dy = self.frame()
+        y = self.rect.y + camera.camera.y if self.type == "cloud" else SCREEN_HEIGHT - TILE_SIZE * 2
+        screen.blit(frame, (x + dx, y + dy))
+
+    def frame(self):
+        """This shape and size painted once: (colorkeyed Surface, x and y offset from the anchor)."""
+        key = (self.type, self.size)
+        cached = Decoration.frames.get(key)
+        if cached is None:
+            x, y = TILE_SIZE, TILE_SIZE * (self.size + 2)
+            canvas = pygame.Surface((x + TILE_SIZE * (self.size + 4), y + TILE_SIZE))
+            canvas.fill(COLORKEY)
+            canvas.set_colorkey(COLORKEY)
+            self.paint(canvas, x, y)
+            bounds = canvas.get_bounding_rect()
+            cached = Decoration.frames[key] = (canvas.subsurface(bounds).convert(), bounds.x - x, bounds.y - y)
+        return cached
+
+    def paint(self, screen, base_x, anchor_y):
         if self.type == "hill":
             h_width = 32 * (2 + self.size)
             h_height = 32 * (self.size + 0.5)
-            base_x = dest.x
-            base_y = SCREEN_HEIGHT - TILE_SIZE * 2
+            base_y = anchor_y
             points = [(base_x, base_y), (base_x + h_width/2, base_y - h_height), (base_x + h_width, base_y)]
             pygame.draw.polygon(screen, HILL_GREEN, points)
             pygame.draw.polygon(screen, HILL_OUTLINE, points, 3)
             pygame.draw.rect(screen, HILL_OUTLINE, (base_x + h_width/2 - 4, base_y - h_height/2, 8, 8))
         elif self.type == "cloud":
             c_width = 32 * (1 + self.size)
-            base_x = dest.x
-            base_y = dest.y
+            base_y = anchor_y
             pygame.draw.rect(screen, CLOUD_WHITE, (base_x, base_y, c_width, 24), border_radius=12)
             pygame.draw.circle(screen, CLOUD_WHITE, (base_x + 16, base_y), 16)
             if self.size > 1:
@@ -103,8 +168,7 @@ class Decoration(pygame.sprite.Sprite):
                 pygame.draw.circle(screen, CLOUD_WHITE, (base_x + 80, base_y), 16)
         elif self.type == "bush":
             b_width = 32 * (1 + self.size)
-            base_x = dest.x
-            base_y = SCREEN_HEIGHT - TILE_SIZE * 2 - 16
+            base_y = anchor_y - 16
             pygame.draw.circle(screen, PIPE_LIGHT, (base_x + 16, base_y + 8), 16)
             pygame.draw.circle(screen, PIPE_LIGHT, (base_x + b_width - 16, base_y + 8), 16)
             pygame.draw.rect(screen, PIPE_LIGHT, (base_x + 16, base_y, b_width - 32, 24))
@@ -121,15 +185,15 @@ class Mario(Entity):
         self.frame_timer = 0
         self.walk_frame = 0
 
-    def update(self, tiles, enemies, game_ref):
+    def update(self, grid, enemies, game_ref, keys):
         if self.state == "VICTORY" or not self.visible:
             return
         if self.state == "SLIDE":
             self.vel_y = 3
             self.rect.y += self.vel_y
             hit_ground = False
-            for tile in tiles:
-                if tile.type in ["flagpole", "castle", "castle_door", "flag_top", "cloud", "hill", "bush"]: continue
+            for tile in grid.query(self.rect):
+                if TILE_COLLISION[tile.kind] != SOLID: continue
                 if self.rect.colliderect(tile.rect):
                     self.rect.bottom = tile.rect.top
                     hit_ground = True
@@ -148,14 +212,14 @@ class Mario(Entity):
             if self.frame_timer > 10:
                 self.walk_frame = (self.walk_frame + 1) % 3
                 self.frame_timer = 0
-            for tile in tiles:
-                if tile.type not in ["castle_door", "castle", "flagpole", "flag_top"]:
+            for tile in grid.query(self.rect):
+                if TILE_COLLISION[tile.kind] == SOLID:
                     if self.rect.colliderect(tile.rect):
                         if self.vel_y > 0:
                             self.rect.bottom = tile.rect.top
                             self.vel_y = 0
-            for tile in tiles:
-                if tile.type == "castle_door":
+            for tile in grid.query(self.rect):
+                if TILE_COLLISION[tile.kind] == VICTORY:
                     if self.rect.colliderect(tile.rect):
                         self.visible = False 
                         game_ref.trigger_victory()
@@ -165,7 +229,6 @@ class Mario(Entity):
             self.vel_y += GRAVITY
             self.rect.y += self.vel_y
             return
-        keys = pygame.key.get_pressed()
         if keys[pygame.K_LEFT]:
             self.vel_x -= ACCEL
             self.facing_right = False
@@ -191,11 +254,9 @@ class Mario(Entity):
                 self.frame_timer = 0
         else:
             self.walk_frame = 0
-        self.rect.x += self.vel_x
-        self.collide(tiles, "x")
-        self.rect.y += self.vel_y
+        self.collide(grid, "x")
         self.on_ground = False
-        self.collide(tiles, "y")
+        self.collide(grid, "y")
         hit_list = pygame.sprite.spritecollide(self, enemies, False)
         for enemy in hit_list:
             if enemy.is_alive:
@@ -208,28 +269,49 @@ class Mario(Entity):
         if self.rect.y > SCREEN_HEIGHT:
             self.die()
 
-    def collide(self, tiles, direction):
-        for tile in tiles:
-            if tile.type in ["castle", "flag_top", "castle_door", "bush", "cloud", "hill"]: continue
-            if self.rect.colliderect(tile.rect):
-                if tile.type == "flagpole":
-                    self.start_flag_sequence(tile)
-                    return
-                if direction == "x":
-                    if self.vel_x > 0:
-                        self.rect.right = tile.rect.left
-                        self.vel_x = 0
-                    elif self.vel_x < 0:
-                        self.rect.left = tile.rect.right
-                        self.vel_x = 0
-                if direction == "y":
-                    if self.vel_y > 0:
-                        self.rect.bottom = tile.rect.top
-                        self.vel_y = 0
-                        self.on_ground = True
-                    elif self.vel_y < 0:
-                        self.rect.top = tile.rect.bottom
-                        self.vel_y = 0
+    def collide(self, grid, direction):
+        """Move along one axis, stopping at the nearest SOLID tile on the way.
+
+        The whole swept path from the old to the new rect is looked up in the
+        grid, so no speed or timestep can carry Mario through a tile.
+        """
+        start = self.rect.copy()
+        if direction == "x":
+            self.rect.x += self.vel_x
+        else:
+            self.rect.y += self.vel_y
+        path = start.union(self.rect)
+        solids = []
+        poles = []
+        for tile in grid.query(path):
+            collision = TILE_COLLISION[tile.kind]
+            if not path.colliderect(tile.rect): continue
+            if collision == SOLID:
+                solids.append(tile.rect)
+            elif collision == TRIGGER:
+                poles.append(tile)
+        if solids:
+            if direction == "x":
+                if self.vel_x > 0:
+                    self.rect.right = min(solid.left for solid in solids)
+                    self.vel_x = 0
+                elif self.vel_x < 0:
+                    self.rect.left = max(solid.right for solid in solids)
+                    self.vel_x = 0
+            elif self.vel_y > 0:
+                self.rect.bottom = min(solid.top for solid in solids)
+                self.vel_y = 0
+                self.on_ground = True
+            elif self.vel_y < 0:
+                self.rect.top = max(solid.bottom for solid in solids)
+                self.vel_y = 0
+        # The base block stops Mario flush with the pole above it; touching counts
+        path = start.union(self.rect)
+        path = path.inflate(2, 0) if direction == "x" else path.inflate(0, 2)
+        for pole in poles:
+            if path.colliderect(pole.rect):
+                self.start_flag_sequence(pole)
+                break
 
     def start_flag_sequence(self, pole):
         self.state = "SLIDE"
@@ -293,7 +375,7 @@ class Goomba(Entity):
         self.frame_timer = 0
         self.dead_timer = 0
 
-    def update(self, tiles):
+    def update(self, grid):
         if not self.is_alive:
             self.dead_timer += 1
             if self.dead_timer > 30: self.kill()
@@ -304,8 +386,8 @@ class Goomba(Entity):
             self.frame = (self.frame + 1) % 2
             self.frame_timer = 0
         self.rect.x += self.vel_x
-        for tile in tiles:
-            if tile.type in ["castle", "flagpole", "flag_top", "castle_door", "bush", "hill", "cloud"]: continue
+        for tile in grid.query(self.rect):
+            if TILE_COLLISION[tile.kind] != SOLID: continue
             if self.rect.colliderect(tile.rect):
                 if self.vel_x > 0:
                     self.rect.right = tile.rect.left
@@ -314,8 +396,8 @@ class Goomba(Entity):
                     self.rect.left = tile.rect.right
                     self.vel_x = 2
         self.rect.y += self.vel_y
-        for tile in tiles:
-            if tile.type in ["castle", "flagpole", "flag_top", "castle_door", "bush", "hill", "cloud"]: continue
+        for tile in grid.query(self.rect):
+            if TILE_COLLISION[tile.kind] != SOLID: continue
             if self.rect.colliderect(tile.rect):
                 if self.vel_y > 0:
                     self.rect.bottom = tile.rect.top
@@ -345,24 +427,29 @@ class Goomba(Entity):
             pygame.draw.rect(screen, foot_color, (pos.x+2, pos.y+26, 10, 6))
             pygame.draw.rect(screen, foot_color, (pos.x+22, pos.y+26, 10, 6))
 
-class Tile(pygame.sprite.Sprite):
+class Tile:
+    """A level tile: just a kind ID and a rect. Tiles never move, so they skip the Sprite machinery."""
+    __slots__ = ("kind", "rect")
+
     def __init__(self, x, y, type_):
-        super().__init__()
-        self.type = type_
+        self.kind = TILE_KIND_IDS[type_]
         self.rect = pygame.Rect(x, y, TILE_SIZE, TILE_SIZE)
-        self.frame_timer = 0
-        self.q_color = (255, 200, 50)
+
+    @property
+    def type(self):
+        return TILE_KINDS[self.kind]
 
     def draw(self, screen, camera):
         pos = camera.apply_rect(self.rect)
         if pos.right < 0 or pos.left > SCREEN_WIDTH: return
-        if self.type == "ground":
+        kind = TILE_KINDS[self.kind]
+        if kind == "ground":
             pygame.draw.rect(screen, GROUND_BROWN, pos)
             pygame.draw.line(screen, CREAM, (pos.x, pos.y+2), (pos.right, pos.y+2), 2)
             pygame.draw.rect(screen, BLACK, pos, 1)
             pygame.draw.rect(screen, (150, 50, 0), (pos.x+8, pos.y+8, 4, 4))
             pygame.draw.rect(screen, (150, 50, 0), (pos.x+20, pos.y+20, 4, 4))
-        elif self.type == "brick":
+        elif kind == "brick":
             pygame.draw.rect(screen, BRICK_BROWN, pos)
             pygame.draw.line(screen, BLACK, (pos.x, pos.y), (pos.right, pos.y), 2)
             pygame.draw.line(screen, BLACK, (pos.x+16, pos.y), (pos.x+16, pos.y+8), 2)
@@ -374,9 +461,9 @@ class Tile(pygame.sprite.Sprite):
             pygame.draw.line(screen, BLACK, (pos.x, pos.y+24), (pos.right, pos.y+24), 2)
             pygame.draw.line(screen, BLACK, (pos.x+8, pos.y+24), (pos.x+8, pos.bottom), 2)
             pygame.draw.line(screen, BLACK, (pos.x+24, pos.y+24), (pos.x+24, pos.bottom), 2)
-        elif self.type == "block":
-            self.frame_timer = (pygame.time.get_ticks() // 200) % 3
-            main_color = BLOCK_GOLD if self.frame_timer != 1 else (255, 230, 200)
+        elif kind == "block":
+            frame = (pygame.time.get_ticks() // 200) % 3
+            main_color = BLOCK_GOLD if frame != 1 else (255, 230, 200)
             pygame.draw.rect(screen, main_color, pos)
             pygame.draw.rect(screen, BLACK, pos, 1)
             pygame.draw.rect(screen, BRICK_BROWN, (pos.x+2, pos.y+2, 4, 4))
@@ -389,30 +476,220 @@ class Tile(pygame.sprite.Sprite):
             pygame.draw.rect(screen, q_color, (pos.x+12, pos.y+14, 8, 4))
             pygame.draw.rect(screen, q_color, (pos.x+14, pos.y+18, 4, 4))
             pygame.draw.rect(screen, q_color, (pos.x+14, pos.y+24, 4, 4))
-        elif self.type == "pipe":
+        elif kind == "pipe":
             pygame.draw.rect(screen, PIPE_GREEN, pos)
             pygame.draw.rect(screen, PIPE_DARK, pos, 2)
             pygame.draw.line(screen, PIPE_LIGHT, (pos.x+6, pos.y), (pos.x+6, pos.bottom), 4)
             pygame.draw.line(screen, PIPE_LIGHT, (pos.x+18, pos.y), (pos.x+18, pos.bottom), 2)
             pygame.draw.line(screen, PIPE_DARK, (pos.x+24, pos.y), (pos.x+24, pos.bottom), 2)
-        elif self.type == "pipe_top":
+        elif kind == "pipe_top":
             pygame.draw.rect(screen, PIPE_GREEN, (pos.x-2, pos.y, 36, 32))
             pygame.draw.rect(screen, PIPE_DARK, (pos.x-2, pos.y, 36, 32), 2)
             pygame.draw.line(screen, PIPE_LIGHT, (pos.x+4, pos.y+2), (pos.x+4, pos.bottom-2), 4)
-        elif self.type == "flagpole":
+        elif kind == "flagpole":
             pygame.draw.rect(screen, (20, 180, 20), (pos.centerx-2, pos.y, 4, 32))
-        elif self.type == "flag_top":
+        elif kind == "flag_top":
             pygame.draw.circle(screen, (20, 180, 20), (pos.centerx, pos.bottom), 6)
-        elif self.type == "castle":
+        elif kind == "castle":
             pygame.draw.rect(screen, CASTLE_BRICK, pos)
             pygame.draw.rect(screen, BLACK, pos, 1)
             pygame.draw.line(screen, BLACK, (pos.x, pos.y+16), (pos.right, pos.y+16))
             pygame.draw.line(screen, BLACK, (pos.x+16, pos.y), (pos.x+16, pos.y+16))
             pygame.draw.line(screen, BLACK, (pos.x+16, pos.y+16), (pos.x+16, pos.bottom))
-        elif self.type == "castle_door":
+        elif kind == "castle_door":
             pygame.draw.rect(screen, BLACK, pos)
             pygame.draw.circle(screen, CASTLE_BRICK, (pos.centerx, pos.y), 16)
 
+class TileGrid:
+    """Uniform spatial hash of tiles, one bucket per TILE_SIZE cell.
+
+    query() returns candidates in insertion order so collision resolution
+    matches a plain walk over the tile list.
+    """
+    def __init__(self, tiles=()):
+        self.cells = {}
+        self.order = {}
+        for tile in tiles:
+            self.add(tile)
+
+    def _cells(self, rect):
+        for cx in range(rect.left // TILE_SIZE, (rect.right - 1) // TILE_SIZE + 1):
+            for cy in range(rect.top // TILE_SIZE, (rect.bottom - 1) // TILE_SIZE + 1):
+                yield cx, cy
+
+    def add(self, tile):
+        if tile in self.order: return
+        self.order[tile] = len(self.order)
+        for cell in self._cells(tile.rect):
+            self.cells.setdefault(cell, []).append(tile)
+
+    def query(self, rect):
+        found = []
+        for cell in self._cells(rect):
+            for tile in self.cells.get(cell, ()):
+                if tile not in found: found.append(tile)
+        if len(found) > 1: found.sort(key=self.order.__getitem__)
+        return found
+
+class FrameProfiler:
+    """Wall-clock milliseconds spent in each section of a frame.
+
+    lap(section) charges the time since the previous lap to that section and
+    end_frame() closes the frame. The last PROFILE_WINDOW frames feed the F3
+    overlay; while the F4 log is open every frame is also written as a CSV row.
+    """
+    def __init__(self):
+        self.overlay = False
+        self.log = None
+        self.log_error = None  # OSError from the last failed attempt to open the log
+        self.frame = 0
+        self.history = deque(maxlen=PROFILE_WINDOW)
+        self.current = dict.fromkeys(PROFILE_SECTIONS, 0.0)
+        self.mark = time.perf_counter()
+        self.font = None
+        self.panel = None
+        self.rows = []
+
+    def lap(self, section):
+        now = time.perf_counter()
+        self.current[section] += (now - self.mark) * 1000
+        self.mark = now
+
+    def end_frame(self):
+        if self.overlay or self.log:
+            times = [self.current[section] for section in PROFILE_SECTIONS]
+            self.history.append(times)
+            if self.log:
+                self.log.write(f"{self.frame}," + ",".join(f"{ms:.3f}" for ms in times) + f",{sum(times):.3f}\n")
+        self.frame += 1
+        self.current = dict.fromkeys(PROFILE_SECTIONS, 0.0)
+
+    def toggle_log(self, path=PROFILE_LOG_PATH):
+        """Start or stop the per-frame CSV log; returns whether it is now open.
+
+        A log that can't be opened leaves its OSError in log_error for the
+        caller and the overlay instead of raising out of the event loop.
+        """
+        self.log_error = None
+        if self.log:
+            self.log.close()
+            self.log = None
+        else:
+            try:
+                self.log = open(path, "w")
+            except OSError as error:
+                self.log_error = error
+                return False
+            self.log.write("frame," + ",".join(PROFILE_SECTIONS) + ",total\n")
+        return self.log is not None
+
+    def draw(self, screen):
+        """Rolling average and p99 per section, plus a graph of recent frame times."""
+        if not self.overlay or not self.history: return
+        if self.panel is None:
+            self.font = pygame.font.SysFont("monospace", 13)
+            self.panel = pygame.Surface((250, 16 * (len(PROFILE_SECTIONS) + 3) + 70))
+            self.panel.set_alpha(200)
+        panel = self.panel
+        panel.fill((0, 0, 0))
+        if self.frame % 10 == 0 or not self.rows:
+            # The statistics are re-rendered a few times a second, not every frame
+            count = len(self.history)
+            totals = sorted(map(sum, self.history))
+            rows = [f"{'ms':<10}{'avg':>7}{'p99':>7}"]
+            for section, times in zip(PROFILE_SECTIONS, zip(*self.history)):
+                ordered = sorted(times)
+                rows.append(f"{section:<10}{sum(ordered) / count:7.2f}{ordered[int(0.99 * (count - 1))]:7.2f}")
+            rows.append(f"{'frame':<10}{sum(totals) / count:7.2f}{totals[int(0.99 * (count - 1))]:7.2f}")
+            if self.log: rows.append("logging to " + os.path.basename(self.log.name))
+            elif self.log_error: rows.append("log failed: " + (self.log_error.strerror or str(self.log_error)))
+            self.rows = [self.font.render(row, True, (255, 255, 255)) for row in rows]
+        for i, row in enumerate(self.rows):
+            panel.blit(row, (6, 4 + 16 * i))
+        # One bar per frame; the yellow line is the 1/FPS budget at a third of the height
+        budget = 1000 / FPS
+        base = panel.get_height() - 6
+        for i, times in enumerate(self.history):
+            total = sum(times)
+            height = min(60, round(total * 20 / budget))
+            color = (0, 200, 0) if total <= budget * 1.05 else (220, 40, 40)
+            pygame.draw.line(panel, color, (6 + 2 * i, base), (6 + 2 * i, base - height))
+        pygame.draw.line(panel, (255, 255, 0), (6, base - 20), (6 + 2 * PROFILE_WINDOW, base - 20))
+        screen.blit(panel, (SCREEN_WIDTH - panel.get_width() - 10, 80))
+
+class TextCache:
+    """LRU cache of rendered text Surfaces keyed by (font, text, color)."""
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self.surfaces = OrderedDict()
+
+    def render(self, font, text, color):
+        key = (font, text, color)
+        surface = self.surfaces.get(key)
+        if surface is None:
+            surface = self.surfaces[key] = font.render(text, True, color)
+            if len(self.surfaces) > self.maxsize:
+                self.surfaces.popitem(last=False)
+        else:
+            self.surfaces.move_to_end(key)
+        return surface
+
+class RewindBuffer:
+    """The last REWIND_SECONDS of snapshot()s, taken before each step, for playing backward.
+
+    A full keyframe is kept every REWIND_KEYFRAME_EVERY frames, and whenever
+    the snapshot changes size; the frames in between are zlib-packed XOR
+    deltas against their keyframe. The oldest frames are dropped once there
+    are more than max_frames or they take more than max_bytes (plus the one
+    keyframe the oldest deltas may still hold on to).
+    """
+    def __init__(self, max_frames=REWIND_SECONDS * FPS, max_bytes=REWIND_MAX_BYTES):
+        self.max_frames = max_frames
+        self.max_bytes = max_bytes
+        self.frames = deque()  # (keyframe, delta or None for the keyframe itself)
+        self.bytes = 0
+        self.key = None
+        self.since_key = 0
+
+    def __len__(self):
+        return len(self.frames)
+
+    def clear(self):
+        self.frames.clear()
+        self.bytes = 0
+        self.key = None
+
+    def record(self, game):
+        state = game.snapshot()
+        key = self.key
+        if key is None or len(state) != len(key) or self.since_key >= REWIND_KEYFRAME_EVERY:
+            self.key = key = state
+            self.since_key = 0
+            self.frames.append((state, None))
+            self.bytes += len(state)
+        else:
+            delta = zlib.compress((int.from_bytes(state, "little") ^ int.from_bytes(key, "little")).to_bytes(len(state), "little"), 1)
+            self.frames.append((key, delta))
+            self.bytes += len(delta)
+        self.since_key += 1
+        while len(self.frames) > self.max_frames or self.bytes > self.max_bytes:
+            key, delta = self.frames.popleft()
+            self.bytes -= len(key) if delta is None else len(delta)
+
+    def step_back(self, game):
+        """Restore the newest recorded frame and drop it; False once there is nothing left."""
+        if not self.frames:
+            return False
+        key, delta = self.frames.pop()
+        self.bytes -= len(key) if delta is None else len(delta)
+        # The next frame recorded starts a fresh keyframe
+        self.key = None
+        if delta is None:
+            game.restore(key)
+        else:
+            game.restore((int.from_bytes(key, "little") ^ int.from_bytes(zlib.decompress(delta), "little")).to_bytes(len(key), "little"))
+        return True
+
 class Game:
     def __init__(self):
         pygame.init()
@@ -421,13 +698,20 @@ class Game:
         self.clock = pygame.time.Clock()
         self.font = pygame.font.SysFont("monospace", 24, bold=True)
         self.big_font = pygame.font.SysFont("monospace", 72, bold=True)
+        self.text = TextCache()
+        self.profiler = FrameProfiler()
         self.state = "MENU"
-        self.menu_timer = 0
+        self.shown = None  # what the menu last put on screen; None after any full-screen draw
+        self.set_turbo(1)
+        self.checkpoint = None  # F5 saves a snapshot() here, F9 restores it
+        self.rewind = RewindBuffer()
         self.reset()
 
     def reset(self):
-        self.tiles = pygame.sprite.Group()
+        self.rewind.clear()
+        self.tiles = []
         self.enemies = pygame.sprite.Group()
+        self.dormant_enemies = []
         self.scenery = pygame.sprite.Group()
         self.camera = Camera(SCREEN_WIDTH, SCREEN_HEIGHT)
         self.mario = Mario(100, SCREEN_HEIGHT - TILE_SIZE * 5)
@@ -446,26 +730,26 @@ class Game:
 
     def add_pipe(self, x, height):
         for h in range(height):
-            self.tiles.add(Tile(x * TILE_SIZE, SCREEN_HEIGHT - (2+h) * TILE_SIZE, "pipe"))
-        self.tiles.add(Tile(x * TILE_SIZE, SCREEN_HEIGHT - (2+height) * TILE_SIZE, "pipe_top"))
+            self.tiles.append(Tile(x * TILE_SIZE, SCREEN_HEIGHT - (2+h) * TILE_SIZE, "pipe"))
+        self.tiles.append(Tile(x * TILE_SIZE, SCREEN_HEIGHT - (2+height) * TILE_SIZE, "pipe_top"))
 
     def add_castle(self, x):
         for cx in range(5):
             for cy in range(2):
-                self.tiles.add(Tile((x + cx) * TILE_SIZE, SCREEN_HEIGHT - (2+cy)*TILE_SIZE, "castle"))
+                self.tiles.append(Tile((x + cx) * TILE_SIZE, SCREEN_HEIGHT - (2+cy)*TILE_SIZE, "castle"))
         for cx in range(1, 4):
             for cy in range(2, 4):
-                self.tiles.add(Tile((x + cx) * TILE_SIZE, SCREEN_HEIGHT - (2+cy)*TILE_SIZE, "castle"))
-        self.tiles.add(Tile((x + 2) * TILE_SIZE, SCREEN_HEIGHT - 6*TILE_SIZE, "castle"))
-        self.tiles.add(Tile((x + 2) * TILE_SIZE, SCREEN_HEIGHT - 3*TILE_SIZE, "castle_door"))
+                self.tiles.append(Tile((x + cx) * TILE_SIZE, SCREEN_HEIGHT - (2+cy)*TILE_SIZE, "castle"))
+        self.tiles.append(Tile((x + 2) * TILE_SIZE, SCREEN_HEIGHT - 6*TILE_SIZE, "castle"))
+        self.tiles.append(Tile((x + 2) * TILE_SIZE, SCREEN_HEIGHT - 3*TILE_SIZE, "castle_door"))
 
     def generate_level(self):
         map_width = 230
         pits = [69, 70, 86, 87, 88]
         for x in range(map_width):
             if x not in pits:
-                self.tiles.add(Tile(x * TILE_SIZE, SCREEN_HEIGHT - TILE_SIZE, "ground"))
-                self.tiles.add(Tile(x * TILE_SIZE, SCREEN_HEIGHT - TILE_SIZE * 2, "ground"))
+                self.tiles.append(Tile(x * TILE_SIZE, SCREEN_HEIGHT - TILE_SIZE, "ground"))
+                self.tiles.append(Tile(x * TILE_SIZE, SCREEN_HEIGHT - TILE_SIZE * 2, "ground"))
         for x in range(0, map_width, 16):
             self.scenery.add(Decoration((x + 0) * TILE_SIZE, 0, "hill", size=2))
             self.scenery.add(Decoration((x + 16) * TILE_SIZE, 0, "hill", size=1))
@@ -490,12 +774,12 @@ class Game:
             (123, 9, 'brick'), (128, 9, 'brick'), (129, 5, 'block'), (130, 5, 'block'), (131, 5, 'brick'),
         ]
         for s in structures:
-            self.tiles.add(Tile(s[0] * TILE_SIZE, SCREEN_HEIGHT - (2+s[1]) * TILE_SIZE, s[2]))
+            self.tiles.append(Tile(s[0] * TILE_SIZE, SCREEN_HEIGHT - (2+s[1]) * TILE_SIZE, s[2]))
         def build_stair(start_x, height, reverse=False):
             for i in range(height):
                 for h in range(i + 1):
                     x = start_x + (i if not reverse else (height - 1 - i))
-                    self.tiles.add(Tile(x * TILE_SIZE, SCREEN_HEIGHT - (3+h)*TILE_SIZE, "block"))
+                    self.tiles.append(Tile(x * TILE_SIZE, SCREEN_HEIGHT - (3+h)*TILE_SIZE, "block"))
         build_stair(134, 4)
         build_stair(140, 4, True)
         build_stair(148, 4)
@@ -503,41 +787,113 @@ class Game:
         build_stair(181, 8)
         flag_x = 198
         for i in range(1, 10):
-            self.tiles.add(Tile(flag_x * TILE_SIZE, SCREEN_HEIGHT - (2+i)*TILE_SIZE, "flagpole"))
-        self.tiles.add(Tile(flag_x * TILE_SIZE, SCREEN_HEIGHT - (2+10)*TILE_SIZE, "flag_top"))
-        self.tiles.add(Tile(flag_x * TILE_SIZE, SCREEN_HEIGHT - 3*TILE_SIZE, "block"))
+            self.tiles.append(Tile(flag_x * TILE_SIZE, SCREEN_HEIGHT - (2+i)*TILE_SIZE, "flagpole"))
+        self.tiles.append(Tile(flag_x * TILE_SIZE, SCREEN_HEIGHT - (2+10)*TILE_SIZE, "flag_top"))
+        self.tiles.append(Tile(flag_x * TILE_SIZE, SCREEN_HEIGHT - 3*TILE_SIZE, "block"))
         self.add_castle(202)
         goomba_locs = [22, 40, 50, 51, 80, 82, 97, 99, 114, 116, 124, 126, 128, 174, 176]
         for loc in goomba_locs:
-            self.enemies.add(Goomba(loc * TILE_SIZE, SCREEN_HEIGHT - TILE_SIZE * 5))
+            self.dormant_enemies.append(Goomba(loc * TILE_SIZE, SCREEN_HEIGHT - TILE_SIZE * 5))
+        self.dormant_enemies.sort(key=lambda enemy: enemy.rect.x, reverse=True)
+        self.tile_grid = TileGrid(self.tiles)
+        self.build_chunks()
+
+    def build_chunks(self):
+        # Scenery and static tiles never change, so they are rasterized into
+        # CHUNK_WIDTH columns the first time a column scrolls into view, with
+        # only the CHUNK_CACHE_SIZE most recent columns kept. Animated tiles
+        # are kept aside per chunk and drawn live.
+        self.chunks = OrderedDict()
+        self.chunk_items = {}
+        self.chunk_animated = {}
+        for decor in self.scenery:
+            self.bucket_chunk_item(decor, decor.rect.x, decor.rect.x + TILE_SIZE * (3 + decor.size))
+        for tile in self.tiles:
+            if TILE_ANIMATED[tile.kind]:
+                self.chunk_animated.setdefault(tile.rect.x // CHUNK_WIDTH, []).append(tile)
+            else:
+                # pipe tops overhang their tile by a couple of pixels
+                self.bucket_chunk_item(tile, tile.rect.x - 4, tile.rect.right + 4)
+
+    def bucket_chunk_item(self, item, left, right):
+        for i in range(max(0, left // CHUNK_WIDTH), max(0, right // CHUNK_WIDTH) + 1):
+            self.chunk_items.setdefault(i, []).append(item)
+
+    def chunk(self, i):
+        surface = self.chunks.get(i)
+        if surface is None:
+            surface = pygame.Surface((CHUNK_WIDTH, SCREEN_HEIGHT)).convert()
+            surface.fill(SKY_BLUE)
+            view = Camera(CHUNK_WIDTH, SCREEN_HEIGHT)
+            view.camera.x = -i * CHUNK_WIDTH
+            for item in self.chunk_items.get(i, ()):
+                item.draw(surface, view)
+            self.chunks[i] = surface
+            if len(self.chunks) > CHUNK_CACHE_SIZE:
+                self.chunks.popitem(last=False)
+        else:
+            self.chunks.move_to_end(i)
+        return surface
+
+    def update_enemy_window(self):
+        # Like the NES: enemies sleep until the camera nears them, then only
+        # the awake ones are simulated until they fall out or scroll away.
+        left = -self.camera.camera.x
+        spawn_edge = left + SCREEN_WIDTH + ENEMY_SPAWN_MARGIN
+        while self.dormant_enemies and self.dormant_enemies[-1].rect.left < spawn_edge:
+            self.enemies.add(self.dormant_enemies.pop())
+        for enemy in self.enemies:
+            if enemy.rect.right < left - ENEMY_DESPAWN_MARGIN or enemy.rect.top > SCREEN_HEIGHT:
+                enemy.kill()
+
+    def draw_level(self):
+        left = -self.camera.camera.x
+        first = max(0, left // CHUNK_WIDTH)
+        last = (left + SCREEN_WIDTH) // CHUNK_WIDTH
+        for i in range(first, last + 1):
+            self.screen.blit(self.chunk(i), (i * CHUNK_WIDTH - left, 0))
+        self.profiler.lap("scenery")
+        # A tile can straddle into the first visible chunk from the one before
+        for i in range(max(0, first - 1), last + 1):
+            for tile in self.chunk_animated.get(i, ()):
+                tile.draw(self.screen, self.camera)
 
     def draw_menu(self):
-        self.screen.fill(SKY_BLUE)
-        pygame.draw.rect(self.screen, GROUND_BROWN, (0, SCREEN_HEIGHT - 64, SCREEN_WIDTH, 64))
-        pygame.draw.line(self.screen, CREAM, (0, SCREEN_HEIGHT - 62), (SCREEN_WIDTH, SCREEN_HEIGHT - 62), 4)
-        ultra = self.big_font.render("ULTRA", True, MARIO_RED)
-        mario_t = self.big_font.render("MARIO", True, BLOCK_GOLD)
-        bros = self.font.render("2D BROS", True, WHITE)
-        self.screen.blit(ultra, (SCREEN_WIDTH//2 - ultra.get_width()//2 - 80, 80))
-        self.screen.blit(mario_t, (SCREEN_WIDTH//2 - mario_t.get_width()//2 + 90, 150))
-        self.screen.blit(bros, (SCREEN_WIDTH//2 - bros.get_width()//2, 230))
-        top = self.font.render("TOP-0042069", True, WHITE)
-        self.screen.blit(top, (SCREEN_WIDTH//2 - top.get_width()//2, 290))
-        self.menu_timer += 1
-        if (self.menu_timer // 25) % 2 == 0:
-            start_txt = self.font.render("PRESS START", True, (255, 255, 100))
+        """Draw the menu; returns the screen areas that changed since last time."""
+        blink_on = (pygame.time.get_ticks() // BLINK_MS) % 2 == 0
+        if self.shown == blink_on: return []
+        full = self.shown is None
+        self.shown = blink_on
+        start_area = pygame.Rect(0, 350, SCREEN_WIDTH, self.font.get_linesize())
+        if full:
+            self.screen.fill(SKY_BLUE)
+            pygame.draw.rect(self.screen, GROUND_BROWN, (0, SCREEN_HEIGHT - 64, SCREEN_WIDTH, 64))
+            pygame.draw.line(self.screen, CREAM, (0, SCREEN_HEIGHT - 62), (SCREEN_WIDTH, SCREEN_HEIGHT - 62), 4)
+            ultra = self.text.render(self.big_font, "ULTRA", MARIO_RED)
+            mario_t = self.text.render(self.big_font, "MARIO", BLOCK_GOLD)
+            bros = self.text.render(self.font, "2D BROS", WHITE)
+            self.screen.blit(ultra, (SCREEN_WIDTH//2 - ultra.get_width()//2 - 80, 80))
+            self.screen.blit(mario_t, (SCREEN_WIDTH//2 - mario_t.get_width()//2 + 90, 150))
+            self.screen.blit(bros, (SCREEN_WIDTH//2 - bros.get_width()//2, 230))
+            top = self.text.render(self.font, "TOP-0042069", WHITE)
+            self.screen.blit(top, (SCREEN_WIDTH//2 - top.get_width()//2, 290))
+            copy = self.text.render(self.font, "© 1999-2026 AC HOLDINGS CATSDK", CREAM)
+            self.screen.blit(copy, (SCREEN_WIDTH//2 - copy.get_width()//2, 420))
+        else:
+            self.screen.fill(SKY_BLUE, start_area)
+        if blink_on:
+            start_txt = self.text.render(self.font, "PRESS START", (255, 255, 100))
             self.screen.blit(start_txt, (SCREEN_WIDTH//2 - start_txt.get_width()//2, 350))
-        copy = self.font.render("© 1999-2026 AC HOLDINGS CATSDK", True, CREAM)
-        self.screen.blit(copy, (SCREEN_WIDTH//2 - copy.get_width()//2, 420))
+        return [self.screen.get_rect() if full else start_area]
 
     def draw_hud(self):
-        mario_lbl = self.font.render("MARIO", True, WHITE)
-        world_lbl = self.font.render("WORLD", True, WHITE)
-        time_lbl = self.font.render("TIME", True, WHITE)
-        score_val = self.font.render(f"{self.score:06d}", True, WHITE)
-        coin_val = self.font.render(f"x{self.coins:02d}", True, WHITE)
-        world_val = self.font.render(self.world, True, WHITE)
-        time_val = self.font.render(f"{self.time:03d}", True, WHITE)
+        mario_lbl = self.text.render(self.font, "MARIO", WHITE)
+        world_lbl = self.text.render(self.font, "WORLD", WHITE)
+        time_lbl = self.text.render(self.font, "TIME", WHITE)
+        score_val = self.text.render(self.font, f"{self.score:06d}", WHITE)
+        coin_val = self.text.render(self.font, f"x{self.coins:02d}", WHITE)
+        world_val = self.text.render(self.font, self.world, WHITE)
+        time_val = self.text.render(self.font, f"{self.time:03d}", WHITE)
         self.screen.blit(mario_lbl, (40, 20))
         self.screen.blit(score_val, (40, 45))
         self.screen.blit(coin_val, (300, 45))
@@ -545,73 +901,222 @@ class Game:
         self.screen.blit(world_val, (490, 45))
         self.screen.blit(time_lbl, (680, 20))
         self.screen.blit(time_val, (690, 45))
+        if self.turbo > 1:
+            turbo = self.text.render(self.font, f"TURBO x{self.turbo}  {self.sim_speed:5.1f}x", BLOCK_GOLD)
+            self.screen.blit(turbo, (40, 80))
+
+    def snapshot(self):
+        """Pack everything step() changes into bytes for restore(); the level itself is left out."""
+        m = self.mario
+        goombas = [*self.enemies, *self.dormant_enemies]
+        flags = self.flag_triggered * SNAPSHOT_FLAG_TRIGGERED | self.game_over * SNAPSHOT_GAME_OVER
+        mario_flags = (m.on_ground | m.facing_right << 1 | m.is_dead << 2 | m.visible << 3
+                       | isinstance(m.vel_x, float) << 4 | isinstance(m.vel_y, float) << 5)
+        parts = [SNAPSHOT_HEADER.pack(SNAPSHOT_VERSION, flags, self.camera.camera.x, self.score, self.coins,
+                                      self.time, self.time_ticker, len(self.enemies), len(self.dormant_enemies)),
+                 SNAPSHOT_MARIO.pack(m.rect.x, m.rect.y, m.vel_x, m.vel_y, MARIO_STATES.index(m.state),
+                                     mario_flags, m.walk_frame, m.frame_timer)]
+        parts += [SNAPSHOT_GOOMBA.pack(g.rect.x, g.rect.y, g.vel_x, g.vel_y, g.is_alive, g.frame, g.frame_timer, g.dead_timer)
+                  for g in goombas]
+        return b"".join(parts)
+
+    def restore(self, data):
+        """Put the level back into the state snapshot() packed into data."""
+        version, flags, camera_x, score, coins, time_left, time_ticker, awake, dormant = SNAPSHOT_HEADER.unpack_from(data)
+        if version != SNAPSHOT_VERSION:
+            raise ValueError(f"not a version {SNAPSHOT_VERSION} snapshot")
+        self.camera.camera.x = camera_x
+        self.score, self.coins, self.time, self.time_ticker = score, coins, time_left, time_ticker
+        self.flag_triggered = bool(flags & SNAPSHOT_FLAG_TRIGGERED)
+        self.game_over = bool(flags & SNAPSHOT_GAME_OVER)
+
+        m = self.mario
+        x, y, vel_x, vel_y, state, mario_flags, m.walk_frame, m.frame_timer = SNAPSHOT_MARIO.unpack_from(data, SNAPSHOT_HEADER.size)
+        m.rect.topleft = (x, y)
+        m.vel_x = vel_x if mario_flags >> 4 & 1 else int(vel_x)
+        m.vel_y = vel_y if mario_flags >> 5 & 1 else int(vel_y)
+        m.state = MARIO_STATES[state]
+        m.on_ground, m.facing_right, m.is_dead, m.visible = (bool(mario_flags >> bit & 1) for bit in range(4))
+
+        # Reuse the goombas already on hand, awake ones first, rather than building new sprites
+        spare = [*self.enemies, *self.dormant_enemies]
+        goombas = []
+        offset = SNAPSHOT_HEADER.size + SNAPSHOT_MARIO.size
+        records = SNAPSHOT_GOOMBA.iter_unpack(data[offset:offset + (awake + dormant) * SNAPSHOT_GOOMBA.size])
+        for i, (x, y, vel_x, vel_y, alive, frame, frame_timer, dead_timer) in enumerate(records):
+            g = spare[i] if i < len(spare) else Goomba(x, y)
+            g.rect.topleft = (x, y)
+            g.vel_x, g.vel_y, g.is_alive = vel_x, vel_y, bool(alive)
+            g.frame, g.frame_timer, g.dead_timer = frame, frame_timer, dead_timer
+            goombas.append(g)
+        if awake != len(self.enemies):
+            self.enemies = pygame.sprite.Group(goombas[:awake])
+        self.dormant_enemies = goombas[awake:]
+
+    def set_turbo(self, steps):
+        """Fast-forward: run steps simulation steps per 1/60 s tick (1 is normal speed)."""
+        self.turbo = max(1, steps)
+        self.sim_speed = 1.0
+        self.speed_steps = 0
+        self.speed_started = time.perf_counter()
+
+    def turbo_step(self, keys):
+        """One tick: self.turbo steps with the same keys, tracking achieved speed.
+
+        Holding BACKSPACE takes the steps backward through the rewind buffer instead.
+        """
+        for _ in range(self.turbo):
+            if keys[pygame.K_BACKSPACE]:
+                self.rewind.step_back(self)
+            else:
+                if not self.game_over: self.rewind.record(self)
+                self.step(keys)
+        self.speed_steps += self.turbo
+        elapsed = time.perf_counter() - self.speed_started
+        if elapsed >= 0.5:
+            self.sim_speed = self.speed_steps / elapsed / FPS
+            self.speed_steps = 0
+            self.speed_started += elapsed
+
+    def step(self, keys):
+        """Advance the PLAYING simulation one frame with the given key state."""
+        if self.game_over:
+            if self.mario.state == "VICTORY" and self.time > 0:
+                countdown_step = 5 if self.time >= 5 else self.time
+                self.time -= countdown_step
+                self.score += 50 * countdown_step
+            return
+        profiler = self.profiler
+        self.update_enemy_window()
+        profiler.lap("sim")
+        self.mario.update(self.tile_grid, self.enemies, self, keys)
+        profiler.lap("mario")
+        self.enemies.update(self.tile_grid)
+        profiler.lap("enemies")
+        self.camera.update(self.mario)
+        profiler.lap("camera")
+        if self.mario.state == "SLIDE" and not self.flag_triggered:
+            self.flag_triggered = True
+            self.enemies.empty()
+            self.dormant_enemies.clear()
+        if self.mario.state == "DEAD" and self.mario.rect.y > SCREEN_HEIGHT + 100:
+            self.game_over = True
+        if self.mario.state == "VICTORY":
+            self.game_over = True
+        if self.mario.state not in ["DEAD", "VICTORY"]:
+            self.time_ticker += 1
+            if self.time_ticker >= 60:
+                self.time -= 1
+                self.time_ticker = 0
+                if self.time <= 0:
+                    self.mario.die()
+
+    def draw(self):
+        profiler = self.profiler
+        self.screen.fill(SKY_BLUE)
+        self.draw_level()
+        profiler.lap("tiles")
+        for enemy in self.enemies:
+            enemy.draw(self.screen, self.camera)
+        self.mario.draw(self.screen, self.camera)
+        profiler.lap("entities")
+        self.draw_hud()
+        if self.game_over:
+            if self.mario.state == "VICTORY":
+                msg = "COURSE CLEAR!"
+                txt = self.text.render(self.font, msg, WHITE)
+                self.screen.blit(txt, (SCREEN_WIDTH//2 - txt.get_width()//2, SCREEN_HEIGHT//3))
+                if self.time <= 0:
+                    sub = self.text.render(self.font, "Press R to Play Again", WHITE)
+                    self.screen.blit(sub, (SCREEN_WIDTH//2 - sub.get_width()//2, SCREEN_HEIGHT//2))
+            else:
+                txt = self.text.render(self.font, "GAME OVER", WHITE)
+                sub = self.text.render(self.font, "Press R to Restart", WHITE)
+                self.screen.blit(txt, (SCREEN_WIDTH//2 - txt.get_width()//2, SCREEN_HEIGHT//3))
+                self.screen.blit(sub, (SCREEN_WIDTH//2 - sub.get_width()//2, SCREEN_HEIGHT//2))
+        profiler.lap("hud")
+
+    def motion_snapshot(self):
+        """Where everything that moves is, taken before each step for draw_interpolated()."""
+        return [(rect, rect.x, rect.y) for rect in (self.camera.camera, self.mario.rect, *(e.rect for e in self.enemies))]
+
+    def draw_interpolated(self, previous, alpha):
+        """draw() with movers placed alpha of the way from their previous to their current spot."""
+        current = [(rect, rect.x, rect.y) for rect, _, _ in previous]
+        for rect, x, y in previous:
+            rect.topleft = (round(x + (rect.x - x) * alpha), round(y + (rect.y - y) * alpha))
+        try:
+            self.draw()
+        finally:
+            for rect, x, y in current:
+                rect.topleft = (x, y)
 
     def run(self):
+        # Fixed FPS simulation: each drawn frame runs however many steps real time
+        # calls for (at most MAX_FRAME_SKIP), then draws between the last two.
+        lag = 0.0
+        previous = self.motion_snapshot()
+        fps = RENDER_FPS
+        profiler = self.profiler
         while True:
+            lag += min(self.clock.tick(fps) / 1000, FRAME_TIME * MAX_FRAME_SKIP)
+            profiler.lap("wait")
+            profiler.end_frame()
             for event in pygame.event.get():
                 if event.type == pygame.QUIT:
+                    if profiler.log: profiler.toggle_log()
                     pygame.quit()
                     sys.exit()
+                if event.type == pygame.WINDOWEXPOSED:
+                    self.shown = None
                 if event.type == pygame.KEYDOWN:
                     if self.state == "MENU":
                         if event.key in (pygame.K_SPACE, pygame.K_RETURN):
                             self.state = "PLAYING"
+                    if event.key == pygame.K_f:
+                        self.set_turbo(next((speed for speed in TURBO_SPEEDS if speed > self.turbo), 1))
                     if event.key == pygame.K_r and self.state != "MENU":
                         self.state = "PLAYING"
                         self.reset()
+                    if event.key == pygame.K_F5 and self.state == "PLAYING":
+                        self.checkpoint = self.snapshot()
+                        print(f"Checkpoint saved ({len(self.checkpoint)} bytes)")
+                    if event.key == pygame.K_F9 and self.state == "PLAYING" and self.checkpoint:
+                        self.restore(self.checkpoint)
+                    if event.key == pygame.K_F3:
+                        profiler.overlay = not profiler.overlay
+                    if event.key == pygame.K_F4:
+                        if profiler.toggle_log():
+                            print(f"Frame log writing to {PROFILE_LOG_PATH}")
+                        else:
+                            print(f"Frame log {'not opened: ' + str(profiler.log_error) if profiler.log_error else 'closed'}")
+            profiler.lap("input")
 
-            if self.state == "PLAYING":
-                if not self.game_over:
-                    self.mario.update(self.tiles, self.enemies, self)
-                    self.enemies.update(self.tiles)
-                    self.camera.update(self.mario)
-                    if self.mario.state == "SLIDE" and not self.flag_triggered:
-                        self.flag_triggered = True
-                        self.enemies.empty()
-                    if self.mario.state == "DEAD" and self.mario.rect.y > SCREEN_HEIGHT + 100:
-                        self.game_over = True
-                    if self.mario.state == "VICTORY":
-                        self.game_over = True
-                    if self.mario.state not in ["DEAD", "VICTORY"]:
-                        self.time_ticker += 1
-                        if self.time_ticker >= 60:
-                            self.time -= 1
-                            self.time_ticker = 0
-                            if self.time <= 0:
-                                self.mario.die()
+            if self.state != "PLAYING":
+                lag = 0.0
+            # Turbo already runs many steps per tick; don't pile skipped ticks on top
+            ticks = 0
+            while lag >= FRAME_TIME and ticks < (MAX_FRAME_SKIP if self.turbo == 1 else 1):
+                previous = self.motion_snapshot()
+                self.turbo_step(pygame.key.get_pressed())
+                lag -= FRAME_TIME
+                ticks += 1
+            if self.turbo > 1:
+                lag %= FRAME_TIME
+            profiler.lap("sim")
 
+            # The menu only changes when "PRESS START" blinks: update that strip, and idle
             if self.state == "MENU":
-                self.draw_menu()
+                pygame.display.update(self.draw_menu())
+                fps = IDLE_FPS
             else:
-                self.screen.fill(SKY_BLUE)
-                for decor in self.scenery:
-                    decor.draw(self.screen, self.camera)
-                for tile in self.tiles:
-                    tile.draw(self.screen, self.camera)
-                for enemy in self.enemies:
-                    enemy.draw(self.screen, self.camera)
-                self.mario.draw(self.screen, self.camera)
-                self.draw_hud()
-                if self.game_over:
-                    if self.mario.state == "VICTORY":
-                        msg = "COURSE CLEAR!"
-                        txt = self.font.render(msg, True, WHITE)
-                        self.screen.blit(txt, (SCREEN_WIDTH//2 - txt.get_width()//2, SCREEN_HEIGHT//3))
-                        if self.time > 0:
-                            countdown_step = 5 if self.time >= 5 else self.time
-                            self.time -= countdown_step
-                            self.score += 50 * countdown_step
-                        else:
-                            sub = self.font.render("Press R to Play Again", True, WHITE)
-                            self.screen.blit(sub, (SCREEN_WIDTH//2 - sub.get_width()//2, SCREEN_HEIGHT//2))
-                    else:
-                        txt = self.font.render("GAME OVER", True, WHITE)
-                        sub = self.font.render("Press R to Restart", True, WHITE)
-                        self.screen.blit(txt, (SCREEN_WIDTH//2 - txt.get_width()//2, SCREEN_HEIGHT//3))
-                        self.screen.blit(sub, (SCREEN_WIDTH//2 - sub.get_width()//2, SCREEN_HEIGHT//2))
-
-            pygame.display.flip()
-            self.clock.tick(FPS)
+                self.shown = None
+                self.draw_interpolated(previous, lag / FRAME_TIME)
+                profiler.draw(self.screen)
+                profiler.lap("profiler")
+                pygame.display.flip()
+                fps = RENDER_FPS
+            profiler.lap("flip")
 
 if __name__ == "__main__":
     game = Game()